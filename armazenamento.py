@@ -0,0 +1,1020 @@
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from configuracao import DATA_FILE, SQLITE_FILE, BACKEND, LIMITE_DIARIO, TEMPO_TRAVA
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+TIPOS_DOCUMENTO = ("orcamentos", "nfe", "comprovantes", "arquivos_adicionais")
+
+
+# Identificador persistente de projetos e despesas
+def novo_id():
+    return uuid.uuid4().hex
+
+
+# Atribui ids a um projeto (e às suas despesas) gravado antes da existência deles
+def garantir_ids_projeto(projeto):
+    alterado = False
+    if "id" not in projeto:
+        projeto["id"] = novo_id()
+        alterado = True
+    for despesa in projeto["despesas"]:
+        if "id" not in despesa:
+            despesa["id"] = novo_id()
+            alterado = True
+    return alterado
+
+
+def garantir_ids(dados):
+    alterado = False
+    for projeto in dados["projetos"]:
+        alterado = garantir_ids_projeto(projeto) or alterado
+    return alterado
+
+
+# Grava o conteúdo em um arquivo temporário e o renomeia sobre o destino,
+# de forma que uma queda no meio da escrita nunca deixe o arquivo pela metade
+def gravar_atomico(caminho, conteudo):
+    temporario = caminho + ".tmp"
+    with open(temporario, 'w') as f:
+        f.write(conteudo)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporario, caminho)
+    sincronizar_diretorio(caminho)
+
+
+# Identifica a versão de um arquivo no disco sem abri-lo
+def assinatura_arquivo(caminho):
+    try:
+        st = os.stat(caminho)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def sincronizar_diretorio(caminho):
+    # Garante que a renomeação também chegou ao disco (não suportado no Windows)
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(caminho)), os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+# Trava consultiva entre processos num arquivo <caminho>.lock ao lado dos
+# dados (flock no Unix, msvcrt.locking no Windows). É reentrante e também
+# serializa as threads do processo; a trava do arquivo é pega na entrada mais
+# externa e solta na saída dela. Espera até `espera` segundos por outra
+# instância e então lança TimeoutError.
+class TravaArquivo:
+    INTERVALO = 0.01
+
+    def __init__(self, caminho, espera=TEMPO_TRAVA):
+        self.caminho = caminho + ".lock"
+        self.espera = espera
+        self._trava = threading.RLock()
+        self._nivel = 0
+        self._arquivo = None
+
+    def _travar(self, arquivo):
+        limite = time.monotonic() + self.espera
+        while True:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(arquivo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:
+                    msvcrt.locking(arquivo.fileno(), msvcrt.LK_NBLCK, 1)
+                return
+            except OSError:
+                if time.monotonic() >= limite:
+                    raise TimeoutError(f"{self.caminho}: dados em uso por outra instância há mais de "
+                                       f"{self.espera:.0f} s") from None
+                time.sleep(self.INTERVALO)
+
+    def __enter__(self):
+        self._trava.acquire()
+        if self._nivel == 0:
+            try:
+                arquivo = open(self.caminho, "a+b")
+                try:
+                    arquivo.seek(0)
+                    self._travar(arquivo)
+                except BaseException:
+                    arquivo.close()
+                    raise
+            except BaseException:
+                self._trava.release()
+                raise
+            self._arquivo = arquivo
+        self._nivel += 1
+        return self
+
+    def __exit__(self, *_):
+        self._nivel -= 1
+        if self._nivel == 0:
+            if fcntl is not None:
+                fcntl.flock(self._arquivo.fileno(), fcntl.LOCK_UN)
+            else:
+                self._arquivo.seek(0)
+                msvcrt.locking(self._arquivo.fileno(), msvcrt.LK_UNLCK, 1)
+            self._arquivo.close()
+            self._arquivo = None
+        self._trava.release()
+
+
+def id_do_registro(registro):
+    if "projeto" in registro:
+        return registro["projeto"].get("id")
+    return registro.get("id")
+
+
+# Projetos afetados por um registro (vários em "gravar_projetos")
+def ids_do_registro(registro):
+    if "projetos" in registro:
+        return [p.get("id") for p in registro["projetos"]]
+    return [id_do_registro(registro)]
+
+
+# Aplica uma alteração (registro) sobre os projetos indexados por id
+def aplicar_operacao(projetos, registro):
+    op = registro["op"]
+    if op == "inserir_projeto":
+        projeto = registro["projeto"]
+        garantir_ids_projeto(projeto)
+        projetos[projeto["id"]] = projeto
+        return
+    if op == "gravar_projetos":
+        # Inclui ou substitui vários projetos inteiros de uma vez (importação em lote)
+        for projeto in registro["projetos"]:
+            garantir_ids_projeto(projeto)
+            projetos[projeto["id"]] = projeto
+        return
+    if "id" not in registro:
+        # Registros gravados antes dos ids identificam o projeto pelo nome
+        registro["id"] = next((p["id"] for p in projetos.values() if p["nome"] == registro["nome"]), None)
+    projeto = projetos.get(registro["id"])
+    if projeto is None:
+        return
+    if op == "remover_projeto":
+        del projetos[registro["id"]]
+    elif op == "atualizar_projeto":
+        projeto.update(registro["campos"])
+    elif op == "adicionar_despesa":
+        projeto["despesas"].append(registro["despesa"])
+    elif op == "adicionar_despesas":
+        for despesa in registro["despesas"]:
+            projeto["despesas"].append(despesa)
+        for tipo, referencias in registro.get("documentos", {}).items():
+            projeto[tipo].extend(referencias)
+    elif op == "adicionar_documento":
+        projeto[registro["tipo"]].append(registro["arquivo"])
+    elif op == "remover_documento":
+        if registro["arquivo"] in projeto[registro["tipo"]]:
+            projeto[registro["tipo"]].remove(registro["arquivo"])
+    else:
+        raise ValueError(f"Operação desconhecida: {op}")
+
+
+# Concorrência otimista entre instâncias. Os dados têm um contador de versão,
+# incrementado a cada lote gravado, e cada projeto guarda a versão em que foi
+# alterado pela última vez. Um lote é conferido contra o estado do disco,
+# com a trava do armazenamento, antes de ser gravado: alterações de outras
+# instâncias em outros projetos ou em outros campos são mantidas (os
+# registros são deltas, aplicados sobre o que está no disco), e só o que
+# sobrescreveria uma alteração alheia é recusado e devolvido como conflito:
+#   - atualizar_projeto com "esperado" ({campo: valor lido}): campos cujo
+#     valor no disco não é mais o lido nem o novo;
+#   - gravar_projetos com "versoes" ({id: versão lida}): projetos alterados
+#     depois da versão lida;
+#   - qualquer alteração em projeto removido por outra instância.
+# Cada conflito é {"id", "op", "motivo": "alterado" ou "removido", "campos"}.
+class ConflitoConcorrencia(Exception):
+    def __init__(self, conflitos):
+        self.conflitos = conflitos
+        super().__init__(descrever_conflitos(conflitos))
+
+
+def descrever_conflitos(conflitos):
+    partes = []
+    for conflito in conflitos:
+        if conflito["motivo"] == "removido":
+            partes.append(f"projeto {conflito['id'][:8]} foi removido por outra instância")
+        elif conflito.get("campos"):
+            partes.append(f"projeto {conflito['id'][:8]}: {', '.join(conflito['campos'])} "
+                          f"alterado(s) por outra instância")
+        else:
+            partes.append(f"projeto {conflito['id'][:8]} foi alterado por outra instância")
+    return f"{len(conflitos)} alteração(ões) não gravada(s): " + "; ".join(partes)
+
+
+# Confere um registro contra o estado atual. obter(id) devolve (projeto,
+# versão) atuais, com projeto None se não existe (o projeto só precisa de
+# .get(campo)). Devolve o registro a gravar, sem os campos de conferência
+# (None se nada sobrou), e a lista de conflitos.
+def verificar_registro(registro, obter):
+    op = registro["op"]
+    if op == "inserir_projeto" or (op != "gravar_projetos" and "id" not in registro):
+        return registro, []
+    if op == "gravar_projetos":
+        esperadas = registro.get("versoes", {})
+        projetos = []
+        conflitos = []
+        for projeto in registro["projetos"]:
+            if projeto.get("id") in esperadas:
+                atual, versao = obter(projeto["id"])
+                if atual is None or versao != esperadas[projeto["id"]]:
+                    conflitos.append({"id": projeto["id"], "op": op,
+                                      "motivo": "removido" if atual is None else "alterado"})
+                    continue
+            projetos.append(projeto)
+        return ({"op": op, "projetos": projetos} if projetos else None), conflitos
+    atual, _ = obter(registro["id"])
+    if atual is None:
+        if op == "remover_projeto":
+            return None, []
+        return None, [{"id": registro["id"], "op": op, "motivo": "removido"}]
+    if op == "atualizar_projeto" and "esperado" in registro:
+        campos = {}
+        alterados = []
+        for campo, valor in registro["campos"].items():
+            if campo in registro["esperado"] and atual.get(campo) not in (registro["esperado"][campo], valor):
+                alterados.append(campo)
+            else:
+                campos[campo] = valor
+        conflitos = [{"id": registro["id"], "op": op, "motivo": "alterado", "campos": alterados}] if alterados else []
+        return ({"op": op, "id": registro["id"], "campos": campos} if campos else None), conflitos
+    return registro, []
+
+
+# Confere e aplica os registros sobre os projetos indexados por id (ver
+# aplicar_operacao), marcando em `versoes` a versão dos projetos alterados.
+# `versao` é a versão de todo o lote ou uma função que dá a de cada registro.
+# Devolve os registros aplicados e os conflitos.
+def aplicar_verificado(projetos, versoes, registros, versao):
+    aplicados = []
+    conflitos = []
+    # Versões de antes do lote: as alterações anteriores do próprio lote não
+    # contam como alteração alheia
+    anteriores = {}
+
+    def obter(projeto_id):
+        return projetos.get(projeto_id), anteriores.get(projeto_id, versoes.get(projeto_id))
+
+    for registro in registros:
+        registro, encontrados = verificar_registro(registro, obter)
+        conflitos.extend(encontrados)
+        if registro is None:
+            continue
+        aplicar_operacao(projetos, registro)
+        for projeto_id in ids_do_registro(registro):
+            if projeto_id not in anteriores:
+                anteriores[projeto_id] = versoes.get(projeto_id)
+        marcar_versoes(projetos, versoes, registro, versao() if callable(versao) else versao)
+        aplicados.append(registro)
+    return aplicados, conflitos
+
+
+def marcar_versoes(projetos, versoes, registro, versao):
+    for projeto_id in ids_do_registro(registro):
+        if projeto_id in projetos:
+            versoes[projeto_id] = versao
+        else:
+            versoes.pop(projeto_id, None)
+
+
+class Armazenamento:
+    # Operações de alteração comuns a todos os backends; cada uma gera um
+    # registro pequeno que o backend aplica com self.aplicar(registro)
+    def inserir_projeto(self, projeto):
+        self.aplicar({"op": "inserir_projeto", "projeto": projeto})
+
+    def atualizar_projeto(self, projeto_id, campos):
+        self.aplicar({"op": "atualizar_projeto", "id": projeto_id, "campos": campos})
+
+    def remover_projeto(self, projeto_id):
+        self.aplicar({"op": "remover_projeto", "id": projeto_id})
+
+    # Grava vários projetos completos (novos ou substituindo os de mesmo id)
+    # numa única alteração
+    def gravar_projetos(self, projetos):
+        self.aplicar({"op": "gravar_projetos", "projetos": projetos})
+
+    def adicionar_despesa(self, projeto_id, despesa):
+        self.aplicar({"op": "adicionar_despesa", "id": projeto_id, "despesa": despesa})
+
+    # Várias despesas e, opcionalmente, os documentos de onde vieram ({tipo: [referências]})
+    def adicionar_despesas(self, projeto_id, despesas, documentos=None):
+        registro = {"op": "adicionar_despesas", "id": projeto_id, "despesas": despesas}
+        if documentos:
+            registro["documentos"] = documentos
+        self.aplicar(registro)
+
+    def adicionar_documento(self, projeto_id, tipo, arquivo):
+        self.aplicar({"op": "adicionar_documento", "id": projeto_id, "tipo": tipo, "arquivo": arquivo})
+
+    def remover_documento(self, projeto_id, tipo, arquivo):
+        self.aplicar({"op": "remover_documento", "id": projeto_id, "tipo": tipo, "arquivo": arquivo})
+
+    # Vários registros numa única gravação; os backends conferem e gravam o
+    # lote de uma vez (uma reescrita, um fsync ou uma transação) e devolvem
+    # {"versao_anterior", "versao", "conflitos"}: a versão dos dados antes e
+    # depois do lote e as alterações recusadas (ver ConflitoConcorrencia)
+    def aplicar(self, registro):
+        return self.aplicar_lote([registro])
+
+    def aplicar_lote(self, registros):
+        raise NotImplementedError
+
+    # Projetos que mudaram desde as versões que quem chama conhece ({id:
+    # versão}): {"versao", "versoes", "projetos": [novos ou alterados],
+    # "removidos": [ids]}. Os backends que conseguem evitar carregar tudo a
+    # sobrescrevem.
+    def alteracoes(self, versoes):
+        dados = self.carregar()
+        atuais = dados.get("versoes", {})
+        ids = {p["id"] for p in dados["projetos"]}
+        return {
+            "versao": dados.get("versao", 0),
+            "versoes": atuais,
+            "projetos": [p for p in dados["projetos"] if p["id"] not in versoes or
+                         atuais.get(p["id"]) != versoes[p["id"]]],
+            "removidos": [projeto_id for projeto_id in versoes if projeto_id not in ids],
+        }
+
+    # Leituras pontuais; os backends que conseguem evitar carregar tudo as sobrescrevem
+    def listar_resumos(self):
+        return [
+            {
+                "id": p["id"],
+                "nome": p["nome"],
+                "responsavel": p["responsavel"],
+                "valor_financiamento": p["valor_financiamento"]
+            }
+            for p in self.carregar()["projetos"]
+        ]
+
+    def obter_projeto(self, projeto_id):
+        for p in self.carregar()["projetos"]:
+            if p["id"] == projeto_id:
+                return p
+        return None
+
+    # Arquivos que mudam quando outra instância grava (para observar com
+    # QFileSystemWatcher)
+    def arquivos_observados(self):
+        return []
+
+    def fechar(self):
+        pass
+
+
+class ArmazenamentoJSON(Armazenamento):
+    # Lê e reescreve o projetos.json inteiro a cada alteração. As gravações
+    # (conferência, aplicação e reescrita) são feitas com a trava do arquivo;
+    # as leituras não precisam dela, pois o arquivo é sempre trocado inteiro.
+    # "versao" e "versoes" ({id: versão}) ficam no próprio documento.
+    def __init__(self, caminho=DATA_FILE):
+        self.caminho = caminho
+        self._trava = TravaArquivo(caminho)
+
+    # Muda sempre que os dados no disco mudam (por esta ou por outra instância)
+    def assinatura(self):
+        return assinatura_arquivo(self.caminho)
+
+    def arquivos_observados(self):
+        return [self.caminho]
+
+    def carregar(self):
+        if not os.path.exists(self.caminho):
+            # Cria um arquivo vazio com a estrutura padrão
+            with open(self.caminho, 'w') as f:
+                json.dump({"projetos": []}, f)
+            return {"projetos": []}
+        with open(self.caminho, 'r') as f:
+            content = f.read()
+            if not content.strip():
+                return {"projetos": []}
+            dados = json.loads(content)
+        # Dados gravados antes dos ids: persiste os ids atribuídos agora
+        if garantir_ids(dados):
+            ArmazenamentoJSON.salvar(self, dados)
+        return dados
+
+    # Substitui todos os dados: uma nova versão, com todos os projetos nela
+    def salvar(self, dados):
+        with self._trava:
+            versao = self._versao_no_disco() + 1
+            dados = dict(dados, versao=versao, versoes={p["id"]: versao for p in dados["projetos"]})
+            gravar_atomico(self.caminho, json.dumps(dados, indent=4))
+
+    def _versao_no_disco(self):
+        try:
+            with open(self.caminho, 'r') as f:
+                return json.load(f).get("versao", 0)
+        except (OSError, ValueError):
+            return 0
+
+    def aplicar_lote(self, registros):
+        with self._trava:
+            dados = self.carregar()
+            versao_anterior = dados.get("versao", 0)
+            versoes = dados.setdefault("versoes", {})
+            projetos = {p["id"]: p for p in dados["projetos"]}
+            aplicados, conflitos = aplicar_verificado(projetos, versoes, registros, versao_anterior + 1)
+            if aplicados:
+                dados["projetos"] = list(projetos.values())
+                dados["versao"] = versao_anterior + 1
+                gravar_atomico(self.caminho, json.dumps(dados, indent=4))
+            return {"versao_anterior": versao_anterior, "versao": dados.get("versao", 0), "conflitos": conflitos}
+
+
+class ArmazenamentoDiario(ArmazenamentoJSON):
+    # Mantém os dados em memória e acrescenta cada alteração como uma linha JSON
+    # no diário (projetos.json.diario). O projetos.json continua sendo o snapshot
+    # inicial; ao passar de `limite` bytes o diário é incorporado a um novo
+    # snapshot em segundo plano. A chave "seq_diario" do snapshot indica o último
+    # registro já incorporado, então uma queda entre a troca do snapshot e a
+    # limpeza do diário não aplica registros duas vezes. A sequência é a versão
+    # dos dados, e a de cada projeto é a do último registro que o alterou.
+    #
+    # A trava do arquivo (compartilhada com as outras instâncias) protege toda
+    # leitura ou escrita do diário: antes de gravar, uma instância que ficou
+    # para trás relê o disco e confere o lote contra o estado atualizado.
+    def __init__(self, caminho=DATA_FILE, limite=LIMITE_DIARIO):
+        super().__init__(caminho)
+        self.caminho_diario = caminho + ".diario"
+        self.limite = limite
+        self._compactacao = None
+        self._arquivo = None
+        with self._trava:
+            self._abrir()
+
+    def assinatura(self):
+        return (assinatura_arquivo(self.caminho), assinatura_arquivo(self.caminho_diario))
+
+    def arquivos_observados(self):
+        return [self.caminho, self.caminho_diario]
+
+    def _abrir(self):
+        if self._arquivo is not None:
+            self._arquivo.close()
+        dados = super().carregar()
+        self._seq = dados.pop("seq_diario", 0)
+        dados.pop("versao", None)
+        self._versoes = dados.pop("versoes", {})
+        # Projetos indexados por id; o restante do documento fica em self._dados
+        self._projetos = {p["id"]: p for p in dados.pop("projetos")}
+        self._dados = dados
+        valido = 0
+        legado = False
+        if os.path.exists(self.caminho_diario):
+            with open(self.caminho_diario, 'rb') as f:
+                for linha in f:
+                    # Uma linha sem quebra final é uma escrita interrompida
+                    if not linha.endswith(b"\n"):
+                        break
+                    try:
+                        registro = json.loads(linha)
+                    except ValueError:
+                        break
+                    valido += len(linha)
+                    if registro["seq"] <= self._seq:
+                        continue
+                    legado = legado or id_do_registro(registro) is None
+                    aplicar_operacao(self._projetos, registro)
+                    self._seq = registro["seq"]
+                    marcar_versoes(self._projetos, self._versoes, registro, self._seq)
+        self._arquivo = open(self.caminho_diario, 'a')
+        # Descarta o final corrompido para que as próximas linhas fiquem íntegras
+        self._arquivo.truncate(valido)
+        self._arquivo.seek(valido)
+        # Registros antigos (sem ids) geram ids na reaplicação: fixa-os no snapshot
+        if any([garantir_ids_projeto(p) for p in self._projetos.values()]) or legado:
+            self._gravar_snapshot()
+            self._arquivo.truncate(0)
+            self._arquivo.seek(0)
+        self._assinatura_propria = self.assinatura()
+
+    # Outra instância alterou os arquivos: refaz o estado a partir do disco
+    def _sincronizar(self):
+        if self.assinatura() != self._assinatura_propria:
+            self._abrir()
+
+    def _documento(self):
+        return dict(self._dados, projetos=list(self._projetos.values()))
+
+    def carregar(self):
+        with self._trava:
+            self._sincronizar()
+            return json.loads(json.dumps(dict(self._documento(), versao=self._seq, versoes=self._versoes)))
+
+    # Copia só os projetos alterados
+    def alteracoes(self, versoes):
+        with self._trava:
+            self._sincronizar()
+            return json.loads(json.dumps({
+                "versao": self._seq,
+                "versoes": self._versoes,
+                "projetos": [p for i, p in self._projetos.items() if i not in versoes or
+                             self._versoes.get(i) != versoes[i]],
+                "removidos": [i for i in versoes if i not in self._projetos],
+            }))
+
+    def listar_resumos(self):
+        with self._trava:
+            return [
+                {
+                    "id": p["id"],
+                    "nome": p["nome"],
+                    "responsavel": p["responsavel"],
+                    "valor_financiamento": p["valor_financiamento"]
+                }
+                for p in self._projetos.values()
+            ]
+
+    def obter_projeto(self, projeto_id):
+        with self._trava:
+            projeto = self._projetos.get(projeto_id)
+            return json.loads(json.dumps(projeto)) if projeto is not None else None
+
+    def salvar(self, dados):
+        with self._trava:
+            dados = json.loads(json.dumps(dados))
+            garantir_ids(dados)
+            dados.pop("versao", None)
+            dados.pop("versoes", None)
+            self._sincronizar()
+            self._seq += 1
+            self._projetos = {p["id"]: p for p in dados.pop("projetos")}
+            self._versoes = dict.fromkeys(self._projetos, self._seq)
+            self._dados = dados
+            self._gravar_snapshot()
+            self._arquivo.truncate(0)
+            self._arquivo.seek(0)
+            self._assinatura_propria = self.assinatura()
+
+    # Todas as linhas do lote são escritas com um único fsync
+    def aplicar_lote(self, registros):
+        with self._trava:
+            self._sincronizar()
+            versao_anterior = self._seq
+            # Aplica uma cópia para não compartilhar objetos com quem chamou
+            registros = json.loads(json.dumps(registros))
+            try:
+                # Cada registro aplicado recebe a próxima sequência
+                sequencias = itertools.count(self._seq + 1)
+                aplicados, conflitos = aplicar_verificado(self._projetos, self._versoes, registros,
+                                                          lambda: next(sequencias))
+                linhas = []
+                for registro in aplicados:
+                    self._seq += 1
+                    linhas.append(json.dumps(dict(registro, seq=self._seq)))
+                if linhas:
+                    self._arquivo.write("".join(linha + "\n" for linha in linhas))
+                    self._arquivo.flush()
+                    os.fsync(self._arquivo.fileno())
+            except BaseException:
+                # A memória ficou à frente do disco: volta ao que está gravado
+                self._abrir()
+                raise
+            tamanho = self._arquivo.tell()
+            self._assinatura_propria = self.assinatura()
+        if tamanho > self.limite:
+            self.compactar_em_segundo_plano()
+        return {"versao_anterior": versao_anterior, "versao": self._seq, "conflitos": conflitos}
+
+    def _texto_snapshot(self):
+        return json.dumps(dict(self._documento(), seq_diario=self._seq, versoes=self._versoes), indent=4)
+
+    def _gravar_snapshot(self):
+        gravar_atomico(self.caminho, self._texto_snapshot())
+
+    # Com a trava: nenhuma instância acrescenta linhas enquanto o snapshot é
+    # gravado, e o diário é esvaziado logo depois
+    def compactar(self):
+        with self._trava:
+            self._sincronizar()
+            self._gravar_snapshot()
+            self._arquivo.truncate(0)
+            self._arquivo.seek(0)
+            self._assinatura_propria = self.assinatura()
+
+    def compactar_em_segundo_plano(self):
+        with self._trava:
+            if self._compactacao is not None and self._compactacao.is_alive():
+                return
+            self._compactacao = threading.Thread(target=self.compactar, daemon=True)
+            self._compactacao.start()
+
+    def fechar(self):
+        if self._compactacao is not None:
+            self._compactacao.join()
+        with self._trava:
+            pendente = self._arquivo.tell() > 0
+            if pendente:
+                self.compactar()
+            self._arquivo.close()
+
+
+ESQUEMA_SQLITE = """
+CREATE TABLE IF NOT EXISTS projetos (
+    id INTEGER PRIMARY KEY,
+    uid TEXT,
+    nome TEXT NOT NULL,
+    responsavel TEXT NOT NULL,
+    valor_financiamento REAL NOT NULL,
+    data_cadastro TEXT NOT NULL,
+    versao INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_projetos_nome ON projetos (nome);
+CREATE INDEX IF NOT EXISTS idx_projetos_responsavel ON projetos (responsavel);
+CREATE INDEX IF NOT EXISTS idx_projetos_data_cadastro ON projetos (data_cadastro);
+
+CREATE TABLE IF NOT EXISTS despesas (
+    id INTEGER PRIMARY KEY,
+    uid TEXT,
+    projeto_id INTEGER NOT NULL REFERENCES projetos (id) ON DELETE CASCADE,
+    nome TEXT NOT NULL,
+    descricao TEXT NOT NULL,
+    valor REAL NOT NULL,
+    nfe TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_despesas_projeto ON despesas (projeto_id);
+
+CREATE TABLE IF NOT EXISTS documentos (
+    id INTEGER PRIMARY KEY,
+    projeto_id INTEGER NOT NULL REFERENCES projetos (id) ON DELETE CASCADE,
+    tipo TEXT NOT NULL,
+    arquivo TEXT NOT NULL,
+    sha256 TEXT,
+    tamanho INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_documentos_projeto ON documentos (projeto_id, tipo);
+
+CREATE TABLE IF NOT EXISTS controle (
+    chave TEXT PRIMARY KEY,
+    valor INTEGER NOT NULL
+);
+"""
+
+# Criados depois de acrescentar as colunas novas (uid, sha256) em bancos antigos
+INDICES_UID_SQLITE = """
+CREATE UNIQUE INDEX IF NOT EXISTS idx_projetos_uid ON projetos (uid);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_despesas_uid ON despesas (uid);
+CREATE INDEX IF NOT EXISTS idx_despesas_nfe ON despesas (nfe);
+CREATE INDEX IF NOT EXISTS idx_documentos_sha256 ON documentos (sha256);
+"""
+
+CAMPOS_PROJETO = ("nome", "responsavel", "valor_financiamento", "data_cadastro")
+
+
+# Referências ao armazém de documentos ({"nome", "sha256", "tamanho"}) ocupam
+# as três colunas; referências antigas (só o nome do arquivo) deixam sha256 nulo
+def colunas_documento(referencia):
+    if isinstance(referencia, dict):
+        return referencia["nome"], referencia["sha256"], referencia["tamanho"]
+    return referencia, None, None
+
+
+def referencia_documento(linha):
+    if linha["sha256"] is None:
+        return linha["arquivo"]
+    return {"nome": linha["arquivo"], "sha256": linha["sha256"], "tamanho": linha["tamanho"]}
+
+
+class ArmazenamentoSQLite(Armazenamento):
+    # Guarda projetos, despesas e referências a documentos em tabelas separadas,
+    # de forma que cada alteração toque apenas as linhas envolvidas. O id
+    # persistente dos projetos e despesas fica na coluna uid. A versão dos
+    # dados fica na tabela controle e a de cada projeto na coluna versao; os
+    # lotes são conferidos dentro de uma transação BEGIN IMMEDIATE, que já
+    # reserva a escrita no banco para esta instância.
+    def __init__(self, caminho=SQLITE_FILE, origem_json=DATA_FILE):
+        novo = not os.path.exists(caminho)
+        self.caminho = caminho
+        self._trava = threading.RLock()
+        self._conexao = sqlite3.connect(caminho, check_same_thread=False)
+        self._conexao.row_factory = sqlite3.Row
+        self._conexao.execute("PRAGMA foreign_keys = ON")
+        self._conexao.execute("PRAGMA journal_mode = WAL")
+        self._conexao.executescript(ESQUEMA_SQLITE)
+        self._migrar_esquema()
+        if novo and origem_json and os.path.exists(origem_json):
+            migrar_json_para_sqlite(origem_json, self)
+
+    def _migrar_esquema(self):
+        # Bancos criados antes dos ids persistentes não têm a coluna uid,
+        # e os anteriores ao armazém de documentos não têm sha256/tamanho
+        with self._conexao:
+            colunas = {linha["name"] for linha in self._conexao.execute("PRAGMA table_info(projetos)")}
+            if "versao" not in colunas:
+                self._conexao.execute("ALTER TABLE projetos ADD COLUMN versao INTEGER NOT NULL DEFAULT 0")
+            colunas = {linha["name"] for linha in self._conexao.execute("PRAGMA table_info(documentos)")}
+            if "sha256" not in colunas:
+                self._conexao.execute("ALTER TABLE documentos ADD COLUMN sha256 TEXT")
+                self._conexao.execute("ALTER TABLE documentos ADD COLUMN tamanho INTEGER")
+            for tabela in ("projetos", "despesas"):
+                colunas = {linha["name"] for linha in self._conexao.execute(f"PRAGMA table_info({tabela})")}
+                if "uid" not in colunas:
+                    self._conexao.execute(f"ALTER TABLE {tabela} ADD COLUMN uid TEXT")
+                sem_uid = self._conexao.execute(f"SELECT id FROM {tabela} WHERE uid IS NULL").fetchall()
+                self._conexao.executemany(
+                    f"UPDATE {tabela} SET uid = ? WHERE id = ?", [(novo_id(), linha["id"]) for linha in sem_uid]
+                )
+        self._conexao.executescript(INDICES_UID_SQLITE)
+
+    def assinatura(self):
+        # data_version só muda quando outra conexão grava no banco
+        with self._trava:
+            return self._conexao.execute("PRAGMA data_version").fetchone()[0]
+
+    # Em modo WAL as gravações vão primeiro para o -wal
+    def arquivos_observados(self):
+        return [self.caminho, self.caminho + "-wal"]
+
+    def _inserir_despesas(self, projeto_id, despesas):
+        self._conexao.executemany(
+            "INSERT INTO despesas (uid, projeto_id, nome, descricao, valor, nfe) VALUES (?, ?, ?, ?, ?, ?)",
+            [(d["id"], projeto_id, d["nome"], d["descricao"], d["valor"], d["nfe"]) for d in despesas]
+        )
+
+    def _inserir_documentos(self, projeto_id, tipo, referencias):
+        self._conexao.executemany(
+            "INSERT INTO documentos (projeto_id, tipo, arquivo, sha256, tamanho) VALUES (?, ?, ?, ?, ?)",
+            [(projeto_id, tipo) + colunas_documento(referencia) for referencia in referencias]
+        )
+
+    def _inserir(self, projeto):
+        garantir_ids_projeto(projeto)
+        cursor = self._conexao.execute(
+            "INSERT INTO projetos (uid, nome, responsavel, valor_financiamento, data_cadastro) VALUES (?, ?, ?, ?, ?)",
+            [projeto["id"]] + [projeto[campo] for campo in CAMPOS_PROJETO]
+        )
+        projeto_id = cursor.lastrowid
+        self._inserir_despesas(projeto_id, projeto["despesas"])
+        for tipo in TIPOS_DOCUMENTO:
+            self._inserir_documentos(projeto_id, tipo, projeto.get(tipo, []))
+
+    def _linha(self, uid):
+        linha = self._conexao.execute("SELECT id FROM projetos WHERE uid = ?", (uid,)).fetchone()
+        return linha["id"] if linha is not None else None
+
+    def _montar(self, linhas):
+        # Reconstrói os dicionários no formato do projetos.json
+        projetos = {}
+        for linha in linhas:
+            projeto = {"id": linha["uid"]}
+            projeto.update((campo, linha[campo]) for campo in CAMPOS_PROJETO)
+            projeto["despesas"] = []
+            for tipo in TIPOS_DOCUMENTO:
+                projeto[tipo] = []
+            projetos[linha["id"]] = projeto
+        if not projetos:
+            return []
+        ids = list(projetos)
+        # Consultas em lotes para não passar do limite de parâmetros do SQLite
+        for inicio in range(0, len(ids), 500):
+            lote = ids[inicio:inicio + 500]
+            marcadores = ",".join("?" * len(lote))
+            for d in self._conexao.execute(
+                    f"SELECT uid, projeto_id, nome, descricao, valor, nfe FROM despesas "
+                    f"WHERE projeto_id IN ({marcadores}) ORDER BY id", lote):
+                projetos[d["projeto_id"]]["despesas"].append({
+                    "id": d["uid"],
+                    "nome": d["nome"],
+                    "descricao": d["descricao"],
+                    "valor": d["valor"],
+                    "nfe": d["nfe"]
+                })
+            for doc in self._conexao.execute(
+                    f"SELECT projeto_id, tipo, arquivo, sha256, tamanho FROM documentos "
+                    f"WHERE projeto_id IN ({marcadores}) ORDER BY id", lote):
+                projetos[doc["projeto_id"]][doc["tipo"]].append(referencia_documento(doc))
+        return list(projetos.values())
+
+    def carregar(self):
+        with self._trava:
+            linhas = self._conexao.execute("SELECT * FROM projetos ORDER BY id").fetchall()
+            return {"projetos": self._montar(linhas), "versao": self._versao(),
+                    "versoes": {linha["uid"]: linha["versao"] for linha in linhas}}
+
+    def _versao(self):
+        linha = self._conexao.execute("SELECT valor FROM controle WHERE chave = 'versao'").fetchone()
+        return linha["valor"] if linha is not None else 0
+
+    def _definir_versao(self, versao):
+        self._conexao.execute("INSERT OR REPLACE INTO controle (chave, valor) VALUES ('versao', ?)", (versao,))
+
+    # Só as versões são lidas de todos os projetos; os dados, só dos alterados
+    def alteracoes(self, versoes):
+        with self._trava:
+            self._conexao.execute("BEGIN")
+            try:
+                atuais = {linha["uid"]: linha["versao"]
+                          for linha in self._conexao.execute("SELECT uid, versao FROM projetos")}
+                alterados = [uid for uid, versao in atuais.items() if uid not in versoes or versoes[uid] != versao]
+                linhas = []
+                for inicio in range(0, len(alterados), 500):
+                    lote = alterados[inicio:inicio + 500]
+                    linhas.extend(self._conexao.execute(
+                        f"SELECT * FROM projetos WHERE uid IN ({','.join('?' * len(lote))}) ORDER BY id", lote))
+                return {"versao": self._versao(), "versoes": atuais, "projetos": self._montar(linhas),
+                        "removidos": [uid for uid in versoes if uid not in atuais]}
+            finally:
+                self._conexao.rollback()
+
+    def salvar(self, dados):
+        with self._trava, self._conexao:
+            self._conexao.execute("BEGIN IMMEDIATE")
+            versao = self._versao() + 1
+            self._conexao.execute("DELETE FROM projetos")
+            for projeto in dados["projetos"]:
+                self._inserir(projeto)
+            self._conexao.execute("UPDATE projetos SET versao = ?", (versao,))
+            self._definir_versao(versao)
+
+    def listar_resumos(self):
+        with self._trava:
+            return [
+                dict(linha) for linha in self._conexao.execute(
+                    "SELECT uid AS id, nome, responsavel, valor_financiamento FROM projetos ORDER BY id"
+                )
+            ]
+
+    def obter_projeto(self, projeto_id):
+        with self._trava:
+            linhas = self._conexao.execute("SELECT * FROM projetos WHERE uid = ?", (projeto_id,)).fetchall()
+            projetos = self._montar(linhas)
+        return projetos[0] if projetos else None
+
+    # As alterações chegam como registros (ver Armazenamento) e cada lote é
+    # conferido e gravado numa única transação
+    def aplicar_lote(self, registros):
+        with self._trava, self._conexao:
+            self._conexao.execute("BEGIN IMMEDIATE")
+            versao_anterior = self._versao()
+            conflitos = []
+            alterados = set()
+            for registro in registros:
+                registro, encontrados = verificar_registro(registro, self._estado)
+                conflitos.extend(encontrados)
+                if registro is not None:
+                    self._executar(registro)
+                    alterados.update(projeto_id for projeto_id in ids_do_registro(registro) if projeto_id)
+            if not alterados:
+                return {"versao_anterior": versao_anterior, "versao": versao_anterior, "conflitos": conflitos}
+            versao = versao_anterior + 1
+            alterados = list(alterados)
+            for inicio in range(0, len(alterados), 500):
+                lote = alterados[inicio:inicio + 500]
+                self._conexao.execute(f"UPDATE projetos SET versao = ? WHERE uid IN ({','.join('?' * len(lote))})",
+                                      [versao] + lote)
+            self._definir_versao(versao)
+            return {"versao_anterior": versao_anterior, "versao": versao, "conflitos": conflitos}
+
+    # Estado de um projeto para verificar_registro; despesas e documentos só
+    # são lidos se a conferência pedir por eles
+    def _estado(self, projeto_id):
+        linha = self._conexao.execute("SELECT * FROM projetos WHERE uid = ?", (projeto_id,)).fetchone()
+        if linha is None:
+            return None, None
+        return _ProjetoNoBanco(self, linha), linha["versao"]
+
+    def _executar(self, registro):
+        op = registro["op"]
+        if op == "inserir_projeto":
+            self._inserir(registro["projeto"])
+        elif op == "gravar_projetos":
+            self._gravar_projetos(registro["projetos"])
+        elif op == "remover_projeto":
+            self._conexao.execute("DELETE FROM projetos WHERE uid = ?", (registro["id"],))
+        elif op == "remover_documento":
+            self._remover_documento(registro["id"], registro["tipo"], registro["arquivo"])
+        elif op in ("atualizar_projeto", "adicionar_despesa", "adicionar_despesas", "adicionar_documento"):
+            linha = self._linha(registro["id"])
+            if linha is None:
+                return
+            if op == "atualizar_projeto":
+                self._atualizar(linha, registro["campos"])
+            elif op == "adicionar_despesa":
+                self._inserir_despesas(linha, [registro["despesa"]])
+            elif op == "adicionar_despesas":
+                self._inserir_despesas(linha, registro["despesas"])
+                for tipo, referencias in registro.get("documentos", {}).items():
+                    self._inserir_documentos(linha, tipo, referencias)
+            else:
+                self._inserir_documentos(linha, registro["tipo"], [registro["arquivo"]])
+        else:
+            raise ValueError(f"Operação desconhecida: {op}")
+
+    # Os projetos existentes são atualizados no lugar para manter a ordem de cadastro
+    def _gravar_projetos(self, projetos):
+        for projeto in projetos:
+            garantir_ids_projeto(projeto)
+            linha = self._linha(projeto["id"])
+            if linha is None:
+                self._inserir(projeto)
+            else:
+                self._atualizar(linha, {campo: valor for campo, valor in projeto.items() if campo != "id"})
+
+    def _atualizar(self, linha, campos):
+        for campo, valor in campos.items():
+            if campo in CAMPOS_PROJETO:
+                self._conexao.execute(f"UPDATE projetos SET {campo} = ? WHERE id = ?", (valor, linha))
+            elif campo == "despesas":
+                self._conexao.execute("DELETE FROM despesas WHERE projeto_id = ?", (linha,))
+                self._inserir_despesas(linha, valor)
+            elif campo in TIPOS_DOCUMENTO:
+                self._conexao.execute("DELETE FROM documentos WHERE projeto_id = ? AND tipo = ?", (linha, campo))
+                self._inserir_documentos(linha, campo, valor)
+
+    def _remover_documento(self, projeto_id, tipo, arquivo):
+        nome, sha256, _ = colunas_documento(arquivo)
+        self._conexao.execute(
+            "DELETE FROM documentos WHERE id = ("
+            "SELECT d.id FROM documentos d JOIN projetos p ON p.id = d.projeto_id "
+            "WHERE p.uid = ? AND d.tipo = ? AND d.arquivo = ? AND d.sha256 IS ? ORDER BY d.id LIMIT 1)",
+            (projeto_id, tipo, nome, sha256)
+        )
+
+    def fechar(self):
+        with self._trava:
+            self._conexao.close()
+
+
+class _ProjetoNoBanco:
+    def __init__(self, banco, linha):
+        self.banco = banco
+        self.linha = linha
+        self._completo = None
+
+    def get(self, campo, padrao=None):
+        if campo in CAMPOS_PROJETO:
+            return self.linha[campo]
+        if self._completo is None:
+            self._completo = self.banco._montar([self.linha])[0]
+        return self._completo.get(campo, padrao)
+
+
+# Migração única do layout atual (projetos.json, incluindo um diário pendente)
+# para o banco SQLite. `destino` pode ser um caminho ou um ArmazenamentoSQLite aberto.
+def migrar_json_para_sqlite(origem=DATA_FILE, destino=SQLITE_FILE):
+    if os.path.exists(origem + ".diario"):
+        fonte = ArmazenamentoDiario(origem)
+    else:
+        fonte = ArmazenamentoJSON(origem)
+    dados = fonte.carregar()
+    fonte.fechar()
+    if isinstance(destino, ArmazenamentoSQLite):
+        destino.salvar(dados)
+    else:
+        banco = ArmazenamentoSQLite(destino, origem_json=None)
+        banco.salvar(dados)
+        banco.fechar()
+    return len(dados["projetos"])
+
+
+def criar_armazenamento(backend=BACKEND, caminho=DATA_FILE):
+    if backend == "json":
+        return ArmazenamentoJSON(caminho)
+    if backend == "diario":
+        return ArmazenamentoDiario(caminho)
+    if backend == "sqlite":
+        return ArmazenamentoSQLite(SQLITE_FILE, origem_json=caminho)
+    if backend == "remoto":
+        # Modo cliente: os dados são do servidor local (ver servidor.py e cliente.py)
+        from cliente import ArmazenamentoRemoto
+        return ArmazenamentoRemoto()
+    raise ValueError(f"Backend de armazenamento desconhecido: {backend}")
+
+
+_armazenamento = None
+
+
+def obter_armazenamento():
+    global _armazenamento
+    if _armazenamento is None:
+        _armazenamento = criar_armazenamento()
+    return _armazenamento
+
+
+# Funções para carregar e salvar dados JSON
+def carregar_dados():
+    return obter_armazenamento().carregar()
+
+
+def salvar_dados(dados):
+    obter_armazenamento().salvar(dados)
@@ -0,0 +1,349 @@
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Medições de desempenho dos caminhos reais do aplicativo sobre uma base
+# sintética reproduzível (mesma semente, mesmos dados). A base é gerada numa
+# pasta própria (projetos.json e documentos/), o processo passa a trabalhar
+# nela e só então os módulos do aplicativo são importados, de modo que os
+# caminhos relativos da configuração apontem para a base gerada.
+#
+# O resultado é um JSON com os parâmetros, o ambiente e, por medição, a
+# mediana e o mínimo em segundos. Com --base, as medições são comparadas com
+# um resultado anterior (da mesma base e backend) e o comando termina com
+# código 1 se alguma passar da tolerância.
+#
+#   python benchmark.py --projetos 2000 --despesas 30 --saida atual.json
+#   python benchmark.py --projetos 2000 --despesas 30 --base atual.json
+
+# Diferenças abaixo disso (em segundos) são ruído, não regressão
+RUIDO_MINIMO = 0.005
+
+AREAS = ("Análise", "Estudo", "Desenvolvimento", "Avaliação", "Modelagem", "Caracterização", "Síntese",
+         "Otimização", "Mapeamento", "Monitoramento")
+TEMAS = ("da qualidade da água", "de materiais compósitos", "do solo agrícola", "de algoritmos de aprendizado",
+         "da biodiversidade do cerrado", "de redes elétricas inteligentes", "da produção de biogás",
+         "de políticas públicas de saúde", "da evasão escolar", "de sensores de baixo custo",
+         "do microbioma intestinal", "de argamassas sustentáveis")
+LOCAIS = ("no semiárido nordestino", "em Minas Gerais", "na Amazônia", "em comunidades ribeirinhas",
+          "no litoral paulista", "na região metropolitana", "em escolas públicas", "")
+NOMES = ("Ana", "João", "Maria", "José", "Francisca", "Antônio", "Luíza", "Carlos", "Beatriz", "Raimundo",
+         "Letícia", "Sebastião", "Conceição", "Márcio")
+SOBRENOMES = ("Silva", "Santos", "Oliveira", "Souza", "Conceição", "Pereira", "Araújo", "Gonçalves", "Lima",
+              "Ribeiro", "Câmara", "Magalhães")
+ITENS = ("Reagentes", "Vidrarias", "Passagem aérea", "Diária de campo", "Notebook", "Licença de software",
+         "Material de escritório", "Combustível", "Análise laboratorial", "Inscrição em congresso",
+         "Manutenção de equipamento", "Serviço de transcrição")
+DESCRICOES = ("Compra para o laboratório de pesquisa", "Referente à coleta de campo", "Conforme orçamento aprovado",
+              "Pagamento à vista com desconto", "Aquisição emergencial", "Serviço prestado em duas etapas", "")
+FORNECEDORES = ("Papelaria Central Ltda", "Química Brasil Comércio", "Auto Posto Estrela", "Tecnologia & Cia ME",
+                "Laboratório São Lucas", "Agência Viaje Bem")
+PREFIXOS_DOCUMENTO = {"orcamentos": "orcamento", "nfe": "nota_fiscal", "comprovantes": "comprovante_pix",
+                      "arquivos_adicionais": "relatorio_parcial"}
+
+
+# Base sintética
+
+def _texto_projeto(aleatorio):
+    return f"{aleatorio.choice(AREAS)} {aleatorio.choice(TEMAS)} {aleatorio.choice(LOCAIS)}".strip()
+
+
+def _pessoa(aleatorio):
+    return f"{aleatorio.choice(NOMES)} {aleatorio.choice(SOBRENOMES)} {aleatorio.choice(SOBRENOMES)}"
+
+
+def _despesa(aleatorio):
+    item = aleatorio.choice(ITENS)
+    return {
+        "id": "%032x" % aleatorio.getrandbits(128),
+        "nome": f"{item} - {aleatorio.choice(FORNECEDORES)}",
+        "descricao": aleatorio.choice(DESCRICOES),
+        "valor": round(aleatorio.lognormvariate(6, 1.2), 2),
+        "nfe": "".join(aleatorio.choice("0123456789") for _ in range(44)) if aleatorio.random() < 0.7 else "",
+    }
+
+
+# Conteúdo fictício com cara de PDF, diferente para cada anexo
+def _conteudo_anexo(aleatorio, tamanho):
+    return b"%PDF-1.4\n" + aleatorio.randbytes(max(tamanho - 16, 0)) + b"\n%%EOF\n"
+
+
+# Grava projetos.json e os anexos (no armazém de documentos) em `pasta`.
+# `despesas` e `anexos` são médias por projeto.
+def gerar_dataset(pasta, projetos=500, despesas=20, anexos=2, tamanho_anexo=16 * 1024, semente=1):
+    from configuracao import DATA_FILE, DOCUMENTOS_DIR
+    from armazenamento import TIPOS_DOCUMENTO
+    from documentos import ArmazemDocumentos, criar_referencia
+
+    aleatorio = random.Random(semente)
+    armazem = ArmazemDocumentos(os.path.join(pasta, DOCUMENTOS_DIR))
+    lista = []
+    for i in range(projetos):
+        projeto = {
+            "id": "%032x" % aleatorio.getrandbits(128),
+            "nome": _texto_projeto(aleatorio),
+            "responsavel": _pessoa(aleatorio),
+            "valor_financiamento": float(aleatorio.randrange(5, 500) * 1000),
+            "despesas": [_despesa(aleatorio) for _ in range(aleatorio.randint(0, 2 * despesas))],
+            "data_cadastro": f"{aleatorio.randint(2019, 2025)}-{aleatorio.randint(1, 12):02d}-"
+                             f"{aleatorio.randint(1, 28):02d} {aleatorio.randint(8, 18):02d}:00:00",
+        }
+        for tipo in TIPOS_DOCUMENTO:
+            projeto[tipo] = []
+        for n in range(aleatorio.randint(0, 2 * anexos)):
+            tipo = aleatorio.choice(TIPOS_DOCUMENTO)
+            conteudo = _conteudo_anexo(aleatorio, aleatorio.randint(tamanho_anexo // 2, tamanho_anexo * 3 // 2))
+            digest, tamanho = armazem.ingerir_fluxo(io.BytesIO(conteudo))
+            projeto[tipo].append(criar_referencia(f"{PREFIXOS_DOCUMENTO[tipo]}_{i}_{n}.pdf", digest, tamanho))
+        lista.append(projeto)
+    with open(os.path.join(pasta, DATA_FILE), "w") as f:
+        json.dump({"projetos": lista}, f, indent=4)
+    return lista
+
+
+# Medições
+
+# Executa `funcao` `repeticoes` vezes. Com `preparar`, o que ele devolve
+# (fora da medição) é passado para a função a cada repetição.
+def _medir(resultados, nome, funcao, repeticoes, preparar=None):
+    tempos = []
+    for _ in range(repeticoes):
+        argumentos = (preparar(),) if preparar is not None else ()
+        inicio = time.perf_counter()
+        funcao(*argumentos)
+        tempos.append(time.perf_counter() - inicio)
+    resultados[nome] = {"mediana": statistics.median(tempos), "minimo": min(tempos), "tempos": tempos}
+    print(f"{nome:<28} {resultados[nome]['mediana'] * 1000:10.1f} ms", file=sys.stderr)
+
+
+def _maior_projeto(projetos):
+    from armazenamento import TIPOS_DOCUMENTO
+    return max(projetos, key=lambda p: len(p["despesas"]) + sum(len(p[tipo]) for tipo in TIPOS_DOCUMENTO))
+
+
+def medir_armazenamento(resultados, repeticoes):
+    from armazenamento import BACKEND, criar_armazenamento, carregar_dados, salvar_dados
+
+    def abrir():
+        armazenamento = criar_armazenamento(BACKEND)
+        armazenamento.carregar()
+        armazenamento.fechar()
+
+    _medir(resultados, "abrir_armazenamento", abrir, repeticoes)
+    _medir(resultados, "carregar_dados", carregar_dados, repeticoes)
+    dados = carregar_dados()
+    _medir(resultados, "salvar_dados", lambda: salvar_dados(dados), repeticoes)
+
+
+def medir_repositorio(resultados, repeticoes):
+    from armazenamento import obter_armazenamento
+    from repositorio import Repositorio, obter_repositorio
+
+    _medir(resultados, "carregar_repositorio", lambda: Repositorio(obter_armazenamento()).projetos(), repeticoes)
+    repositorio = obter_repositorio()
+    projetos = list(repositorio.projetos())
+    aleatorio = random.Random(2)
+
+    # Alterações seguidas gravadas de uma vez (gravação adiada + salvar)
+    def alterar():
+        for projeto in aleatorio.sample(projetos, min(200, len(projetos))):
+            repositorio.atualizar_projeto(projeto["id"], {"valor_financiamento": projeto["valor_financiamento"] + 1})
+        repositorio.salvar()
+
+    _medir(resultados, "alteracoes_em_lote", alterar, repeticoes)
+    repositorio.buscar("a")
+    _medir(resultados, "buscar", lambda: repositorio.buscar("estudo agua", 50), repeticoes)
+    repositorio.financeiro()
+    _medir(resultados, "resumo_financeiro", lambda: repositorio.financeiro().por_responsavel(), repeticoes)
+
+
+def medir_relatorio(resultados, repeticoes, pasta):
+    from relatorio import PDFReport, CacheFragmentos
+    from repositorio import obter_repositorio
+
+    projetos = [projeto.copia() for projeto in obter_repositorio().projetos()]
+    saida = os.path.join(pasta, "relatorio.pdf")
+
+    # Cache vazio a cada repetição: todos os projetos são renderizados
+    def cache_vazio():
+        return CacheFragmentos(tempfile.mkdtemp(dir=pasta))
+
+    _medir(resultados, "gerar_relatorio", lambda cache: PDFReport(projetos, cache).gerar_relatorio(saida),
+           repeticoes, cache_vazio)
+    cache = CacheFragmentos(os.path.join(pasta, "cache_benchmark"))
+    PDFReport(projetos, cache).gerar_relatorio(saida)
+    _medir(resultados, "gerar_relatorio_cache", lambda: PDFReport(projetos, cache).gerar_relatorio(saida), repeticoes)
+
+
+def medir_exportacao(resultados, repeticoes, pasta):
+    from exportacao import compactar_projeto, ler_projetos_zip
+    from repositorio import obter_repositorio
+
+    repositorio = obter_repositorio()
+    projeto = _maior_projeto(repositorio.projetos()).copia()
+    arquivo = os.path.join(pasta, "projeto.zip")
+    _medir(resultados, "compactar_projeto", lambda: compactar_projeto(projeto, arquivo), repeticoes)
+
+    # Os blobs já estão no armazém, então mede a leitura dos manifestos e a
+    # mesclagem (o caso de reimportar um arquivo)
+    def descompactar():
+        repositorio.importar_projetos(ler_projetos_zip(arquivo))
+
+    _medir(resultados, "descompactar_projeto", descompactar, repeticoes)
+
+
+def medir_interface(resultados, repeticoes):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt6.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    from interface import ProjetoManager
+
+    janelas = []
+    _medir(resultados, "abrir_janela", lambda: janelas.append(ProjetoManager()), 1)
+    janela = janelas[0]
+    janela.show()
+    app.processEvents()
+
+    def atualizar():
+        janela.atualizar_tabela()
+        app.processEvents()
+
+    _medir(resultados, "atualizar_tabela", atualizar, repeticoes)
+    projeto = _maior_projeto(janela.repositorio.projetos())
+
+    def fechar_pagina():
+        janela.fechar_pagina_projeto(projeto["id"])
+        app.processEvents()
+
+    def abrir_pagina(_):
+        janela.abrir_pagina_projeto(projeto)
+        app.processEvents()
+
+    _medir(resultados, "abrir_pagina_projeto", abrir_pagina, repeticoes, fechar_pagina)
+    janela.close()
+
+
+# Comparação com um resultado anterior (base, se houver) e com os limites
+# absolutos ({medição: segundos}); devolve a descrição de cada regressão
+
+def comparar(atual, base, tolerancia, limites=None):
+    regressoes = []
+    if base is not None and atual["parametros"] != base["parametros"]:
+        print("Aviso: a base foi gerada com outros parâmetros; comparando mesmo assim", file=sys.stderr)
+    for nome, medida in atual["resultados"].items():
+        anterior = base["resultados"].get(nome) if base is not None else None
+        if anterior is None:
+            continue
+        agora, antes = medida["mediana"], anterior["mediana"]
+        if agora > antes * (1 + tolerancia) and agora - antes > RUIDO_MINIMO:
+            regressoes.append(f"{nome}: {antes * 1000:.1f} ms -> {agora * 1000:.1f} ms (+{(agora / antes - 1) * 100:.0f}%)")
+    for nome, limite in (limites or {}).items():
+        medida = atual["resultados"].get(nome)
+        if medida is not None and medida["mediana"] > limite:
+            regressoes.append(f"{nome}: {medida['mediana'] * 1000:.1f} ms acima do limite de {limite * 1000:.1f} ms")
+    return regressoes
+
+
+def _ambiente():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return {"python": platform.python_version(), "plataforma": platform.platform(), "processadores": os.cpu_count(),
+            "commit": commit, "data": time.strftime("%Y-%m-%d %H:%M:%S")}
+
+
+def _limite(valor):
+    nome, _, segundos = valor.partition("=")
+    try:
+        return nome, float(segundos)
+    except ValueError:
+        raise argparse.ArgumentTypeError("use medição=segundos, ex.: carregar_dados=0.5") from None
+
+
+def criar_parser():
+    parser = argparse.ArgumentParser(description="Mede o desempenho sobre uma base sintética.")
+    parser.add_argument("--projetos", type=int, default=500)
+    parser.add_argument("--despesas", type=int, default=20, help="média de despesas por projeto")
+    parser.add_argument("--anexos", type=int, default=2, help="média de documentos por projeto")
+    parser.add_argument("--tamanho-anexo", type=int, default=16, help="tamanho médio dos documentos em KB")
+    parser.add_argument("--semente", type=int, default=1)
+    parser.add_argument("--backend", choices=("json", "diario", "sqlite"), help="padrão: PROJETOS_BACKEND")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--sem-interface", action="store_true", help="não mede a interface (Qt offscreen)")
+    parser.add_argument("--pasta", help="pasta da base (padrão: temporária, apagada no fim)")
+    parser.add_argument("--somente-gerar", action="store_true", help="só gera a base em --pasta")
+    parser.add_argument("--saida", help="arquivo JSON com os resultados (padrão: saída padrão)")
+    parser.add_argument("--base", help="resultado anterior para comparar")
+    parser.add_argument("--tolerancia", type=float, default=0.25, help="aumento aceito sobre a base (0.25 = 25%%)")
+    parser.add_argument("--limite", type=_limite, action="append", default=[],
+                        help="tempo máximo absoluto de uma medição, ex.: carregar_dados=0.5")
+    return parser
+
+
+def main(argv=None):
+    args = criar_parser().parse_args(argv)
+    if args.backend:
+        os.environ["PROJETOS_BACKEND"] = args.backend
+    saida = os.path.abspath(args.saida) if args.saida else None
+    base = None
+    if args.base:
+        with open(args.base) as f:
+            base = json.load(f)
+    temporaria = args.pasta is None
+    pasta = os.path.abspath(args.pasta or tempfile.mkdtemp(prefix="benchmark-"))
+    os.makedirs(pasta, exist_ok=True)
+    os.chdir(pasta)
+    try:
+        parametros = {"projetos": args.projetos, "despesas": args.despesas, "anexos": args.anexos,
+                      "tamanho_anexo": args.tamanho_anexo, "semente": args.semente,
+                      "backend": os.environ.get("PROJETOS_BACKEND", "json")}
+        inicio = time.perf_counter()
+        gerar_dataset(pasta, args.projetos, args.despesas, args.anexos, args.tamanho_anexo * 1024, args.semente)
+        print(f"Base gerada em {pasta} ({time.perf_counter() - inicio:.1f} s)", file=sys.stderr)
+        if args.somente_gerar:
+            return 0
+        # Primeira abertura fora da medição (o SQLite migra o projetos.json)
+        from armazenamento import obter_armazenamento
+        obter_armazenamento()
+
+        resultados = {}
+        medir_armazenamento(resultados, args.repeticoes)
+        medir_repositorio(resultados, args.repeticoes)
+        medir_relatorio(resultados, args.repeticoes, pasta)
+        medir_exportacao(resultados, args.repeticoes, pasta)
+        if not args.sem_interface:
+            medir_interface(resultados, args.repeticoes)
+        else:
+            from repositorio import obter_repositorio
+            obter_repositorio().fechar()
+
+        relatorio = {"parametros": parametros, "ambiente": _ambiente(), "resultados": resultados}
+        texto = json.dumps(relatorio, indent=2, ensure_ascii=False)
+        if saida:
+            with open(saida, "w") as f:
+                f.write(texto + "\n")
+        else:
+            print(texto)
+        regressoes = comparar(relatorio, base, args.tolerancia, dict(args.limite))
+        for regressao in regressoes:
+            print(f"REGRESSÃO {regressao}", file=sys.stderr)
+        return 1 if regressoes else 0
+    finally:
+        os.chdir(os.path.dirname(pasta))
+        if temporaria and not args.somente_gerar:
+            shutil.rmtree(pasta, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+import bisect
+import functools
+import heapq
+import math
+import re
+import unicodedata
+
+from armazenamento import TIPOS_DOCUMENTO
+from documentos import nome_documento
+
+# Peso de cada campo na pontuação: uma ocorrência no nome do projeto vale
+# mais que uma na descrição de uma despesa
+PESO_NOME = 8
+PESO_RESPONSAVEL = 4
+PESO_NFE = 4
+PESO_DESPESA = 2
+PESO_DESCRICAO = 1
+PESO_DOCUMENTO = 1
+
+# Um termo da consulta também encontra as palavras que começam com ele
+# (busca enquanto se digita), com metade do peso, a partir deste tamanho
+MINIMO_PREFIXO = 2
+LIMITE_EXPANSOES = 1000
+PESO_PREFIXO = 0.5
+
+# Letras e dígitos, incluindo acentos na forma decomposta
+_PALAVRA = re.compile(r"(?:[^\W_]|[\u0300-\u036f])+")
+
+
+# Minúsculas e sem acentos: "Licitação" e "licitacao" são a mesma palavra
+def normalizar(texto):
+    texto = str(texto)
+    if texto.isascii():
+        return texto.lower()
+    texto = unicodedata.normalize("NFKD", texto)
+    return "".join(c for c in texto if not unicodedata.combining(c)).casefold()
+
+
+# As mesmas palavras se repetem muito entre projetos e despesas: a forma
+# normalizada de cada uma é guardada em vez de recalculada
+@functools.lru_cache(maxsize=1 << 16)
+def _normalizar_palavra(palavra):
+    return normalizar(palavra)
+
+
+def palavras(texto):
+    return [_normalizar_palavra(palavra) for palavra in _PALAVRA.findall(str(texto))]
+
+
+def _campos(projeto):
+    yield projeto["nome"], PESO_NOME
+    yield projeto["responsavel"], PESO_RESPONSAVEL
+    for despesa in projeto["despesas"]:
+        yield despesa["nome"], PESO_DESPESA
+        yield despesa["descricao"], PESO_DESCRICAO
+        yield despesa["nfe"], PESO_NFE
+    for tipo in TIPOS_DOCUMENTO:
+        for referencia in projeto[tipo]:
+            yield nome_documento(referencia), PESO_DOCUMENTO
+
+
+# Índice invertido palavra -> {projeto_id: peso}. É atualizado projeto a
+# projeto (adicionar/remover) a cada alteração, sem reconstruir o resto.
+# O vocabulário ordenado, usado na busca por prefixo, só é montado na
+# primeira busca por prefixo e depois mantido a cada palavra nova ou extinta.
+class IndiceBusca:
+    def __init__(self, projetos=()):
+        self._postagens = {}
+        self._palavras_projeto = {}
+        self._vocabulario = None
+        for projeto in projetos:
+            self.adicionar(projeto)
+
+    def __len__(self):
+        return len(self._palavras_projeto)
+
+    def adicionar(self, projeto):
+        projeto_id = projeto["id"]
+        if projeto_id in self._palavras_projeto:
+            self.remover(projeto_id)
+        pesos = {}
+        for texto, peso in _campos(projeto):
+            for palavra in palavras(texto):
+                pesos[palavra] = pesos.get(palavra, 0) + peso
+        self._palavras_projeto[projeto_id] = pesos
+        for palavra, peso in pesos.items():
+            postagem = self._postagens.get(palavra)
+            if postagem is None:
+                postagem = self._postagens[palavra] = {}
+                if self._vocabulario is not None:
+                    bisect.insort(self._vocabulario, palavra)
+            postagem[projeto_id] = peso
+
+    def remover(self, projeto_id):
+        for palavra in self._palavras_projeto.pop(projeto_id, ()):
+            postagem = self._postagens[palavra]
+            del postagem[projeto_id]
+            if not postagem:
+                del self._postagens[palavra]
+                if self._vocabulario is not None:
+                    del self._vocabulario[bisect.bisect_left(self._vocabulario, palavra)]
+
+    def _expansoes(self, termo):
+        if self._vocabulario is None:
+            self._vocabulario = sorted(self._postagens)
+        inicio = bisect.bisect_left(self._vocabulario, termo)
+        fim = bisect.bisect_left(self._vocabulario, termo + "\U0010ffff", inicio)
+        return self._vocabulario[inicio:min(fim, inicio + LIMITE_EXPANSOES)]
+
+    # Pontuação de cada projeto para um termo: soma dos pesos das palavras
+    # encontradas ponderados pela raridade (idf) de cada palavra
+    def _pontuar_termo(self, termo):
+        total = len(self._palavras_projeto)
+        palavras_termo = [termo] if len(termo) < MINIMO_PREFIXO else self._expansoes(termo)
+        pontuacoes = {}
+        for palavra in palavras_termo:
+            postagem = self._postagens.get(palavra)
+            if not postagem:
+                continue
+            fator = math.log(1 + total / len(postagem)) * (1 if palavra == termo else PESO_PREFIXO)
+            for projeto_id, peso in postagem.items():
+                pontuacoes[projeto_id] = pontuacoes.get(projeto_id, 0) + peso * fator
+        return pontuacoes
+
+    # Projetos que contêm todos os termos da consulta, com a pontuação
+    def pontuar(self, consulta):
+        termos = list(dict.fromkeys(palavras(consulta)))
+        if not termos:
+            return {}
+        por_termo = sorted((self._pontuar_termo(termo) for termo in termos), key=len)
+        resultado = por_termo[0]
+        for pontuacoes in por_termo[1:]:
+            resultado = {projeto_id: pontuacao + pontuacoes[projeto_id]
+                         for projeto_id, pontuacao in resultado.items() if projeto_id in pontuacoes}
+            if not resultado:
+                break
+        return resultado
+
+    # Pares (projeto_id, pontuação) do mais ao menos relevante
+    def buscar(self, consulta, limite=None):
+        pontuacoes = self.pontuar(consulta)
+        if limite is None:
+            return sorted(pontuacoes.items(), key=lambda item: item[1], reverse=True)
+        return heapq.nlargest(limite, pontuacoes.items(), key=lambda item: item[1])
+
+
+# Onde os termos da consulta aparecem no projeto (para exibir ao lado do
+# resultado): "Despesa: ...", "NF-e: ...", "Documento: ..."
+def trechos(projeto, consulta):
+    termos = palavras(consulta)
+
+    def contem(texto):
+        encontradas = palavras(texto)
+        return any(p.startswith(t) for t in termos for p in encontradas)
+
+    encontrados = []
+    for despesa in projeto["despesas"]:
+        if contem(despesa["nfe"]):
+            encontrados.append(f"NF-e: {despesa['nfe']} ({despesa['nome']})")
+        elif contem(despesa["nome"]) or contem(despesa["descricao"]):
+            encontrados.append(f"Despesa: {despesa['nome']}")
+    for tipo in TIPOS_DOCUMENTO:
+        for referencia in projeto[tipo]:
+            if contem(nome_documento(referencia)):
+                encontrados.append(f"Documento: {nome_documento(referencia)}")
+    return encontrados
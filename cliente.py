@@ -0,0 +1,327 @@
+import http.client
+import json
+import os
+import queue
+import select
+import threading
+import urllib.parse
+from contextlib import contextmanager
+
+from armazenamento import Armazenamento, ConflitoConcorrencia
+from configuracao import SERVIDOR_URL, CONEXOES_CLIENTE, DOCUMENTOS_CACHE_DIR
+from documentos import ArmazemDocumentos, TAMANHO_BLOCO, digest_documento
+
+# Modo cliente (PROJETOS_BACKEND=remoto): os projetos e os documentos ficam
+# no servidor local (ver servidor.py) e esta instância os usa por HTTP. O
+# repositório continua o mesmo, sobre o ArmazenamentoRemoto abaixo: a carga
+# inicial vem em páginas, as alterações vão em lotes (POST /lote) e, quando
+# outro cliente grava, só os projetos alterados são pedidos de novo. Os
+# documentos são enviados ao servidor ao entrar no armazém local e baixados
+# (com o digest conferido) na primeira vez em que são abertos.
+
+# Projetos por página na carga inicial
+PAGINA = 1000
+
+# Tempo (segundos) que cada espera por alterações fica aberta no servidor
+ESPERA_EVENTOS = 25
+
+# Tempo máximo (segundos) de uma requisição
+TEMPO_LIMITE = 60
+
+# Métodos repetidos uma vez quando a conexão reaproveitada já tinha sido
+# fechada pelo servidor (os demais podem ter sido aplicados)
+METODOS_IDEMPOTENTES = ("GET", "HEAD", "PUT", "DELETE")
+
+
+class ErroServidor(Exception):
+    def __init__(self, status, mensagem, dados=None):
+        super().__init__(f"{status}: {mensagem}")
+        self.status = status
+        self.dados = dados or {}
+
+
+# Conexões HTTP mantidas abertas e reaproveitadas, no máximo `tamanho` em uso
+# ao mesmo tempo (threads da interface, tarefas e gravação em segundo plano)
+class PoolConexoes:
+    def __init__(self, host, porta, tamanho=CONEXOES_CLIENTE, tempo_limite=TEMPO_LIMITE):
+        self.host = host
+        self.porta = porta
+        self.tempo_limite = tempo_limite
+        self._livres = queue.LifoQueue()
+        self._vagas = threading.BoundedSemaphore(tamanho)
+
+    def nova(self, tempo_limite=None):
+        return http.client.HTTPConnection(self.host, self.porta, timeout=tempo_limite or self.tempo_limite,
+                                          blocksize=TAMANHO_BLOCO)
+
+    # Uma conexão parada que o servidor fechou (ex.: reiniciado) fica legível
+    @staticmethod
+    def _fechada(conexao):
+        return conexao.sock is None or bool(select.select([conexao.sock], [], [], 0)[0])
+
+    def _livre(self):
+        while True:
+            try:
+                conexao = self._livres.get_nowait()
+            except queue.Empty:
+                return None
+            if not self._fechada(conexao):
+                return conexao
+            conexao.close()
+
+    # Fornece (conexão, reaproveitada); uma conexão que falhou não volta ao pool
+    @contextmanager
+    def conexao(self):
+        with self._vagas:
+            conexao = self._livre()
+            reaproveitada = conexao is not None
+            if conexao is None:
+                conexao = self.nova()
+            try:
+                yield conexao, reaproveitada
+            except BaseException:
+                conexao.close()
+                raise
+            self._livres.put(conexao)
+
+    def fechar(self):
+        while True:
+            try:
+                self._livres.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class ClienteAPI:
+    def __init__(self, url=SERVIDOR_URL, conexoes=CONEXOES_CLIENTE):
+        partes = urllib.parse.urlsplit(url)
+        if partes.scheme != "http" or not partes.hostname:
+            raise ValueError(f"Endereço do servidor inválido (use http://host:porta): {url}")
+        self.url = url
+        self.pool = PoolConexoes(partes.hostname, partes.port or 80, conexoes)
+
+    # Faz a requisição e devolve o corpo da resposta; com ao_responder, o
+    # corpo é entregue em fluxo (ex.: download) e o que ela devolver é o
+    # resultado. Respostas de erro viram ErroServidor (409 com conflitos,
+    # ConflitoConcorrencia).
+    def requisitar(self, metodo, caminho, corpo=None, cabecalhos=None, ao_responder=None):
+        tentativas = 2 if metodo in METODOS_IDEMPOTENTES else 1
+        for tentativa in range(tentativas):
+            try:
+                with self.pool.conexao() as (conexao, reaproveitada):
+                    conexao.request(metodo, caminho, body=corpo, headers=cabecalhos or {})
+                    resposta = conexao.getresponse()
+                    if resposta.status < 400:
+                        return ao_responder(resposta) if ao_responder is not None else resposta.read()
+                    status, conteudo = resposta.status, resposta.read()
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                if not reaproveitada or tentativa + 1 == tentativas:
+                    raise
+                if hasattr(corpo, "seek"):
+                    corpo.seek(0)
+        try:
+            dados = json.loads(conteudo)
+        except ValueError:
+            dados = {"erro": conteudo.decode("utf-8", "replace")}
+        if status == 409 and "conflitos" in dados:
+            raise ConflitoConcorrencia(dados["conflitos"])
+        raise ErroServidor(status, dados.get("erro", ""), dados)
+
+    def json(self, metodo, caminho, dados=None):
+        corpo = None
+        cabecalhos = {}
+        if dados is not None:
+            corpo = json.dumps(dados, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            cabecalhos["Content-Type"] = "application/json"
+        conteudo = self.requisitar(metodo, caminho, corpo, cabecalhos)
+        return json.loads(conteudo) if conteudo else None
+
+    def fechar(self):
+        self.pool.fechar()
+
+
+class ArmazenamentoRemoto(Armazenamento):
+    # A assinatura é (instância do servidor, versão): uma thread fica
+    # esperando em GET /eventos e atualiza a assinatura quando outro cliente
+    # grava, então conferir se há novidades não custa uma requisição.
+    # _versao é a versão do servidor que o repositório já leu.
+    def __init__(self, cliente=None):
+        self.cliente = cliente or ClienteAPI()
+        self._instancia = None
+        self._versao = 0
+        self._ultima = None
+        self._trava = threading.Lock()
+        self._parar = threading.Event()
+        self._observador = None
+
+    def _anotar(self, instancia, versao):
+        with self._trava:
+            if self._ultima is None or self._ultima[0] != instancia or versao > self._ultima[1]:
+                self._ultima = (instancia, versao)
+
+    def assinatura(self):
+        if self._ultima is None:
+            estado = self.cliente.json("GET", "/estado")
+            self._anotar(estado["instancia"], estado["versao"])
+        if self._observador is None:
+            self._observador = threading.Thread(target=self._esperar_alteracoes, name="eventos-servidor",
+                                                daemon=True)
+            self._observador.start()
+        return self._ultima
+
+    def _esperar_alteracoes(self):
+        conexao = self.cliente.pool.nova(ESPERA_EVENTOS + TEMPO_LIMITE)
+        while not self._parar.is_set():
+            instancia, versao = self._ultima
+            try:
+                conexao.request("GET", f"/eventos?instancia={instancia}&versao={versao}&espera={ESPERA_EVENTOS}")
+                dados = json.loads(conexao.getresponse().read())
+            except (OSError, http.client.HTTPException, ValueError):
+                # Servidor fora do ar ou reiniciando: tenta de novo em instantes
+                conexao.close()
+                self._parar.wait(1)
+                continue
+            self._anotar(dados["instancia"], dados["versao"])
+        conexao.close()
+
+    # Projetos em páginas. Se a versão mudou no meio (outro cliente gravou),
+    # a leitura é refeita, para que nenhum projeto escape entre as páginas.
+    def carregar(self):
+        for _ in range(3):
+            projetos = []
+            versoes = {}
+            primeira = pagina = None
+            while pagina is None or (pagina["projetos"] and len(projetos) < pagina["total"]):
+                pagina = self.cliente.json("GET", f"/projetos?inicio={len(projetos)}&limite={PAGINA}")
+                primeira = primeira or pagina
+                projetos.extend(pagina["projetos"])
+                versoes.update(pagina["versoes"])
+            if (pagina["instancia"], pagina["versao"]) == (primeira["instancia"], primeira["versao"]):
+                break
+        # O que mudou depois da primeira página volta em alteracoes()
+        self._instancia = primeira["instancia"]
+        self._versao = primeira["versao"]
+        self._anotar(pagina["instancia"], pagina["versao"])
+        return {"projetos": projetos, "versao": self._versao, "versoes": versoes}
+
+    # Pede ao servidor os projetos alterados desde a versão já lida, mais os
+    # que o repositório marcou como desconhecidos (versão negativa)
+    def alteracoes(self, versoes):
+        dados = self.cliente.json("POST", "/alteracoes", {
+            "instancia": self._instancia,
+            "desde": self._versao,
+            "ids": [projeto_id for projeto_id, versao in versoes.items() if versao is None or versao < 0],
+        })
+        if dados["completo"]:
+            # O servidor foi reiniciado: as versões conhecidas não valem mais
+            return super().alteracoes(dict.fromkeys(versoes))
+        atuais = dict(versoes)
+        atuais.update(dados["versoes"])
+        for projeto_id in dados["removidos"]:
+            atuais.pop(projeto_id, None)
+        self._versao = dados["versao"]
+        return {"versao": dados["versao"], "versoes": atuais, "projetos": dados["projetos"],
+                "removidos": dados["removidos"]}
+
+    def aplicar_lote(self, registros):
+        resultado = self.cliente.json("POST", "/lote", {"registros": registros, "instancia": self._instancia})
+        if resultado["versao_anterior"] == self._versao and not resultado["conflitos"]:
+            # Ninguém gravou entre a última leitura e este lote
+            self._versao = resultado["versao"]
+            self._anotar(resultado["instancia"], resultado["versao"])
+        return resultado
+
+    def listar_resumos(self):
+        resumos = []
+        while True:
+            pagina = self.cliente.json("GET", f"/projetos?completo=0&inicio={len(resumos)}&limite={PAGINA}")
+            resumos.extend(pagina["projetos"])
+            if not pagina["projetos"] or len(resumos) >= pagina["total"]:
+                return resumos
+
+    def obter_projeto(self, projeto_id):
+        try:
+            return self.cliente.json("GET", f"/projetos/{urllib.parse.quote(projeto_id)}")["projeto"]
+        except ErroServidor as erro:
+            if erro.status == 404:
+                return None
+            raise
+
+    def fechar(self):
+        self._parar.set()
+        self.cliente.fechar()
+
+
+# Armazém de documentos do modo cliente: o armazém local (em
+# DOCUMENTOS_CACHE_DIR) serve de cache do servidor
+class ArmazemRemoto(ArmazemDocumentos):
+    def __init__(self, cliente=None, raiz=DOCUMENTOS_CACHE_DIR):
+        super().__init__(raiz)
+        self.cliente = cliente or ClienteAPI()
+
+    def _no_servidor(self, digest):
+        try:
+            self.cliente.requisitar("HEAD", f"/documentos/{digest}")
+            return True
+        except ErroServidor as erro:
+            if erro.status == 404:
+                return False
+            raise
+
+    def existe(self, digest):
+        return super().existe(digest) or self._no_servidor(digest)
+
+    # Traz o blob para o cache, se ainda não estiver; um blob que o servidor
+    # não tem fica ausente, como um arquivo apagado no modo local
+    def _baixar(self, digest):
+        if os.path.exists(self.caminho(digest)):
+            return
+        try:
+            self.cliente.requisitar("GET", f"/documentos/{digest}", ao_responder=lambda resposta:
+                                    ArmazemDocumentos.ingerir_fluxo(self, resposta, esperado=digest))
+        except ErroServidor as erro:
+            if erro.status != 404:
+                raise
+
+    def _enviar(self, digest):
+        if self._no_servidor(digest):
+            return
+        caminho = self.caminho(digest)
+        with open(caminho, "rb") as f:
+            self.cliente.requisitar("PUT", f"/documentos/{digest}", f, {
+                "Content-Length": str(os.path.getsize(caminho)),
+                "Content-Type": "application/octet-stream",
+            })
+
+    def caminho_documento(self, referencia):
+        digest = digest_documento(referencia)
+        if digest is not None:
+            self._baixar(digest)
+        return super().caminho_documento(referencia)
+
+    def caminho_para_abrir(self, referencia):
+        digest = digest_documento(referencia)
+        if digest is not None:
+            self._baixar(digest)
+        return super().caminho_para_abrir(referencia)
+
+    def ingerir(self, origem, mover=False, progresso=None):
+        digest, tamanho = super().ingerir(origem, mover, progresso)
+        self._enviar(digest)
+        return digest, tamanho
+
+    def ingerir_fluxo(self, fluxo, progresso=None, esperado=None):
+        digest, tamanho = super().ingerir_fluxo(fluxo, progresso, esperado)
+        self._enviar(digest)
+        return digest, tamanho
+
+    # O servidor só apaga o blob se nenhum projeto o referencia (409 se algum
+    # outro cliente acabou de anexá-lo); a cópia local sai de qualquer forma
+    def remover(self, digest):
+        try:
+            self.cliente.requisitar("DELETE", f"/documentos/{digest}")
+        except ErroServidor as erro:
+            if erro.status not in (404, 409):
+                raise
+        super().remover(digest)
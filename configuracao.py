@@ -0,0 +1,79 @@
+import os
+
+DATA_FILE = "projetos.json"
+SQLITE_FILE = "projetos.db"
+DOCUMENTOS_DIR = "documentos"
+
+# Backend de armazenamento dos projetos:
+#   "json"   - reescreve projetos.json inteiro a cada alteração (formato original)
+#   "diario" - acrescenta um registro por alteração em projetos.json.diario
+#   "sqlite" - tabelas indexadas em projetos.db (migradas do projetos.json na primeira execução)
+#   "remoto" - projetos e documentos no servidor local em PROJETOS_SERVIDOR (ver servidor.py)
+BACKEND = os.environ.get("PROJETOS_BACKEND", "json")
+
+# Tamanho do diário (em bytes) a partir do qual ele é compactado em segundo plano
+LIMITE_DIARIO = int(os.environ.get("PROJETOS_LIMITE_DIARIO", 4 * 1024 * 1024))
+
+# Várias instâncias podem usar os mesmos dados: as gravações dos backends json
+# e diario são serializadas por uma trava no arquivo <dados>.lock, esperada
+# por até PROJETOS_TEMPO_TRAVA segundos (o SQLite usa as próprias travas)
+TEMPO_TRAVA = float(os.environ.get("PROJETOS_TEMPO_TRAVA", 30))
+
+# Servidor local (manage.py serve): um processo mantém os projetos em memória
+# e atende vários clientes por HTTP/JSON, só em localhost por padrão. Os
+# clientes (PROJETOS_BACKEND=remoto) usam até CONEXOES_CLIENTE conexões
+# mantidas abertas e guardam os documentos baixados em DOCUMENTOS_CACHE_DIR.
+SERVIDOR_HOST = os.environ.get("PROJETOS_SERVIDOR_HOST", "127.0.0.1")
+SERVIDOR_PORTA = int(os.environ.get("PROJETOS_SERVIDOR_PORTA", 8765))
+SERVIDOR_URL = os.environ.get("PROJETOS_SERVIDOR", f"http://{SERVIDOR_HOST}:{SERVIDOR_PORTA}")
+CONEXOES_CLIENTE = int(os.environ.get("PROJETOS_CONEXOES_CLIENTE", 4))
+DOCUMENTOS_CACHE_DIR = "documentos_cache"
+
+# Gravação adiada: as alterações ficam na memória e são gravadas juntas, numa
+# única transação, depois de PROJETOS_ATRASO_GRAVACAO segundos sem novas
+# alterações (no máximo ATRASO_MAXIMO_GRAVACAO segundos depois da primeira),
+# ao salvar explicitamente ou ao fechar. 0 grava cada alteração na hora.
+ATRASO_GRAVACAO = float(os.environ.get("PROJETOS_ATRASO_GRAVACAO", 0.5))
+ATRASO_MAXIMO_GRAVACAO = float(os.environ.get("PROJETOS_ATRASO_MAXIMO_GRAVACAO", 5))
+
+# Compressão dos documentos nos ZIPs exportados: "auto" (sem compressão para
+# PDFs, imagens e outros formatos já comprimidos, nível 6 para o resto) ou um
+# nível de 0 (STORED) a 9
+NIVEL_COMPRESSAO = os.environ.get("PROJETOS_NIVEL_COMPRESSAO", "auto")
+
+# Threads usadas para comprimir na exportação (0 = uma por núcleo)
+THREADS_EXPORTACAO = int(os.environ.get("PROJETOS_THREADS_EXPORTACAO", 0))
+
+# Relatório PDF: processos que renderizam em paralelo (0 = um por núcleo) e
+# quantos projetos cada processo renderiza por vez
+PROCESSOS_RELATORIO = int(os.environ.get("PROJETOS_PROCESSOS_RELATORIO", 0))
+TAMANHO_LOTE_RELATORIO = int(os.environ.get("PROJETOS_LOTE_RELATORIO", 50))
+
+# Entrada de despesas a partir de NF-e (XML) e CSV: processos que leem os
+# arquivos (0 = um por núcleo) e quantas despesas, no máximo, cada lote
+# gravado de uma vez no projeto reúne
+PROCESSOS_INGESTAO = int(os.environ.get("PROJETOS_PROCESSOS_INGESTAO", 0))
+LOTE_INGESTAO = int(os.environ.get("PROJETOS_LOTE_INGESTAO", 1000))
+
+# Cache dos fragmentos do relatório (um por conteúdo de projeto) e seu
+# tamanho máximo em MB; os menos usados recentemente são apagados
+CACHE_RELATORIO_DIR = "cache_relatorio"
+LIMITE_CACHE_RELATORIO = int(os.environ.get("PROJETOS_CACHE_RELATORIO_MB", 256)) * 1024 * 1024
+
+# Verificação do armazém de documentos (ver manutencao.py): threads que
+# varrem e conferem os arquivos (0 = duas por núcleo, o tempo é quase todo de
+# espera pelo disco) e idade mínima, em horas, de um blob sem referência para
+# que seja apagado (um anexo recém-copiado só ganha a referência depois da cópia)
+THREADS_MANUTENCAO = int(os.environ.get("PROJETOS_THREADS_MANUTENCAO", 0))
+IDADE_MINIMA_ORFAO = float(os.environ.get("PROJETOS_IDADE_MINIMA_ORFAO_H", 1)) * 3600
+
+# Instrumentação dos caminhos quentes (ver instrumentacao.py): desligada por
+# padrão, ligada com PROJETOS_INSTRUMENTACAO=1 ou pelo painel de diagnóstico.
+# Os eventos vão para um log JSON com rotação (tamanho em MB e cópias
+# mantidas); pausas da interface acima do limiar (ms) são registradas.
+INSTRUMENTACAO = os.environ.get("PROJETOS_INSTRUMENTACAO", "0") not in ("", "0")
+LOG_INSTRUMENTACAO = os.environ.get("PROJETOS_LOG_INSTRUMENTACAO", "instrumentacao.log")
+LIMITE_LOG_INSTRUMENTACAO = int(os.environ.get("PROJETOS_LOG_INSTRUMENTACAO_MB", 5)) * 1024 * 1024
+COPIAS_LOG_INSTRUMENTACAO = 3
+LIMIAR_TRAVAMENTO_MS = int(os.environ.get("PROJETOS_LIMIAR_TRAVAMENTO_MS", 100))
+PERFIS_DIR = "perfis"
@@ -0,0 +1,146 @@
+import os
+import time
+
+from PyQt6.QtCore import QObject, QTimer
+from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, QCheckBox, QPushButton, QTableWidget,
+                             QTableWidgetItem, QHeaderView)
+
+import instrumentacao
+from configuracao import LOG_INSTRUMENTACAO, LIMIAR_TRAVAMENTO_MS
+
+# Intervalo do pulso que mede as pausas da fila de eventos da interface
+INTERVALO_PULSO_MS = 50
+# Eventos recentes exibidos no painel
+EVENTOS_EXIBIDOS = 200
+
+
+# Detecta travamentos da interface: um QTimer dispara a cada
+# INTERVALO_PULSO_MS na thread da interface; se um disparo chega atrasado
+# mais que LIMIAR_TRAVAMENTO_MS, a fila de eventos ficou parada esse tempo
+# (uma operação demorada na thread da interface) e o atraso é registrado.
+# O pulso só roda com a instrumentação ligada: desligada, a interface não
+# acorda a cada INTERVALO_PULSO_MS à toa.
+class MonitorTravamentos(QObject):
+    def __init__(self, parent=None, limiar_ms=LIMIAR_TRAVAMENTO_MS):
+        super().__init__(parent)
+        self.limiar_ms = limiar_ms
+        self._ultimo = time.perf_counter()
+        self.temporizador = QTimer(self)
+        self.temporizador.setInterval(INTERVALO_PULSO_MS)
+        self.temporizador.timeout.connect(self._pulso)
+        instrumentacao.observar(self._ao_ligar)
+        self._ao_ligar(instrumentacao.ativa())
+
+    def _ao_ligar(self, ativa):
+        if ativa and not self.temporizador.isActive():
+            self._ultimo = time.perf_counter()
+            self.temporizador.start()
+        elif not ativa:
+            self.temporizador.stop()
+
+    def _pulso(self):
+        agora = time.perf_counter()
+        atraso = (agora - self._ultimo) * 1000 - INTERVALO_PULSO_MS
+        self._ultimo = agora
+        if atraso > self.limiar_ms:
+            instrumentacao.registrar("interface.travamento", atraso)
+
+
+def _item(texto):
+    return QTableWidgetItem(str(texto))
+
+
+# Aba de diagnóstico: liga e desliga a instrumentação, mostra os totais por
+# medição e os últimos eventos, e arma o perfil (cProfile + tracemalloc) da
+# próxima ação. Só é atualizada com a aba visível.
+class PainelDiagnostico(QWidget):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        layout = QVBoxLayout(self)
+
+        controles = QHBoxLayout()
+        self.ativa_check = QCheckBox("Instrumentação ligada")
+        self.ativa_check.setChecked(instrumentacao.ativa())
+        self.ativa_check.toggled.connect(instrumentacao.ativar)
+        controles.addWidget(self.ativa_check)
+        self.perfil_button = QPushButton("Perfilar próxima ação")
+        self.perfil_button.clicked.connect(self.armar_perfil)
+        controles.addWidget(self.perfil_button)
+        limpar_button = QPushButton("Limpar")
+        limpar_button.clicked.connect(self.limpar)
+        controles.addWidget(limpar_button)
+        controles.addStretch()
+        layout.addLayout(controles)
+
+        self.log_label = QLabel(f"Log: {os.path.abspath(LOG_INSTRUMENTACAO)}")
+        layout.addWidget(self.log_label)
+        self.perfil_label = QLabel()
+        layout.addWidget(self.perfil_label)
+
+        layout.addWidget(QLabel("Totais por medição"))
+        self.tabela_totais = self._tabela(("Medição", "Quantidade", "Total (ms)", "Média (ms)", "Máximo (ms)",
+                                           "Bytes"))
+        layout.addWidget(self.tabela_totais)
+        layout.addWidget(QLabel("Eventos recentes"))
+        self.tabela_eventos = self._tabela(("Hora", "Medição", "ms", "Bytes", "Detalhes"))
+        layout.addWidget(self.tabela_eventos)
+
+        self.temporizador = QTimer(self)
+        self.temporizador.setInterval(1000)
+        self.temporizador.timeout.connect(self.atualizar)
+
+    @staticmethod
+    def _tabela(cabecalhos):
+        tabela = QTableWidget(0, len(cabecalhos))
+        tabela.setHorizontalHeaderLabels(cabecalhos)
+        tabela.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        tabela.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        return tabela
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.atualizar()
+        self.temporizador.start()
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.temporizador.stop()
+
+    def armar_perfil(self):
+        instrumentacao.armar_perfil()
+        self.ativa_check.setChecked(True)
+        self.atualizar()
+
+    def limpar(self):
+        instrumentacao.limpar()
+        self.atualizar()
+
+    @staticmethod
+    def _preencher(tabela, linhas):
+        tabela.setRowCount(len(linhas))
+        for i, linha in enumerate(linhas):
+            for j, valor in enumerate(linha):
+                tabela.setItem(i, j, _item(valor))
+
+    def atualizar(self):
+        if instrumentacao.perfil_armado():
+            self.perfil_label.setText("Perfil armado: a próxima ação medida será perfilada")
+        elif instrumentacao.ultimo_perfil():
+            self.perfil_label.setText(f"Último perfil: {os.path.abspath(instrumentacao.ultimo_perfil())}")
+        else:
+            self.perfil_label.setText("Nenhum perfil capturado")
+
+        totais = sorted(instrumentacao.totais().items(), key=lambda item: -item[1]["ms"])
+        self._preencher(self.tabela_totais, [
+            (nome, t["quantidade"], f"{t['ms']:.1f}", f"{t['ms'] / t['quantidade']:.1f}", f"{t['maximo_ms']:.1f}",
+             t["bytes"] or "")
+            for nome, t in totais
+        ])
+
+        linhas = []
+        for evento in reversed(instrumentacao.eventos_recentes()[-EVENTOS_EXIBIDOS:]):
+            detalhes = {chave: valor for chave, valor in evento.items()
+                        if chave not in ("ts", "evento", "ms", "bytes")}
+            linhas.append((evento["ts"][11:], evento["evento"], evento.get("ms", ""), evento.get("bytes", ""),
+                           ", ".join(f"{chave}={valor}" for chave, valor in detalhes.items())))
+        self._preencher(self.tabela_eventos, linhas)
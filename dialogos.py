@@ -0,0 +1,151 @@
+from PyQt6.QtGui import QGuiApplication, QKeySequence, QShortcut
+from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QFormLayout, QComboBox, QCheckBox, QRadioButton,
+                             QDialogButtonBox, QLabel, QPushButton, QTableWidget, QTableWidgetItem, QHeaderView,
+                             QMessageBox)
+
+from configuracao import NIVEL_COMPRESSAO
+from ingestao import converter_valor
+
+
+# Opções da exportação em lote: um ZIP por projeto ou um único ZIP, nível de
+# compressão e exportação incremental
+class DialogoExportacao(QDialog):
+    NIVEIS = (
+        ("Automático (sem compressão para PDFs e imagens)", "auto"),
+        ("Sem compressão (STORED)", 0),
+        ("Rápida (1)", 1),
+        ("Padrão (6)", 6),
+        ("Máxima (9)", 9),
+    )
+
+    def __init__(self, quantidade, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Exportar Projetos")
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel(f"{quantidade} projeto(s) selecionado(s)"))
+
+        self.por_projeto_radio = QRadioButton("Um arquivo ZIP por projeto (em uma pasta)")
+        self.combinado_radio = QRadioButton("Um único arquivo ZIP com todos os projetos")
+        self.por_projeto_radio.setChecked(quantidade > 1)
+        self.combinado_radio.setChecked(quantidade <= 1)
+        layout.addWidget(self.por_projeto_radio)
+        layout.addWidget(self.combinado_radio)
+
+        formulario = QFormLayout()
+        self.nivel_combo = QComboBox()
+        for texto, nivel in self.NIVEIS:
+            self.nivel_combo.addItem(texto, nivel)
+        indice = self.nivel_combo.findData(NIVEL_COMPRESSAO if NIVEL_COMPRESSAO == "auto" else int(NIVEL_COMPRESSAO))
+        self.nivel_combo.setCurrentIndex(max(indice, 0))
+        formulario.addRow("Compressão:", self.nivel_combo)
+        layout.addLayout(formulario)
+
+        self.incremental_check = QCheckBox("Somente documentos novos ou alterados desde a última exportação")
+        layout.addWidget(self.incremental_check)
+
+        botoes = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
+        botoes.accepted.connect(self.accept)
+        botoes.rejected.connect(self.reject)
+        layout.addWidget(botoes)
+
+    def combinado(self):
+        return self.combinado_radio.isChecked()
+
+    def nivel(self):
+        return self.nivel_combo.currentData()
+
+    def incremental(self):
+        return self.incremental_check.isChecked()
+
+
+# Entrada de várias despesas de uma vez: linhas digitadas na tabela ou
+# coladas da área de transferência (colunas separadas por tabulação, como
+# saem de uma planilha, na ordem nome, descrição, valor e NF-e)
+class DialogoDespesas(QDialog):
+    COLUNAS = ("nome", "descricao", "valor", "nfe")
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Adicionar Várias Despesas")
+        self.resize(700, 400)
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel("Digite as despesas ou cole linhas de uma planilha (Nome, Descrição, Valor, NF-e)."))
+
+        self.tabela = QTableWidget(1, len(self.COLUNAS))
+        self.tabela.setHorizontalHeaderLabels(("Nome", "Descrição", "Valor", "NF-e"))
+        self.tabela.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        layout.addWidget(self.tabela)
+        QShortcut(QKeySequence.StandardKey.Paste, self.tabela, activated=self.colar)
+
+        acoes = QHBoxLayout()
+        adicionar_linha = QPushButton("Adicionar Linha")
+        adicionar_linha.clicked.connect(lambda: self.tabela.insertRow(self.tabela.rowCount()))
+        acoes.addWidget(adicionar_linha)
+        remover_linhas = QPushButton("Remover Linhas Selecionadas")
+        remover_linhas.clicked.connect(self.remover_linhas)
+        acoes.addWidget(remover_linhas)
+        colar = QPushButton("Colar")
+        colar.clicked.connect(self.colar)
+        acoes.addWidget(colar)
+        layout.addLayout(acoes)
+
+        botoes = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
+        botoes.accepted.connect(self.validar)
+        botoes.rejected.connect(self.reject)
+        layout.addWidget(botoes)
+        self._despesas = []
+
+    def _linha_vazia(self, linha):
+        return all(not self._texto(linha, coluna) for coluna in range(len(self.COLUNAS)))
+
+    def _texto(self, linha, coluna):
+        item = self.tabela.item(linha, coluna)
+        return item.text().strip() if item is not None else ""
+
+    # Cola a partir da célula atual, sobrescrevendo as linhas vazias e
+    # acrescentando as que faltarem
+    def colar(self, texto=None):
+        if texto is None:
+            texto = QGuiApplication.clipboard().text()
+        linhas = [linha.split("\t") for linha in texto.splitlines() if linha.strip()]
+        if not linhas:
+            return
+        inicio = max(self.tabela.currentRow(), 0)
+        while inicio > 0 and self._linha_vazia(inicio - 1):
+            inicio -= 1
+        if self.tabela.rowCount() < inicio + len(linhas):
+            self.tabela.setRowCount(inicio + len(linhas))
+        for i, campos in enumerate(linhas):
+            for coluna, valor in enumerate(campos[:len(self.COLUNAS)]):
+                self.tabela.setItem(inicio + i, coluna, QTableWidgetItem(valor.strip()))
+
+    def remover_linhas(self):
+        for linha in sorted({indice.row() for indice in self.tabela.selectedIndexes()}, reverse=True):
+            self.tabela.removeRow(linha)
+
+    # Converte as linhas preenchidas; uma linha inválida mantém o diálogo
+    # aberto com a célula selecionada
+    def validar(self):
+        despesas = []
+        for linha in range(self.tabela.rowCount()):
+            if self._linha_vazia(linha):
+                continue
+            despesa = {campo: self._texto(linha, coluna) for coluna, campo in enumerate(self.COLUNAS)}
+            erro, coluna = None, None
+            if not despesa["nome"]:
+                erro, coluna = "informe o nome", 0
+            else:
+                try:
+                    despesa["valor"] = converter_valor(despesa["valor"])
+                except ValueError:
+                    erro, coluna = f"valor inválido: {despesa['valor']!r}", 2
+            if erro is not None:
+                self.tabela.setCurrentCell(linha, coluna)
+                QMessageBox.warning(self, "Despesa inválida", f"Linha {linha + 1}: {erro}")
+                return
+            despesas.append(despesa)
+        self._despesas = despesas
+        self.accept()
+
+    def despesas(self):
+        return self._despesas
@@ -0,0 +1,255 @@
+import hashlib
+import os
+import shutil
+import stat
+import tempfile
+
+from configuracao import DOCUMENTOS_DIR, BACKEND
+from armazenamento import TIPOS_DOCUMENTO
+from instrumentacao import instrumentado
+
+TAMANHO_BLOCO = 1024 * 1024
+
+# ioctl do Linux que clona um arquivo por reflink (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+
+# Conteúdo lido não confere com o digest ou tamanho esperado
+class DocumentoCorrompido(ValueError):
+    pass
+
+
+# Referências a documentos nas listas dos projetos. As antigas são o nome de um
+# arquivo solto em documentos/; as novas apontam para um blob pelo digest.
+def criar_referencia(nome, digest, tamanho):
+    return {"nome": nome, "sha256": digest, "tamanho": tamanho}
+
+
+def nome_documento(referencia):
+    return referencia if isinstance(referencia, str) else referencia["nome"]
+
+
+def digest_documento(referencia):
+    return None if isinstance(referencia, str) else referencia["sha256"]
+
+
+def _clonar(origem, destino):
+    # Cópia copy-on-write; devolve False se o sistema de arquivos não suportar
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    with open(origem, 'rb') as fo, open(destino, 'wb') as fd:
+        try:
+            fcntl.ioctl(fd.fileno(), FICLONE, fo.fileno())
+        except OSError:
+            return False
+    return True
+
+
+# progresso, quando informado, é chamado com o número de bytes de cada bloco
+# lido e pode interromper a operação lançando uma exceção
+def hash_arquivo(caminho, progresso=None):
+    h = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(TAMANHO_BLOCO), b""):
+            h.update(bloco)
+            if progresso is not None:
+                progresso(len(bloco))
+    return h.hexdigest()
+
+
+# Armazém de documentos endereçado por conteúdo: cada conteúdo é gravado uma
+# única vez em documentos/blobs/ab/cd/<sha256>, somente leitura, e os projetos
+# guardam o digest mais o nome de exibição. Nomes repetidos não colidem, e o
+# mesmo arquivo anexado a vários projetos ocupa espaço uma vez só.
+class ArmazemDocumentos:
+    def __init__(self, raiz=DOCUMENTOS_DIR):
+        self.raiz = raiz
+        self.dir_blobs = os.path.join(raiz, "blobs")
+        self.dir_temporario = os.path.join(self.dir_blobs, "tmp")
+        self.dir_abertos = os.path.join(raiz, "abertos")
+        os.makedirs(self.dir_temporario, exist_ok=True)
+
+    def caminho(self, digest):
+        return os.path.join(self.dir_blobs, digest[:2], digest[2:4], digest)
+
+    def existe(self, digest):
+        return os.path.exists(self.caminho(digest))
+
+    def caminho_documento(self, referencia):
+        digest = digest_documento(referencia)
+        if digest is None:
+            return os.path.join(self.raiz, referencia)
+        return self.caminho(digest)
+
+    def _temporario(self):
+        fd, caminho = tempfile.mkstemp(dir=self.dir_temporario)
+        os.close(fd)
+        return caminho
+
+    def _guardar(self, temporario, digest):
+        destino = self.caminho(digest)
+        if os.path.exists(destino):
+            # Conteúdo já armazenado: descarta a cópia nova e renova a data do
+            # blob, que a limpeza de órfãos (ver manutencao.py) não apaga se recente
+            os.remove(temporario)
+            os.utime(destino)
+        else:
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            os.chmod(temporario, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            os.replace(temporario, destino)
+        return destino
+
+    # Grava o conteúdo de um arquivo no armazém e devolve (digest, tamanho).
+    # Com mover=True o arquivo de origem (nosso, ex.: extraído de um ZIP) é
+    # movido em vez de copiado; arquivos dentro do próprio documentos/ são
+    # ligados por hardlink; nos demais tenta-se reflink antes da cópia.
+    @instrumentado("documentos.copiar", lambda r: {"bytes": r[1]})
+    def ingerir(self, origem, mover=False, progresso=None):
+        tamanho = os.path.getsize(origem)
+        temporario = self._temporario()
+        try:
+            if mover:
+                os.replace(origem, temporario)
+                digest = hash_arquivo(temporario, progresso)
+            elif self._dentro_do_armazem(origem) and self._ligar(origem, temporario):
+                digest = hash_arquivo(temporario, progresso)
+            elif _clonar(origem, temporario):
+                digest = hash_arquivo(temporario, progresso)
+            else:
+                with open(origem, 'rb') as f:
+                    digest, tamanho = self._copiar_fluxo(f, temporario, progresso)
+        except BaseException:
+            self._descartar(temporario)
+            raise
+        self._guardar(temporario, digest)
+        return digest, tamanho
+
+    # Mesmo que ingerir(), mas a partir de um objeto arquivo (ex.: membro de ZIP).
+    # Com esperado (digest), um conteúdo diferente é descartado e gera
+    # DocumentoCorrompido, sem entrar no armazém.
+    @instrumentado("documentos.copiar", lambda r: {"bytes": r[1]})
+    def ingerir_fluxo(self, fluxo, progresso=None, esperado=None):
+        temporario = self._temporario()
+        try:
+            digest, tamanho = self._copiar_fluxo(fluxo, temporario, progresso)
+            if esperado is not None and digest != esperado:
+                raise DocumentoCorrompido(f"conteúdo com sha256 {digest}, esperado {esperado}")
+        except BaseException:
+            self._descartar(temporario)
+            raise
+        self._guardar(temporario, digest)
+        return digest, tamanho
+
+    def _copiar_fluxo(self, fluxo, temporario, progresso=None):
+        # Calcula o digest enquanto copia, lendo a origem uma única vez
+        h = hashlib.sha256()
+        tamanho = 0
+        with open(temporario, 'wb') as destino:
+            for bloco in iter(lambda: fluxo.read(TAMANHO_BLOCO), b""):
+                h.update(bloco)
+                destino.write(bloco)
+                tamanho += len(bloco)
+                if progresso is not None:
+                    progresso(len(bloco))
+        return h.hexdigest(), tamanho
+
+    def _descartar(self, temporario):
+        if os.path.exists(temporario):
+            os.remove(temporario)
+
+    def _dentro_do_armazem(self, origem):
+        raiz = os.path.abspath(self.raiz)
+        return os.path.commonpath([raiz, os.path.abspath(origem)]) == raiz
+
+    def _ligar(self, origem, temporario):
+        os.remove(temporario)
+        try:
+            os.link(origem, temporario)
+        except OSError:
+            open(temporario, 'wb').close()
+            return False
+        return True
+
+    def remover(self, digest):
+        caminho = self.caminho(digest)
+        if os.path.exists(caminho):
+            # No Windows arquivos somente leitura não podem ser apagados
+            os.chmod(caminho, stat.S_IWUSR | stat.S_IRUSR)
+            os.remove(caminho)
+        # As cópias expostas para abrir apontam para o mesmo conteúdo
+        shutil.rmtree(os.path.join(self.dir_abertos, digest), ignore_errors=True)
+
+    # Os blobs não têm extensão: para abrir, expõe o documento com o nome de
+    # exibição (hardlink somente leitura, ou cópia se não houver suporte)
+    def caminho_para_abrir(self, referencia):
+        digest = digest_documento(referencia)
+        if digest is None:
+            return os.path.join(self.raiz, referencia)
+        destino = os.path.join(self.dir_abertos, digest, os.path.basename(referencia["nome"]))
+        if not os.path.exists(destino) and self.existe(digest):
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            try:
+                os.link(self.caminho(digest), destino)
+            except OSError:
+                shutil.copyfile(self.caminho(digest), destino)
+        return destino
+
+
+# Referências antigas (arquivos soltos em documentos/) cujo arquivo ainda
+# existe: {nome: caminho}. Só lê os projetos; a cópia é feita por
+# tarefa_migrar_documentos e a troca das referências por aplicar_migracao
+def documentos_legados(repositorio, armazem):
+    legados = {}
+    for projeto in repositorio.projetos():
+        for tipo in TIPOS_DOCUMENTO:
+            for referencia in projeto[tipo]:
+                if isinstance(referencia, str) and referencia not in legados:
+                    caminho = armazem.caminho_documento(referencia)
+                    if os.path.exists(caminho):
+                        legados[referencia] = caminho
+    return legados
+
+
+# Copia os arquivos soltos para o armazém (fora da thread da interface):
+# {nome: referência ao blob}
+def tarefa_migrar_documentos(tarefa, armazem, legados):
+    tarefa.definir_total(len(legados))
+    referencias = {}
+    for nome, caminho in legados.items():
+        digest, tamanho = armazem.ingerir(caminho)
+        referencias[nome] = criar_referencia(nome, digest, tamanho)
+        tarefa.avancar(1)
+    return referencias
+
+
+# Troca as referências antigas copiadas pelas novas, só nas listas em que
+# alguma mudou, e apaga os arquivos soltos migrados
+def aplicar_migracao(repositorio, legados, referencias):
+    for projeto in list(repositorio.projetos()):
+        for tipo in TIPOS_DOCUMENTO:
+            if not any(isinstance(ref, str) and ref in referencias for ref in projeto[tipo]):
+                continue
+            novas = [referencias.get(ref, ref) if isinstance(ref, str) else ref for ref in projeto[tipo]]
+            repositorio.atualizar_projeto(projeto["id"], {tipo: novas})
+    # As novas referências são gravadas antes de apagar os arquivos soltos
+    repositorio.salvar()
+    for nome in referencias:
+        os.remove(legados[nome])
+    return len(referencias)
+
+
+_armazem = None
+
+
+def obter_armazem():
+    global _armazem
+    if _armazem is None:
+        if BACKEND == "remoto":
+            # Modo cliente: os documentos ficam no servidor, com um cache local
+            from cliente import ArmazemRemoto
+            _armazem = ArmazemRemoto()
+        else:
+            _armazem = ArmazemDocumentos()
+    return _armazem
@@ -0,0 +1,412 @@
+import json
+import os
+import re
+import tempfile
+import time
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from configuracao import NIVEL_COMPRESSAO, THREADS_EXPORTACAO
+from armazenamento import TIPOS_DOCUMENTO, gravar_atomico
+from documentos import (TAMANHO_BLOCO, DocumentoCorrompido, obter_armazem, criar_referencia, nome_documento,
+                        digest_documento)
+from instrumentacao import instrumentado
+from modelo import para_json
+
+# Formatos que já são comprimidos: no nível "auto" vão sem compressão (STORED)
+EXTENSOES_COMPRIMIDAS = {
+    ".pdf", ".jpg", ".jpeg", ".png", ".gif", ".webp", ".zip", ".gz", ".bz2", ".xz", ".7z", ".rar",
+    ".docx", ".xlsx", ".pptx", ".odt", ".ods", ".mp3", ".mp4",
+}
+NIVEL_PADRAO = 6
+
+# Nome de cada documento dentro do ZIP, por digest (ou pelo nome, nas referências antigas)
+MEMBRO_DOCUMENTOS = "documentos.json"
+# Digests já exportados para uma pasta, por arquivo, usado na exportação incremental
+MANIFESTO_EXPORTACAO = ".exportacao.json"
+
+
+# Método e nível de compressão de um membro. nivel é "auto" ou de 0 a 9,
+# sendo 0 sem compressão
+def metodo_compressao(nome, nivel):
+    if nivel == "auto":
+        if os.path.splitext(nome)[1].lower() in EXTENSOES_COMPRIMIDAS:
+            return zipfile.ZIP_STORED, None
+        return zipfile.ZIP_DEFLATED, NIVEL_PADRAO
+    nivel = int(nivel)
+    if nivel == 0:
+        return zipfile.ZIP_STORED, None
+    return zipfile.ZIP_DEFLATED, nivel
+
+
+def nome_arquivo_projeto(projeto):
+    nome = re.sub(r"[^\w.-]+", "_", projeto["nome"]).strip("_") or "projeto"
+    return f"{nome}-{projeto['id'][:8]}"
+
+
+def _chave_documento(referencia):
+    return digest_documento(referencia) or nome_documento(referencia)
+
+
+# Documentos existentes do projeto: (chave, caminho no armazém, nome no ZIP).
+# Nomes de exibição repetidos com conteúdos diferentes ganham o início do
+# digest como prefixo; o mesmo conteúdo entra uma vez só.
+def documentos_do_projeto(projeto):
+    armazem = obter_armazem()
+    documentos = []
+    chaves = set()
+    nomes = set()
+    for tipo in TIPOS_DOCUMENTO:
+        for referencia in projeto[tipo]:
+            chave = _chave_documento(referencia)
+            caminho = armazem.caminho_documento(referencia)
+            if chave in chaves or not os.path.exists(caminho):
+                continue
+            nome = os.path.basename(nome_documento(referencia))
+            if nome in nomes or nome in (MEMBRO_DOCUMENTOS, "projeto.json"):
+                nome = f"{chave[:8]}_{nome}"
+            chaves.add(chave)
+            nomes.add(nome)
+            documentos.append((chave, caminho, nome))
+    return documentos
+
+
+# Comprime um arquivo em deflate bruto num temporário, calculando o CRC na
+# mesma leitura. Roda nas threads do pool (o zlib libera o GIL).
+def _comprimir(caminho, nivel, progresso, pasta_temporaria):
+    compressor = zlib.compressobj(nivel, zlib.DEFLATED, -15)
+    crc = 0
+    tamanho = 0
+    fd, temporario = tempfile.mkstemp(dir=pasta_temporaria)
+    try:
+        with open(caminho, 'rb') as origem, os.fdopen(fd, 'wb') as destino:
+            for bloco in iter(lambda: origem.read(TAMANHO_BLOCO), b""):
+                crc = zlib.crc32(bloco, crc)
+                tamanho += len(bloco)
+                destino.write(compressor.compress(bloco))
+                if progresso is not None:
+                    progresso(len(bloco))
+            destino.write(compressor.flush())
+    except BaseException:
+        os.remove(temporario)
+        raise
+    return temporario, crc, tamanho, os.path.getsize(temporario)
+
+
+# Acrescenta ao ZIP um membro já comprimido: grava o cabeçalho local com CRC e
+# tamanhos conhecidos e copia os dados, como faz o próprio zipfile ao fechar
+# um membro aberto com open(..., 'w')
+def _anexar_comprimido(zipf, nome, temporario, crc, tamanho, tamanho_comprimido):
+    zinfo = zipfile.ZipInfo(nome, date_time=time.localtime()[:6])
+    zinfo.compress_type = zipfile.ZIP_DEFLATED
+    zinfo.external_attr = 0o644 << 16
+    zinfo.CRC = crc
+    zinfo.file_size = tamanho
+    zinfo.compress_size = tamanho_comprimido
+    zinfo.header_offset = zipf.fp.tell()
+    zipf.fp.write(zinfo.FileHeader())
+    with open(temporario, 'rb') as origem:
+        for bloco in iter(lambda: origem.read(TAMANHO_BLOCO), b""):
+            zipf.fp.write(bloco)
+    os.remove(temporario)
+    zipf.start_dir = zipf.fp.tell()
+    zipf.filelist.append(zinfo)
+    zipf.NameToInfo[nome] = zinfo
+    zipf._didModify = True
+
+
+def _gravar_armazenado(zipf, caminho, nome, progresso):
+    zinfo = zipfile.ZipInfo(nome, date_time=time.localtime()[:6])
+    zinfo.compress_type = zipfile.ZIP_STORED
+    zinfo.external_attr = 0o644 << 16
+    zinfo.file_size = os.path.getsize(caminho)
+    with open(caminho, 'rb') as origem, zipf.open(zinfo, 'w') as destino:
+        for bloco in iter(lambda: origem.read(TAMANHO_BLOCO), b""):
+            destino.write(bloco)
+            if progresso is not None:
+                progresso(len(bloco))
+
+
+def _descartar_pendentes(pendentes):
+    for _, _, futuro in pendentes:
+        if futuro is None or futuro.cancel():
+            continue
+        try:
+            temporario = futuro.result()[0]
+        except BaseException:
+            continue
+        os.remove(temporario)
+
+
+# Grava os membros na ordem, enquanto os próximos (até uma janela) são
+# comprimidos em paralelo; membros STORED são copiados direto pela thread que
+# escreve. Nenhum arquivo é lido inteiro para a memória.
+def _gravar_membros(zipf, membros, nivel, compressores, janela, progresso, pasta_temporaria):
+    pendentes = deque()
+    restantes = iter(membros)
+
+    def agendar():
+        while len(pendentes) < janela:
+            try:
+                caminho, nome = next(restantes)
+            except StopIteration:
+                return
+            metodo, nivel_membro = metodo_compressao(nome, nivel)
+            futuro = None
+            if metodo == zipfile.ZIP_DEFLATED:
+                futuro = compressores.submit(_comprimir, caminho, nivel_membro, progresso, pasta_temporaria)
+            pendentes.append((caminho, nome, futuro))
+
+    try:
+        agendar()
+        while pendentes:
+            caminho, nome, futuro = pendentes.popleft()
+            if futuro is None:
+                _gravar_armazenado(zipf, caminho, nome, progresso)
+            else:
+                _anexar_comprimido(zipf, nome, *futuro.result())
+            agendar()
+    except BaseException:
+        _descartar_pendentes(pendentes)
+        raise
+
+
+# entradas: (pasta no ZIP, projeto, documentos a incluir). Um documento
+# presente em vários projetos do mesmo ZIP é gravado uma vez só, na pasta do
+# primeiro; o documentos.json de cada pasta aponta para o membro certo. O ZIP
+# é montado em <nome>.tmp e só substitui o destino quando está completo.
+def _exportar_arquivo(nome_arquivo_zip, entradas, nivel, compressores, janela, progresso):
+    pasta_temporaria = tempfile.mkdtemp(prefix=".exportacao-", dir=os.path.dirname(os.path.abspath(nome_arquivo_zip)))
+    temporario = nome_arquivo_zip + ".tmp"
+    try:
+        with zipfile.ZipFile(temporario, 'w', zipfile.ZIP_DEFLATED) as zipf:
+            gravados = {}
+            for pasta, projeto, documentos in entradas:
+                novos = [(chave, caminho, pasta + nome) for chave, caminho, nome in documentos if chave not in gravados]
+                gravados.update((chave, membro) for chave, _, membro in novos)
+                zipf.writestr(pasta + 'projeto.json', json.dumps(para_json(projeto), indent=4))
+                zipf.writestr(pasta + MEMBRO_DOCUMENTOS,
+                              json.dumps({chave: gravados[chave] for chave, _, _ in documentos}, indent=4))
+                _gravar_membros(zipf, [(caminho, membro) for _, caminho, membro in novos],
+                                nivel, compressores, janela, progresso, pasta_temporaria)
+        os.replace(temporario, nome_arquivo_zip)
+    except BaseException:
+        # Exportação cancelada ou com erro: não deixa um ZIP pela metade, e
+        # o que já estava no destino continua lá
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+    finally:
+        for nome in os.listdir(pasta_temporaria):
+            os.remove(os.path.join(pasta_temporaria, nome))
+        os.rmdir(pasta_temporaria)
+
+
+# O manifesto guarda os digests de cada arquivo gravado por uma exportação
+# incremental ({"arquivos": {nome do ZIP: [digests]}}). Só contam como já
+# exportados os digests de arquivos que ainda estão na pasta; manifestos do
+# formato antigo (só a lista de digests, sem dizer em que arquivo) são
+# ignorados e a próxima exportação leva todos os documentos.
+def _ler_manifesto(caminho):
+    try:
+        with open(caminho) as f:
+            arquivos = json.load(f)["arquivos"]
+    except (FileNotFoundError, ValueError, KeyError, TypeError):
+        return {}
+    pasta = os.path.dirname(caminho)
+    return {nome: digests for nome, digests in arquivos.items() if os.path.exists(os.path.join(pasta, nome))}
+
+
+def _digests_exportados(arquivos):
+    return {digest for digests in arquivos.values() for digest in digests}
+
+
+# Cada exportação incremental grava arquivos novos (<nome>-<data>.zip), sem
+# sobrescrever os anteriores: os documentos deixados de fora estão neles
+def _nome_versionado(caminho, momento):
+    base, extensao = os.path.splitext(caminho)
+    nome = f"{base}-{momento}{extensao}"
+    n = 1
+    while os.path.exists(nome):
+        n += 1
+        nome = f"{base}-{momento}-{n}{extensao}"
+    return nome
+
+
+# Total de bytes de documentos que exportar_projetos() vai ler, para o progresso
+def tamanho_exportacao(projetos, destino, combinado=False, incremental=False):
+    exportados = (_digests_exportados(_ler_manifesto(_caminho_manifesto(destino, combinado)))
+                  if incremental else set())
+    total = 0
+    for projeto in projetos:
+        vistos = exportados if combinado else set(exportados)
+        for chave, caminho, _ in documentos_do_projeto(projeto):
+            if chave not in vistos:
+                vistos.add(chave)
+                total += os.path.getsize(caminho)
+    return total
+
+
+def _caminho_manifesto(destino, combinado):
+    pasta = os.path.dirname(os.path.abspath(destino)) if combinado else destino
+    return os.path.join(pasta, MANIFESTO_EXPORTACAO)
+
+
+# Arquivos gravados e seu tamanho, para a instrumentação
+def _resumo_exportacao(arquivos):
+    return {"arquivos": len(arquivos), "bytes": sum(os.path.getsize(arquivo) for arquivo in arquivos)}
+
+
+# Exporta vários projetos de uma vez. Com combinado=False, destino é uma pasta
+# e cada projeto vira <nome>-<id>.zip nela; com combinado=True, destino é um
+# único ZIP com uma pasta por projeto. Os documentos são comprimidos em
+# paralelo; com incremental=True ficam de fora os já exportados para o mesmo
+# destino (mesmo digest), e o projeto.json continua referenciando-os. Os
+# arquivos incrementais levam a data no nome (ver _nome_versionado).
+# Devolve os caminhos dos arquivos gravados.
+@instrumentado("exportacao.zip", _resumo_exportacao)
+def exportar_projetos(projetos, destino, combinado=False, nivel=NIVEL_COMPRESSAO, incremental=False,
+                      progresso=None, threads=THREADS_EXPORTACAO):
+    threads = threads or os.cpu_count() or 1
+    manifesto = _caminho_manifesto(destino, combinado)
+    arquivos = _ler_manifesto(manifesto) if incremental else {}
+    exportados = _digests_exportados(arquivos)
+    entradas = []
+    for projeto in projetos:
+        documentos = [d for d in documentos_do_projeto(projeto) if d[0] not in exportados]
+        entradas.append((projeto, documentos))
+
+    if combinado:
+        trabalhos = [(destino, [(nome_arquivo_projeto(p) + "/", p, docs) for p, docs in entradas])]
+    else:
+        os.makedirs(destino, exist_ok=True)
+        trabalhos = [(os.path.join(destino, nome_arquivo_projeto(p) + ".zip"), [("", p, docs)])
+                     for p, docs in entradas]
+    if incremental:
+        momento = time.strftime("%Y%m%d-%H%M%S")
+        trabalhos = [(_nome_versionado(nome, momento), entradas_zip) for nome, entradas_zip in trabalhos]
+
+    with ThreadPoolExecutor(threads) as compressores, ThreadPoolExecutor(threads) as escritores:
+        futuros = [escritores.submit(_exportar_arquivo, nome, entradas_zip, nivel, compressores, threads * 2, progresso)
+                   for nome, entradas_zip in trabalhos]
+        try:
+            for futuro in futuros:
+                futuro.result()
+        except BaseException:
+            for futuro in futuros:
+                futuro.cancel()
+            raise
+
+    if incremental:
+        for nome, entradas_zip in trabalhos:
+            arquivos[os.path.basename(nome)] = sorted({chave for _, _, documentos in entradas_zip
+                                                       for chave, _, _ in documentos if _eh_digest(chave)})
+        gravar_atomico(manifesto, json.dumps({"arquivos": arquivos}))
+    return [nome for nome, _ in trabalhos]
+
+
+def _eh_digest(chave):
+    return re.fullmatch(r"[0-9a-f]{64}", chave) is not None
+
+
+# Função para compactar um projeto em um arquivo ZIP
+def compactar_projeto(projeto, nome_arquivo_zip, progresso=None, nivel=NIVEL_COMPRESSAO):
+    threads = THREADS_EXPORTACAO or os.cpu_count() or 1
+    with ThreadPoolExecutor(threads) as compressores:
+        _exportar_arquivo(nome_arquivo_zip, [("", projeto, documentos_do_projeto(projeto))],
+                          nivel, compressores, threads * 2, progresso)
+
+
+# Pastas do ZIP que contêm um projeto: "" no formato de um projeto por
+# arquivo, "<nome>-<id>/" no arquivo combinado
+def pastas_de_projetos(zipf):
+    return [nome[:-len('projeto.json')] for nome in zipf.namelist()
+            if nome == 'projeto.json' or nome.endswith('/projeto.json')]
+
+
+# Lê os projetos de um ZIP exportado. Os manifestos (projeto.json e
+# documentos.json) são lidos primeiro e só os membros referenciados são
+# extraídos, direto para o armazém, conferindo tamanho e sha256 das
+# referências. Conteúdos que o armazém já tem não são lidos de novo.
+def ler_projetos_zip(nome_arquivo_zip, progresso=None):
+    armazem = obter_armazem()
+    projetos = []
+    with zipfile.ZipFile(nome_arquivo_zip, 'r') as zipf:
+        for pasta in pastas_de_projetos(zipf):
+            with zipf.open(pasta + 'projeto.json') as f:
+                projeto = json.load(f)
+            nomes = {}
+            if pasta + MEMBRO_DOCUMENTOS in zipf.NameToInfo:
+                with zipf.open(pasta + MEMBRO_DOCUMENTOS) as f:
+                    nomes = json.load(f)
+            for tipo in TIPOS_DOCUMENTO:
+                projeto[tipo] = [_importar_documento(zipf, armazem, pasta, nomes, referencia, progresso)
+                                 for referencia in projeto.get(tipo, [])]
+            projetos.append(projeto)
+    return projetos
+
+
+def _importar_documento(zipf, armazem, pasta, nomes, referencia, progresso):
+    nome = nomes.get(_chave_documento(referencia), pasta + os.path.basename(nome_documento(referencia)))
+    info = zipf.NameToInfo.get(nome)
+    digest = digest_documento(referencia)
+    if digest is not None and armazem.existe(digest):
+        if info is not None and progresso is not None:
+            progresso(info.file_size)
+        return referencia
+    if info is None:
+        # Deixado de fora numa exportação incremental: mantém a referência
+        return referencia
+    if digest is not None and info.file_size != referencia["tamanho"]:
+        raise DocumentoCorrompido(f"{nome}: {info.file_size} bytes, esperado {referencia['tamanho']}")
+    with zipf.open(info) as membro:
+        novo_digest, tamanho = armazem.ingerir_fluxo(membro, progresso, esperado=digest)
+    return criar_referencia(nome_documento(referencia), novo_digest, tamanho)
+
+
+# Lê vários ZIPs em paralelo. Um arquivo com problema não interrompe os
+# demais: devolve os projetos lidos e a lista de (arquivo, erro).
+@instrumentado("importacao.zip", lambda r: {"projetos": len(r[0]), "erros": len(r[1])})
+def ler_projetos_zips(arquivos, progresso=None, threads=THREADS_EXPORTACAO):
+    threads = threads or os.cpu_count() or 1
+    projetos = []
+    erros = []
+    with ThreadPoolExecutor(threads) as leitores:
+        futuros = [leitores.submit(ler_projetos_zip, arquivo, progresso) for arquivo in arquivos]
+        try:
+            for arquivo, futuro in zip(arquivos, futuros):
+                try:
+                    projetos.extend(futuro.result())
+                except (OSError, ValueError, KeyError, zipfile.BadZipFile) as erro:
+                    erros.append((arquivo, str(erro)))
+        except BaseException:
+            for futuro in futuros:
+                futuro.cancel()
+            raise
+    return projetos, erros
+
+
+def tamanho_importacao(arquivos):
+    total = 0
+    for arquivo in arquivos:
+        try:
+            with zipfile.ZipFile(arquivo, 'r') as zipf:
+                total += sum(info.file_size for info in zipf.infolist() if not info.filename.endswith('.json'))
+        except (OSError, zipfile.BadZipFile):
+            pass
+    return total
+
+
+# Funções executadas pelas tarefas em segundo plano (fora da thread da interface)
+def tarefa_exportar(tarefa, projetos, destino, combinado, nivel, incremental):
+    tarefa.definir_total(tamanho_exportacao(projetos, destino, combinado, incremental))
+    return exportar_projetos(projetos, destino, combinado, nivel, incremental, tarefa.avancar)
+
+
+# Só lê e guarda os documentos; os projetos são gravados de uma vez, na
+# thread da interface, com Repositorio.importar_projetos()
+def tarefa_importar(tarefa, arquivos):
+    tarefa.definir_total(tamanho_importacao(arquivos))
+    return ler_projetos_zips(arquivos, tarefa.avancar)
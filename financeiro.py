@@ -0,0 +1,212 @@
+import numpy as np
+
+# Capacidade inicial das colunas; dobra quando enche
+CAPACIDADE_INICIAL = 1024
+
+
+def mes_do_projeto(projeto):
+    # As despesas não têm data: o mês é o do cadastro do projeto ("AAAA-MM")
+    return projeto["data_cadastro"][:7]
+
+
+# Valores das despesas de um projeto; as despesas de modelo.Despesas já
+# estão num array de float, lido sem cópia
+def _valores(despesas):
+    valores = getattr(despesas, "valores", None)
+    if valores is not None:
+        return np.frombuffer(valores, dtype=np.float64) if len(valores) else np.zeros(0)
+    return np.array([d["valor"] for d in despesas], dtype=np.float64)
+
+
+# Representação em colunas (arrays NumPy) dos valores dos projetos e das
+# despesas, para somar gastos e saldos sem percorrer os dicionários.
+#
+# Cada projeto ocupa uma posição nas colunas de projetos (financiamento,
+# código do responsável, código do mês, ativo) e suas despesas ocupam um
+# trecho contíguo das colunas de despesas (valor, posição do projeto).
+# Alterar um projeto apaga o trecho antigo (valor zerado, linha morta) e
+# acrescenta as despesas no final; as linhas e posições mortas são
+# descartadas quando passam da metade.
+class ColunasFinanceiras:
+    def __init__(self, projetos=()):
+        self._posicoes = {}
+        self._ids = []
+        self._trechos = []
+        self._financiamento = np.zeros(CAPACIDADE_INICIAL)
+        self._responsavel = np.zeros(CAPACIDADE_INICIAL, dtype=np.int32)
+        self._mes = np.zeros(CAPACIDADE_INICIAL, dtype=np.int32)
+        self._ativo = np.zeros(CAPACIDADE_INICIAL, dtype=bool)
+        self._valor = np.zeros(CAPACIDADE_INICIAL)
+        self._projeto = np.zeros(CAPACIDADE_INICIAL, dtype=np.int32)
+        self._viva = np.zeros(CAPACIDADE_INICIAL, dtype=bool)
+        self._linhas = 0
+        self._linhas_mortas = 0
+        self._responsaveis = {}
+        self._meses = {}
+        self._carregar(list(projetos))
+
+    @staticmethod
+    def _codigo(codigos, chave):
+        codigo = codigos.get(chave)
+        if codigo is None:
+            codigo = codigos[chave] = len(codigos)
+        return codigo
+
+    @staticmethod
+    def _crescer(colunas, necessario):
+        capacidade = len(colunas[0])
+        if necessario <= capacidade:
+            return colunas
+        while capacidade < necessario:
+            capacidade *= 2
+        novas = []
+        for coluna in colunas:
+            nova = np.zeros(capacidade, dtype=coluna.dtype)
+            nova[:len(coluna)] = coluna
+            novas.append(nova)
+        return novas
+
+    # Carga inicial: as colunas são montadas de uma vez a partir de listas
+    def _carregar(self, projetos):
+        if not projetos:
+            return
+        posicoes = len(projetos)
+        self._financiamento, self._responsavel, self._mes, self._ativo = self._crescer(
+            [self._financiamento, self._responsavel, self._mes, self._ativo], posicoes)
+        self._financiamento[:posicoes] = [p["valor_financiamento"] for p in projetos]
+        self._responsavel[:posicoes] = [self._codigo(self._responsaveis, p["responsavel"]) for p in projetos]
+        self._mes[:posicoes] = [self._codigo(self._meses, mes_do_projeto(p)) for p in projetos]
+        self._ativo[:posicoes] = True
+        quantidades = [len(p["despesas"]) for p in projetos]
+        linhas = sum(quantidades)
+        self._valor, self._projeto, self._viva = self._crescer([self._valor, self._projeto, self._viva], linhas)
+        if linhas:
+            self._valor[:linhas] = np.concatenate([_valores(p["despesas"]) for p in projetos])
+        self._projeto[:linhas] = np.repeat(np.arange(posicoes, dtype=np.int32), quantidades)
+        self._viva[:linhas] = True
+        inicio = 0
+        for posicao, (projeto, quantidade) in enumerate(zip(projetos, quantidades)):
+            self._posicoes[projeto["id"]] = posicao
+            self._ids.append(projeto["id"])
+            self._trechos.append((inicio, inicio + quantidade))
+            inicio += quantidade
+        self._linhas = linhas
+
+    def adicionar(self, projeto):
+        if projeto["id"] in self._posicoes:
+            self.remover(projeto["id"])
+        posicao = len(self._ids)
+        self._financiamento, self._responsavel, self._mes, self._ativo = self._crescer(
+            [self._financiamento, self._responsavel, self._mes, self._ativo], posicao + 1)
+        self._financiamento[posicao] = projeto["valor_financiamento"]
+        self._responsavel[posicao] = self._codigo(self._responsaveis, projeto["responsavel"])
+        self._mes[posicao] = self._codigo(self._meses, mes_do_projeto(projeto))
+        self._ativo[posicao] = True
+        self._posicoes[projeto["id"]] = posicao
+        self._ids.append(projeto["id"])
+
+        inicio = self._linhas
+        fim = inicio + len(projeto["despesas"])
+        self._valor, self._projeto, self._viva = self._crescer([self._valor, self._projeto, self._viva], fim)
+        self._valor[inicio:fim] = _valores(projeto["despesas"])
+        self._projeto[inicio:fim] = posicao
+        self._viva[inicio:fim] = True
+        self._trechos.append((inicio, fim))
+        self._linhas = fim
+
+    def remover(self, projeto_id):
+        posicao = self._posicoes.pop(projeto_id, None)
+        if posicao is None:
+            return
+        inicio, fim = self._trechos[posicao]
+        self._financiamento[posicao] = 0
+        self._ativo[posicao] = False
+        self._valor[inicio:fim] = 0
+        self._viva[inicio:fim] = False
+        self._linhas_mortas += fim - inicio
+        if len(self._ids) - len(self._posicoes) > len(self._posicoes) or self._linhas_mortas > self._linhas // 2:
+            self._compactar()
+
+    def _compactar(self):
+        posicoes = len(self._ids)
+        ativo = self._ativo[:posicoes]
+        nova_posicao = np.cumsum(ativo, dtype=np.int32) - 1
+        viva = self._viva[:self._linhas]
+        nova_linha = np.cumsum(viva) - viva
+
+        trechos = []
+        for posicao in np.flatnonzero(ativo):
+            inicio, fim = self._trechos[posicao]
+            novo_inicio = int(nova_linha[inicio]) if inicio < self._linhas else int(viva.sum())
+            trechos.append((novo_inicio, novo_inicio + fim - inicio))
+        self._ids = [self._ids[posicao] for posicao in np.flatnonzero(ativo)]
+        self._posicoes = {projeto_id: posicao for posicao, projeto_id in enumerate(self._ids)}
+        self._trechos = trechos
+
+        for nome in ("_financiamento", "_responsavel", "_mes", "_ativo"):
+            coluna = getattr(self, nome)
+            compacta = coluna[:posicoes][ativo]
+            coluna[:len(compacta)] = compacta
+            coluna[len(compacta):posicoes] = 0
+        projetos = nova_posicao[self._projeto[:self._linhas][viva]]
+        valores = self._valor[:self._linhas][viva]
+        self._linhas = len(valores)
+        self._valor[:self._linhas] = valores
+        self._projeto[:self._linhas] = projetos
+        self._viva[:self._linhas] = True
+        self._linhas_mortas = 0
+
+    # Gasto por posição de projeto
+    def _gastos(self):
+        return np.bincount(self._projeto[:self._linhas], weights=self._valor[:self._linhas],
+                           minlength=len(self._ids))
+
+    def _agrupar(self, codigos, chaves):
+        posicoes = len(self._ids)
+        ativo = self._ativo[:posicoes]
+        codigos = codigos[:posicoes]
+        tamanho = len(chaves)
+        quantidade = np.bincount(codigos, weights=ativo, minlength=tamanho)
+        financiamento = np.bincount(codigos, weights=self._financiamento[:posicoes], minlength=tamanho)
+        gasto = np.bincount(codigos, weights=self._gastos(), minlength=tamanho)
+        return [
+            {"chave": chave, "projetos": int(quantidade[codigo]), "financiamento": float(financiamento[codigo]),
+             "gasto": float(gasto[codigo]), "saldo": float(financiamento[codigo] - gasto[codigo])}
+            for chave, codigo in sorted(chaves.items()) if quantidade[codigo]
+        ]
+
+    # Consultas
+
+    def totais(self):
+        posicoes = len(self._ids)
+        financiamento = self._financiamento[:posicoes]
+        gasto = self._gastos()
+        return {
+            "projetos": len(self._posicoes),
+            "despesas": int(self._linhas - self._linhas_mortas),
+            "financiamento": float(financiamento.sum()),
+            "gasto": float(gasto.sum()),
+            "saldo": float(financiamento.sum() - gasto.sum()),
+            "acima_do_orcamento": int(np.count_nonzero((gasto > financiamento) & self._ativo[:posicoes])),
+        }
+
+    # Colunas por projeto: ids e arrays de financiamento, gasto, saldo e se o
+    # gasto passou do financiamento, na mesma ordem
+    def por_projeto(self):
+        posicoes = len(self._ids)
+        ativo = self._ativo[:posicoes]
+        financiamento = self._financiamento[:posicoes][ativo]
+        gasto = self._gastos()[ativo]
+        ids = [self._ids[posicao] for posicao in np.flatnonzero(ativo)]
+        return {"ids": ids, "financiamento": financiamento, "gasto": gasto, "saldo": financiamento - gasto,
+                "acima_do_orcamento": gasto > financiamento}
+
+    def acima_do_orcamento(self):
+        colunas = self.por_projeto()
+        return [colunas["ids"][i] for i in np.flatnonzero(colunas["acima_do_orcamento"])]
+
+    def por_responsavel(self):
+        return self._agrupar(self._responsavel, self._responsaveis)
+
+    def por_mes(self):
+        return self._agrupar(self._mes, self._meses)
@@ -0,0 +1,276 @@
+import csv
+import multiprocessing
+import os
+import unicodedata
+import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from configuracao import PROCESSOS_INGESTAO, LOTE_INGESTAO
+from documentos import obter_armazem, criar_referencia
+from instrumentacao import instrumentado
+
+# Entrada de despesas em massa a partir de NF-e em XML (um arquivo por nota,
+# como vem da SEFAZ, ou lotes com várias notas) e de planilhas exportadas em
+# CSV. Os arquivos são lidos em paralelo por processos (um lote de arquivos
+# por vez em cada um), as notas já cadastradas (mesma chave) são ignoradas e
+# o resultado é dividido em lotes de despesas, cada um gravado no projeto
+# numa única alteração junto com as referências aos arquivos de origem.
+
+# Arquivos lidos por cada processo de uma vez; abaixo disso não compensa
+# iniciar processos
+ARQUIVOS_POR_PROCESSO = 64
+
+# Tipo de documento em que os arquivos de origem são anexados
+TIPO_DOCUMENTO_EXTENSAO = {".xml": "nfe", ".csv": "arquivos_adicionais"}
+
+# Cabeçalhos reconhecidos no CSV (sem acentos, minúsculas, "_" no lugar de espaços)
+COLUNAS_CSV = {
+    "nome": ("nome", "fornecedor", "emitente", "despesa"),
+    "descricao": ("descricao", "produto", "historico", "detalhe"),
+    "valor": ("valor", "valor_total", "total", "vnf", "valor_nf"),
+    "nfe": ("nfe", "nf_e", "chave", "chave_nfe", "chave_de_acesso", "numero_nfe"),
+}
+
+# Tamanho máximo da descrição montada com os produtos da nota
+TAMANHO_DESCRICAO = 200
+
+
+# Valor digitado ou exportado de uma planilha: aceita "1234.56", "1234,56",
+# "1.234,56" e "R$ 1.234,56"
+def converter_valor(texto):
+    texto = texto.strip().replace("R$", "").replace(" ", "")
+    if "," in texto:
+        texto = texto.replace(".", "").replace(",", ".")
+    return float(texto)
+
+
+def tipo_documento(caminho):
+    return TIPO_DOCUMENTO_EXTENSAO.get(os.path.splitext(caminho)[1].lower())
+
+
+# NF-e
+
+def _nota(inf_nfe):
+    ns = inf_nfe.tag[:inf_nfe.tag.index("}") + 1] if inf_nfe.tag.startswith("{") else ""
+    chave = inf_nfe.get("Id", "")
+    chave = chave[3:] if chave.startswith("NFe") else chave
+    numero = inf_nfe.findtext(f"{ns}ide/{ns}nNF", "")
+    emitente = inf_nfe.findtext(f"{ns}emit/{ns}xNome", "") or f"NF-e {numero}"
+    produtos = "; ".join(p.text for p in inf_nfe.iterfind(f"{ns}det/{ns}prod/{ns}xProd") if p.text)
+    descricao = f"NF-e {numero}: {produtos}" if numero else produtos
+    if len(descricao) > TAMANHO_DESCRICAO:
+        descricao = descricao[:TAMANHO_DESCRICAO - 3] + "..."
+    valor = inf_nfe.findtext(f"{ns}total/{ns}ICMSTot/{ns}vNF")
+    if valor is None:
+        raise ValueError(f"NF-e {chave or numero} sem valor total (vNF)")
+    return {"nome": emitente.strip(), "descricao": descricao.strip(), "valor": float(valor), "nfe": chave}
+
+
+# Lê as notas do arquivo sem montar a árvore inteira: cada infNFe é
+# convertida e descartada assim que termina (arquivos de lote podem ter
+# milhares de notas)
+def ler_nfe_xml(caminho):
+    despesas = []
+    contexto = ET.iterparse(caminho, events=("start", "end"))
+    _, raiz = next(contexto)
+    for evento, elemento in contexto:
+        if evento == "end" and elemento.tag.rsplit("}", 1)[-1] == "infNFe":
+            despesas.append(_nota(elemento))
+            # A nota já foi lida: solta o que foi montado até aqui
+            raiz.clear()
+    if not despesas:
+        raise ValueError("nenhuma NF-e (infNFe) encontrada")
+    return despesas
+
+
+# CSV
+
+def _chave_coluna(cabecalho):
+    texto = unicodedata.normalize("NFKD", cabecalho.strip().lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return texto.replace(" ", "_").replace("-", "_")
+
+
+def _abrir_texto(caminho):
+    # Exportações do Excel em português costumam vir em cp1252
+    with open(caminho, "rb") as f:
+        conteudo = f.read()
+    try:
+        return conteudo.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return conteudo.decode("cp1252", errors="replace")
+
+
+# Colunas pelo cabeçalho (ver COLUNAS_CSV) ou, sem cabeçalho reconhecido,
+# na ordem nome, descrição, valor e NF-e. Separador ";", "," ou tabulação.
+def ler_csv(caminho):
+    linhas = _abrir_texto(caminho).splitlines()
+    if not linhas:
+        raise ValueError("arquivo vazio")
+    separador = max(";,\t", key=linhas[0].count)
+    leitor = csv.reader(linhas, delimiter=separador)
+    primeira = next(leitor)
+    aliases = {alias: campo for campo, nomes in COLUNAS_CSV.items() for alias in nomes}
+    indices = {}
+    for i, cabecalho in enumerate(primeira):
+        campo = aliases.get(_chave_coluna(cabecalho))
+        if campo is not None and campo not in indices:
+            indices[campo] = i
+    if "valor" in indices:
+        inicio = 2
+    else:
+        indices = {campo: i for i, campo in enumerate(("nome", "descricao", "valor", "nfe"))}
+        leitor = csv.reader(linhas, delimiter=separador)
+        inicio = 1
+
+    despesas = []
+    for numero, campos in enumerate(leitor, inicio):
+        if not any(c.strip() for c in campos):
+            continue
+        despesa = {campo: campos[i].strip() if i < len(campos) else "" for campo, i in indices.items()}
+        despesa.setdefault("descricao", "")
+        despesa.setdefault("nfe", "")
+        try:
+            despesa["valor"] = converter_valor(despesa["valor"])
+        except ValueError:
+            raise ValueError(f"linha {numero}: valor inválido: {despesa['valor']!r}") from None
+        if not despesa.get("nome"):
+            despesa["nome"] = f"NF-e {despesa['nfe']}" if despesa["nfe"] else os.path.basename(caminho)
+        despesas.append(despesa)
+    return despesas
+
+
+def ler_arquivo(caminho):
+    tipo = tipo_documento(caminho)
+    if tipo == "nfe":
+        return ler_nfe_xml(caminho)
+    if tipo is not None:
+        return ler_csv(caminho)
+    raise ValueError("formato não suportado (use .xml ou .csv)")
+
+
+# Executada nos processos: (despesas, erro) de cada arquivo do lote
+def ler_lote(caminhos):
+    resultados = []
+    for caminho in caminhos:
+        try:
+            resultados.append((ler_arquivo(caminho), None))
+        except (OSError, ValueError, ET.ParseError, csv.Error) as erro:
+            resultados.append((None, str(erro)))
+    return resultados
+
+
+# Gera (caminho, despesas, erro) na ordem dos arquivos, com poucos lotes em
+# andamento de cada vez. progresso, se informado, recebe os bytes de cada
+# arquivo lido.
+def ler_arquivos(arquivos, progresso=None, processos=PROCESSOS_INGESTAO):
+    lotes = [arquivos[i:i + ARQUIVOS_POR_PROCESSO] for i in range(0, len(arquivos), ARQUIVOS_POR_PROCESSO)]
+    if len(lotes) <= 1:
+        yield from _ler_lotes(lotes, None, progresso, 1)
+        return
+    # spawn: o processo da interface tem threads do Qt, e fork com threads não é seguro
+    processos = processos or os.cpu_count() or 1
+    with ProcessPoolExecutor(processos, mp_context=multiprocessing.get_context("spawn")) as pool:
+        yield from _ler_lotes(lotes, pool, progresso, processos * 2)
+
+
+def _ler_lotes(lotes, pool, progresso, janela):
+    pendentes = deque()
+    restantes = iter(lotes)
+    try:
+        while True:
+            while len(pendentes) < janela:
+                lote = next(restantes, None)
+                if lote is None:
+                    break
+                if pool is None:
+                    futuro = Future()
+                    futuro.set_result(ler_lote(lote))
+                else:
+                    futuro = pool.submit(ler_lote, lote)
+                pendentes.append((lote, futuro))
+            if not pendentes:
+                break
+            lote, futuro = pendentes.popleft()
+            for caminho, (despesas, erro) in zip(lote, futuro.result()):
+                if progresso is not None:
+                    progresso(_tamanho(caminho))
+                yield caminho, despesas, erro
+    except BaseException:
+        for _, futuro in pendentes:
+            futuro.cancel()
+        raise
+
+
+def _tamanho(caminho):
+    try:
+        return os.path.getsize(caminho)
+    except OSError:
+        return 0
+
+
+# Lê os arquivos, descarta as notas com chave já conhecida (chaves_nfe) ou
+# repetida e guarda no armazém os arquivos que trouxeram alguma despesa. Um
+# arquivo cujo conteúdo já está anexado (digests) é ignorado por inteiro,
+# para que importar a mesma planilha de novo não duplique as linhas sem chave.
+# Devolve os lotes [(despesas, {tipo: [referências]})] de até `lote`
+# despesas (um arquivo nunca é dividido entre lotes), a lista de
+# (arquivo, erro) e quantas despesas foram ignoradas por já existirem.
+@instrumentado("ingestao.arquivos", lambda r: {"lotes": len(r["lotes"]), "erros": len(r["erros"]),
+                                               "duplicadas": r["duplicadas"]})
+def ingerir_arquivos(arquivos, chaves_nfe=(), digests=(), progresso=None, lote=LOTE_INGESTAO,
+                     processos=PROCESSOS_INGESTAO):
+    armazem = obter_armazem()
+    chaves = set(chaves_nfe)
+    digests = set(digests)
+    lotes = []
+    erros = []
+    duplicadas = 0
+    despesas_lote, documentos_lote = [], {}
+    for caminho, despesas, erro in ler_arquivos(arquivos, progresso, processos):
+        if erro is not None:
+            erros.append((caminho, erro))
+            continue
+        # Uma chave repetida no mesmo arquivo (ex.: linhas iguais numa
+        # planilha) só entra uma vez
+        novas, vistas = [], set()
+        for despesa in despesas:
+            nfe = despesa["nfe"]
+            if nfe and (nfe in chaves or nfe in vistas):
+                continue
+            if nfe:
+                vistas.add(nfe)
+            novas.append(despesa)
+        duplicadas += len(despesas) - len(novas)
+        if not novas:
+            continue
+        # Com alguma despesa nova o arquivo vai para o armazém; se o blob já
+        # existia e está anexado, nada é acrescentado
+        digest, tamanho = armazem.ingerir(caminho)
+        if digest in digests:
+            duplicadas += len(novas)
+            continue
+        digests.add(digest)
+        chaves.update(vistas)
+        despesas_lote.extend(novas)
+        documentos_lote.setdefault(tipo_documento(caminho), []).append(
+            criar_referencia(os.path.basename(caminho), digest, tamanho))
+        if len(despesas_lote) >= lote:
+            lotes.append((despesas_lote, documentos_lote))
+            despesas_lote, documentos_lote = [], {}
+    if despesas_lote:
+        lotes.append((despesas_lote, documentos_lote))
+    return {"lotes": lotes, "erros": erros, "duplicadas": duplicadas}
+
+
+# Arquivos .xml e .csv de uma pasta (sem subpastas), em ordem
+def arquivos_da_pasta(pasta):
+    return sorted(os.path.join(pasta, nome) for nome in os.listdir(pasta) if tipo_documento(nome) is not None)
+
+
+# Executada por uma tarefa em segundo plano: só lê e guarda os arquivos; os
+# lotes são gravados no projeto na thread da interface
+def tarefa_ingerir(tarefa, arquivos, chaves_nfe, digests):
+    tarefa.definir_total(sum(_tamanho(caminho) for caminho in arquivos))
+    return ingerir_arquivos(arquivos, chaves_nfe, digests, tarefa.avancar)
@@ -0,0 +1,282 @@
+import atexit
+import functools
+import io
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from configuracao import (INSTRUMENTACAO, LOG_INSTRUMENTACAO, LIMITE_LOG_INSTRUMENTACAO, COPIAS_LOG_INSTRUMENTACAO,
+                          PERFIS_DIR)
+
+# Medições dos caminhos quentes (carga e gravação dos dados, tabela, abas,
+# cópias de documentos, ZIPs, relatório). Cada medição vira um evento com
+# nome, duração, bytes e campos extras, que vai para um log estruturado (uma
+# linha JSON por evento, com rotação), para os últimos eventos em memória e
+# para os totais por nome exibidos no painel de diagnóstico.
+#
+# Desligada (o padrão), medir() devolve sempre o mesmo objeto vazio e o
+# custo é o de uma chamada de função. A gravação do log é feita por uma
+# thread própria, fora do caminho medido.
+#
+# Uso:
+#     with medir("exportacao.zip", projetos=3) as medicao:
+#         ...
+#         medicao.adicionar_bytes(n)
+#
+#     @instrumentado("documentos.copiar", lambda r: {"bytes": r[1]})
+#     def ingerir(...): ...
+
+EVENTOS_RECENTES = 500
+
+_ativa = INSTRUMENTACAO
+_trava = threading.Lock()
+_recentes = deque(maxlen=EVENTOS_RECENTES)
+_totais = {}
+_log = None
+_ouvinte = None
+# Perfil armado para a próxima medição da thread principal
+_perfil_armado = False
+_ultimo_perfil = None
+# Avisados (funcao(ativa)) quando a instrumentação é ligada ou desligada
+_observadores = []
+
+
+def ativa():
+    return _ativa
+
+
+def ativar(valor=True):
+    global _ativa
+    _ativa = valor
+    if valor:
+        _abrir_log()
+    for funcao in list(_observadores):
+        funcao(valor)
+
+
+def observar(funcao):
+    _observadores.append(funcao)
+
+
+# O logging só é importado quando a instrumentação grava a primeira vez
+def _abrir_log():
+    import logging.handlers
+    global _log, _ouvinte
+    with _trava:
+        if _log is not None:
+            return _log
+        arquivo = logging.handlers.RotatingFileHandler(LOG_INSTRUMENTACAO, maxBytes=LIMITE_LOG_INSTRUMENTACAO,
+                                                       backupCount=COPIAS_LOG_INSTRUMENTACAO, encoding="utf-8")
+        arquivo.setFormatter(logging.Formatter("%(message)s"))
+        fila = queue.SimpleQueue()
+        _ouvinte = logging.handlers.QueueListener(fila, arquivo)
+        _ouvinte.start()
+        atexit.register(encerrar)
+        log = logging.getLogger("projetos.instrumentacao")
+        log.setLevel(logging.INFO)
+        log.propagate = False
+        log.addHandler(logging.handlers.QueueHandler(fila))
+        _log = log
+        return log
+
+
+# Grava o que está na fila do log (chamada também na saída do processo)
+def encerrar():
+    global _ouvinte, _log
+    with _trava:
+        if _ouvinte is not None:
+            _ouvinte.stop()
+        _ouvinte = None
+        if _log is not None:
+            for handler in list(_log.handlers):
+                _log.removeHandler(handler)
+        _log = None
+
+
+def registrar(nome, ms=None, tamanho=None, **campos):
+    if not _ativa:
+        return
+    evento = {"ts": datetime.now().isoformat(timespec="milliseconds"), "evento": nome}
+    if ms is not None:
+        evento["ms"] = round(ms, 3)
+    if tamanho is not None:
+        evento["bytes"] = tamanho
+    evento["thread"] = threading.current_thread().name
+    evento.update(campos)
+    with _trava:
+        _recentes.append(evento)
+        total = _totais.get(nome)
+        if total is None:
+            total = _totais[nome] = {"quantidade": 0, "ms": 0.0, "maximo_ms": 0.0, "bytes": 0}
+        total["quantidade"] += 1
+        if ms is not None:
+            total["ms"] += ms
+            total["maximo_ms"] = max(total["maximo_ms"], ms)
+        if tamanho:
+            total["bytes"] += tamanho
+    (_log or _abrir_log()).info(json.dumps(evento, ensure_ascii=False, default=str))
+
+
+class Medicao:
+    __slots__ = ("nome", "campos", "bytes", "_inicio", "_perfil")
+
+    def __init__(self, nome, campos):
+        self.nome = nome
+        self.campos = campos
+        self.bytes = None
+        self._perfil = None
+
+    def adicionar_bytes(self, n):
+        self.bytes = (self.bytes or 0) + n
+
+    def definir(self, **campos):
+        self.campos.update(campos)
+
+    def __enter__(self):
+        global _perfil_armado
+        if _perfil_armado and threading.current_thread() is threading.main_thread():
+            _perfil_armado = False
+            self._perfil = CapturaPerfil(self.nome)
+            self._perfil.__enter__()
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo_excecao, *_):
+        ms = (time.perf_counter() - self._inicio) * 1000
+        if self._perfil is not None:
+            self._perfil.__exit__(tipo_excecao, None, None)
+            self.campos["perfil"] = self._perfil.caminho
+        if tipo_excecao is not None:
+            self.campos["erro"] = tipo_excecao.__name__
+        registrar(self.nome, ms, self.bytes, **self.campos)
+
+
+# Medição desligada: aceita as mesmas chamadas e não faz nada
+class _MedicaoNula:
+    __slots__ = ()
+
+    def adicionar_bytes(self, n):
+        pass
+
+    def definir(self, **campos):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        pass
+
+
+_NULA = _MedicaoNula()
+
+
+def medir(nome, **campos):
+    if not _ativa:
+        return _NULA
+    return Medicao(nome, campos)
+
+
+# Mede cada chamada da função. resumo, se informado, recebe o resultado e
+# devolve campos extras para o evento ("bytes" vai para o total de bytes).
+def instrumentado(nome, resumo=None):
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        def envolvida(*args, **kwargs):
+            if not _ativa:
+                return funcao(*args, **kwargs)
+            with Medicao(nome, {}) as medicao:
+                resultado = funcao(*args, **kwargs)
+                if resumo is not None:
+                    campos = dict(resumo(resultado))
+                    tamanho = campos.pop("bytes", None)
+                    if tamanho is not None:
+                        medicao.adicionar_bytes(tamanho)
+                    medicao.definir(**campos)
+                return resultado
+        return envolvida
+    return decorador
+
+
+# Consultas para o painel de diagnóstico
+
+def eventos_recentes():
+    with _trava:
+        return list(_recentes)
+
+
+def totais():
+    with _trava:
+        return {nome: dict(total) for nome, total in _totais.items()}
+
+
+def limpar():
+    with _trava:
+        _recentes.clear()
+        _totais.clear()
+
+
+# Perfil de uma única ação: cProfile (tempo por função) e tracemalloc
+# (onde a memória foi alocada). Grava <nome>-<data>.prof (para pstats ou
+# snakeviz) e um resumo em texto ao lado, em PERFIS_DIR. O cProfile só vê a
+# thread em que a captura foi iniciada.
+class CapturaPerfil:
+    LINHAS_RESUMO = 30
+
+    def __init__(self, nome):
+        import cProfile
+        self.nome = nome
+        self.caminho = None
+        self._perfil = cProfile.Profile()
+        self._rastreando = False
+
+    def __enter__(self):
+        import tracemalloc
+        self._rastreando = not tracemalloc.is_tracing()
+        if self._rastreando:
+            tracemalloc.start()
+        self._perfil.enable()
+        return self
+
+    def __exit__(self, *_):
+        import pstats
+        import tracemalloc
+        global _ultimo_perfil
+        self._perfil.disable()
+        memoria = tracemalloc.take_snapshot()
+        atual, pico = tracemalloc.get_traced_memory()
+        if self._rastreando:
+            tracemalloc.stop()
+        os.makedirs(PERFIS_DIR, exist_ok=True)
+        base = os.path.join(PERFIS_DIR, f"{self.nome}-{datetime.now():%Y%m%d-%H%M%S}")
+        self._perfil.dump_stats(base + ".prof")
+        resumo = io.StringIO()
+        pstats.Stats(self._perfil, stream=resumo).sort_stats("cumulative").print_stats(self.LINHAS_RESUMO)
+        resumo.write(f"\nMemória alocada durante a ação: {atual / 1024:.0f} KB (pico {pico / 1024:.0f} KB)\n")
+        for estatistica in memoria.statistics("lineno")[:self.LINHAS_RESUMO]:
+            resumo.write(f"{estatistica}\n")
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            f.write(resumo.getvalue())
+        self.caminho = base + ".prof"
+        _ultimo_perfil = self.caminho
+
+
+# A próxima medição iniciada na thread principal é perfilada; liga a
+# instrumentação, se estiver desligada
+def armar_perfil():
+    global _perfil_armado
+    _perfil_armado = True
+    if not _ativa:
+        ativar()
+
+
+def perfil_armado():
+    return _perfil_armado
+
+
+def ultimo_perfil():
+    return _ultimo_perfil
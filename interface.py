@@ -0,0 +1,753 @@
+import sys
+import os
+from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
+                             QPushButton, QLabel, QLineEdit, QTableView, QListView, QToolButton,
+                             QTabWidget, QListWidget, QListWidgetItem, QMessageBox, QFileDialog, QInputDialog)
+from PyQt6.QtCore import Qt, QUrl, QTimer, QFileSystemWatcher, pyqtSignal
+from PyQt6.QtGui import QDesktopServices, QShortcut, QKeySequence
+from datetime import datetime
+import time
+from configuracao import DOCUMENTOS_DIR
+from armazenamento import novo_id, descrever_conflitos, ConflitoConcorrencia
+from repositorio import obter_repositorio
+from documentos import (obter_armazem, criar_referencia, nome_documento, digest_documento, documentos_legados,
+                        tarefa_migrar_documentos, aplicar_migracao)
+from modelos_qt import ModeloProjetos, FiltroProjetos, ModeloDespesas, ModeloDocumentos, DelegateDocumento
+from tarefas import GerenciadorTarefas, PainelTarefas
+from exportacao import tarefa_exportar, tarefa_importar
+from dialogos import DialogoExportacao, DialogoDespesas
+from relatorio import tarefa_relatorio
+from ingestao import tarefa_ingerir
+from manutencao import (coletar_referencias, descrever_verificacao, tarefa_verificar_documentos,
+                        tarefa_recuperar_espaco)
+from busca import trechos
+from resumo import PainelResumo
+from diagnostico import PainelDiagnostico, MonitorTravamentos
+from instrumentacao import instrumentado
+
+# Funções executadas pelas tarefas em segundo plano (fora da thread da interface)
+def _tarefa_anexar(tarefa, arquivo):
+    tarefa.definir_total(os.path.getsize(arquivo))
+    digest, tamanho = obter_armazem().ingerir(arquivo, progresso=tarefa.avancar)
+    return criar_referencia(os.path.basename(arquivo), digest, tamanho)
+
+# Classe principal de gerenciamento de projetos
+class ProjetoManager(QMainWindow):
+    # Emitido pela thread da gravação em segundo plano quando ela falha
+    falha_gravacao = pyqtSignal()
+
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("Gerenciamento de Projetos de IC")
+        self.setGeometry(100, 100, 800, 600)
+
+        # Cria o diretório para documentos se não existir
+        if not os.path.exists(DOCUMENTOS_DIR):
+            os.makedirs(DOCUMENTOS_DIR)
+
+        self.repositorio = obter_repositorio()
+        self.armazem = obter_armazem()
+        self.repositorio.observar(self._ao_alterar_projeto)
+        # Abas de projetos abertas, por id do projeto
+        self.paginas_projetos = {}
+        # Cópias, exportações e importações rodam fora da thread da interface
+        self.tarefas = GerenciadorTarefas(self)
+
+        # Tab principal para cadastrar e visualizar projetos
+        self.tab_widget = QTabWidget()
+        central = QWidget()
+        layout_central = QVBoxLayout(central)
+        layout_central.addWidget(self.tab_widget)
+        # Tarefas em andamento, abaixo das abas
+        layout_central.addWidget(PainelTarefas(self.tarefas))
+        self.setCentralWidget(central)
+
+        # Documentos soltos de versões anteriores passam para o armazém numa
+        # tarefa; as referências são trocadas ao concluir
+        legados = documentos_legados(self.repositorio, self.armazem)
+        if legados:
+            self.tarefas.executar("Migrando documentos antigos", tarefa_migrar_documentos, self.armazem, legados,
+                                  ao_concluir=lambda referencias: self.concluir_migracao(legados, referencias),
+                                  ao_falhar=self.tarefa_falhou)
+
+        # Aba para cadastrar novos projetos
+        self.tab_cadastrar = QWidget()
+        self.tab_widget.addTab(self.tab_cadastrar, "Cadastrar Projeto")
+        self.layout_cadastrar = QVBoxLayout(self.tab_cadastrar)
+
+        # Campos de entrada para cadastro de projeto
+        self.nome_input = QLineEdit()
+        self.responsavel_input = QLineEdit()
+        self.valor_input = QLineEdit()
+
+        self.layout_cadastrar.addWidget(QLabel("Nome do Projeto:"))
+        self.layout_cadastrar.addWidget(self.nome_input)
+        self.layout_cadastrar.addWidget(QLabel("Responsável:"))
+        self.layout_cadastrar.addWidget(self.responsavel_input)
+        self.layout_cadastrar.addWidget(QLabel("Valor Financiamento:"))
+        self.layout_cadastrar.addWidget(self.valor_input)
+
+        cadastrar_button = QPushButton("Salvar Projeto")
+        cadastrar_button.clicked.connect(self.salvar_projeto)
+        self.layout_cadastrar.addWidget(cadastrar_button)
+
+        # Botão para exportar projeto
+        exportar_button = QPushButton("Exportar Projetos")
+        exportar_button.clicked.connect(self.exportar_projeto)
+        self.layout_cadastrar.addWidget(exportar_button)
+
+        # Botão para importar projeto
+        importar_button = QPushButton("Importar Projetos")
+        importar_button.clicked.connect(self.importar_projeto)
+        self.layout_cadastrar.addWidget(importar_button)
+
+        # Botão para importar todos os ZIPs de uma pasta
+        importar_pasta_button = QPushButton("Importar Pasta de Projetos")
+        importar_pasta_button.clicked.connect(self.importar_pasta)
+        self.layout_cadastrar.addWidget(importar_pasta_button)
+
+        # Confere os documentos contra os anexos e apaga os que sobraram
+        verificar_documentos_button = QPushButton("Verificar Documentos")
+        verificar_documentos_button.clicked.connect(self.verificar_documentos)
+        self.layout_cadastrar.addWidget(verificar_documentos_button)
+
+        # Aba para visualizar projetos
+        self.tab_visualizar = QWidget()
+        self.tab_widget.addTab(self.tab_visualizar, "Projetos Cadastrados")
+        self.layout_visualizar = QVBoxLayout(self.tab_visualizar)
+
+        # Busca em projetos, despesas, NF-e e nomes de documentos: a tabela
+        # mostra só os projetos encontrados e a lista abaixo da busca, os mais
+        # relevantes com o que foi encontrado em cada um
+        self.filtro_input = QLineEdit()
+        self.filtro_input.setPlaceholderText("Buscar projetos, despesas, NF-e ou documentos...")
+        self.layout_visualizar.addWidget(self.filtro_input)
+        self.resultados_busca = QListWidget()
+        self.resultados_busca.setMaximumHeight(150)
+        self.resultados_busca.setVisible(False)
+        self.resultados_busca.itemActivated.connect(self.abrir_resultado_busca)
+        self.layout_visualizar.addWidget(self.resultados_busca)
+        # Espera uma pausa na digitação antes de buscar
+        self.temporizador_busca = QTimer(self)
+        self.temporizador_busca.setSingleShot(True)
+        self.temporizador_busca.setInterval(150)
+        self.temporizador_busca.timeout.connect(self.buscar)
+        self.filtro_input.textChanged.connect(self.temporizador_busca.start)
+        # Refaz a busca ativa quando os projetos mudam
+        self.repositorio.observar(lambda evento, projeto_id: self.filtro_input.text().strip()
+                                  and self.temporizador_busca.start())
+
+        # Tabela virtualizada: só as linhas visíveis são consultadas no modelo
+        self.modelo_projetos = ModeloProjetos(self.repositorio, self)
+        self.filtro_projetos = FiltroProjetos(self.modelo_projetos, self)
+        self.tabela = QTableView()
+        self.tabela.setModel(self.filtro_projetos)
+        self.tabela.setSortingEnabled(True)
+        self.tabela.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
+        self.tabela.setSelectionMode(QTableView.SelectionMode.ExtendedSelection)
+        self.tabela.doubleClicked.connect(self.on_cell_double_clicked)
+        self.layout_visualizar.addWidget(self.tabela)
+
+        # Botão para gerar relatório de todos os projetos
+        gerar_relatorio_todos_button = QPushButton("Gerar Relatório de Todos os Projetos")
+        gerar_relatorio_todos_button.clicked.connect(self.gerar_relatorio_todos_projetos)
+        self.layout_visualizar.addWidget(gerar_relatorio_todos_button)
+
+        # Aba com financiamento x gasto de todos os projetos
+        self.tab_widget.addTab(PainelResumo(self.repositorio), "Resumo Financeiro")
+
+        # Tempos medidos pela instrumentação e travamentos da interface
+        self.monitor_travamentos = MonitorTravamentos(self)
+        self.tab_widget.addTab(PainelDiagnostico(), "Diagnóstico")
+
+        # As alterações são gravadas em lote logo depois de feitas; Ctrl+S grava na hora
+        QShortcut(QKeySequence.StandardKey.Save, self, activated=self.salvar_alteracoes)
+        # Uma gravação em lote que falha é avisada na thread da interface
+        self.falha_gravacao.connect(self.avisar_falha_gravacao)
+        self.repositorio.observar_falhas(self.falha_gravacao.emit)
+
+        # Outras instâncias podem gravar nos mesmos dados: ao mudar um dos
+        # arquivos, só os projetos alterados são relidos. A pasta também é
+        # observada porque a troca atômica de um arquivo tira ele do watcher.
+        self.observador_arquivos = QFileSystemWatcher(self)
+        self.temporizador_sincronizacao = QTimer(self)
+        self.temporizador_sincronizacao.setSingleShot(True)
+        self.temporizador_sincronizacao.setInterval(200)
+        self.temporizador_sincronizacao.timeout.connect(self.sincronizar_dados)
+        self.observador_arquivos.fileChanged.connect(self.temporizador_sincronizacao.start)
+        self.observador_arquivos.directoryChanged.connect(self.temporizador_sincronizacao.start)
+        self._observar_arquivos()
+        # No modo cliente não há arquivos: a assinatura (avisada pelo servidor)
+        # é conferida periodicamente, sem custo enquanto nada muda
+        if not self.repositorio.armazenamento.arquivos_observados():
+            self.temporizador_remoto = QTimer(self)
+            self.temporizador_remoto.setInterval(500)
+            self.temporizador_remoto.timeout.connect(self.sincronizar_dados)
+            self.temporizador_remoto.start()
+
+        self.atualizar_tabela()
+
+    def closeEvent(self, event):
+        # Interrompe as tarefas em andamento antes de fechar o armazenamento
+        self.tarefas.cancelar_todas()
+        self.tarefas.aguardar()
+        # Grava as alterações na fila e incorpora as pendentes do diário antes de
+        # sair; se a gravação falhar a janela continua aberta
+        try:
+            self.repositorio.fechar()
+        except Exception as e:
+            QMessageBox.critical(self, "Erro", f"Não foi possível gravar as alterações: {e}")
+            event.ignore()
+            return
+        super().closeEvent(event)
+
+    def _observar_arquivos(self):
+        arquivos = self.repositorio.armazenamento.arquivos_observados()
+        pastas = {os.path.dirname(os.path.abspath(arquivo)) for arquivo in arquivos}
+        observados = set(self.observador_arquivos.files()) | set(self.observador_arquivos.directories())
+        novos = [caminho for caminho in arquivos + sorted(pastas)
+                 if caminho not in observados and os.path.exists(caminho)]
+        if novos:
+            self.observador_arquivos.addPaths(novos)
+
+    def sincronizar_dados(self):
+        self._observar_arquivos()
+        try:
+            self.repositorio.sincronizar()
+        except Exception as e:
+            self.statusBar().showMessage(f"Não foi possível ler as alterações de outra instância: {e}", 5000)
+            return
+        # Alterações gravadas em segundo plano e recusadas por conflitarem com outra instância
+        conflitos = self.repositorio.tomar_conflitos()
+        if conflitos:
+            QMessageBox.warning(self, "Alterações em conflito", descrever_conflitos(conflitos))
+        self.avisar_falha_gravacao()
+
+    # A fila continua e é gravada de novo sozinha; Ctrl+S tenta na hora
+    def avisar_falha_gravacao(self):
+        erro = self.repositorio.tomar_erro_gravacao()
+        if erro is not None:
+            QMessageBox.warning(self, "Alterações não gravadas",
+                                f"Não foi possível gravar as alterações: {erro}\n\n"
+                                "A gravação será tentada de novo; use Ctrl+S para tentar agora.")
+
+    def salvar_alteracoes(self):
+        pendentes = self.repositorio.pendentes()
+        try:
+            self.repositorio.salvar()
+        except Exception as e:
+            QMessageBox.critical(self, "Erro", f"Não foi possível gravar as alterações: {e}")
+            return
+        self.statusBar().showMessage(f"{pendentes} alteração(ões) gravada(s)", 3000)
+
+    def salvar_projeto(self):
+        try:
+            novo_projeto = {
+                "id": novo_id(),
+                "nome": self.nome_input.text(),
+                "responsavel": self.responsavel_input.text(),
+                "valor_financiamento": float(self.valor_input.text()),
+                "despesas": [],  # Inicialmente, a lista de despesas é vazia
+                "data_cadastro": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "orcamentos": [],  # Inicialização da lista de orçamentos
+                "nfe": [],         # Inicialização da lista de NF-e
+                "comprovantes": [],  # Inicialização da lista de comprovantes
+                "arquivos_adicionais": []  # Inicialização da lista de arquivos adicionais
+            }
+            self.repositorio.inserir_projeto(novo_projeto)
+            QMessageBox.information(self, "Sucesso", "Projeto cadastrado com sucesso!")
+            self.nome_input.clear()
+            self.responsavel_input.clear()
+            self.valor_input.clear()
+            self.atualizar_tabela()
+        except ValueError:
+            QMessageBox.warning(self, "Erro", "Valor de financiamento inválido.")
+
+    @instrumentado("interface.atualizar_tabela")
+    def atualizar_tabela(self):
+        # O modelo já acompanha as alterações feitas por esta instância; a consulta
+        # ao repositório só recarrega (e reinicia o modelo) se outra instância gravou
+        self.repositorio.projetos()
+
+        # Leituras servidas da memória (acertos) x recargas do disco (falhas)
+        estatisticas = self.repositorio.estatisticas()
+        self.statusBar().showMessage(
+            f"Cache: {estatisticas['acertos']} acertos, {estatisticas['falhas']} falhas"
+        )
+
+    RESULTADOS_EXIBIDOS = 50
+
+    @instrumentado("interface.busca")
+    def buscar(self):
+        consulta = self.filtro_input.text()
+        self.resultados_busca.clear()
+        if not consulta.strip():
+            self.filtro_projetos.definir_ids(None)
+            self.resultados_busca.setVisible(False)
+            return
+        inicio = time.perf_counter()
+        resultados = self.repositorio.buscar(consulta)
+        duracao = (time.perf_counter() - inicio) * 1000
+        self.filtro_projetos.definir_ids({projeto["id"] for projeto, _ in resultados})
+        for projeto, _ in resultados[:self.RESULTADOS_EXIBIDOS]:
+            texto = f"{projeto['nome']} — {projeto['responsavel']}"
+            encontrados = trechos(projeto, consulta)
+            if encontrados:
+                texto += "  |  " + "; ".join(encontrados[:3])
+            item = QListWidgetItem(texto)
+            item.setData(Qt.ItemDataRole.UserRole, projeto["id"])
+            self.resultados_busca.addItem(item)
+        self.resultados_busca.setVisible(bool(resultados))
+        self.statusBar().showMessage(f"{len(resultados)} projeto(s) encontrado(s) em {duracao:.1f} ms", 5000)
+
+    def abrir_resultado_busca(self, item):
+        projeto = self.repositorio.obter_projeto(item.data(Qt.ItemDataRole.UserRole))
+        if projeto is not None:
+            self.abrir_pagina_projeto(projeto)
+
+    def on_cell_double_clicked(self, index):
+        # Busca apenas o projeto da linha; o repositório recarrega se outra instância gravou
+        projeto = None
+        if index.isValid():
+            projeto = self.repositorio.obter_projeto(self.filtro_projetos.id_do_indice(index))
+        if projeto is not None:
+            self.abrir_pagina_projeto(projeto)
+        else:
+            print(f"Invalid row index: {index.row()}")
+
+    @instrumentado("interface.aba_projeto")
+    def abrir_pagina_projeto(self, projeto):
+        # Reaproveita a aba se o projeto já estiver aberto
+        pagina = self.paginas_projetos.get(projeto["id"])
+        if pagina is not None:
+            self.tab_widget.setCurrentWidget(pagina)
+            return
+
+        projeto_tab = QWidget()
+        projeto_tab.modelos = []
+        projeto_tab.secoes = {}
+        self.paginas_projetos[projeto["id"]] = projeto_tab
+        self.tab_widget.addTab(projeto_tab, projeto["nome"])
+        layout = QVBoxLayout(projeto_tab)
+
+        projeto_tab.nome_label = QLabel()
+        projeto_tab.responsavel_label = QLabel()
+        projeto_tab.valor_label = QLabel()
+        layout.addWidget(projeto_tab.nome_label)
+        layout.addWidget(projeto_tab.responsavel_label)
+        layout.addWidget(projeto_tab.valor_label)
+
+        # Botão para excluir projeto
+        excluir_projeto_button = QPushButton("Excluir Projeto")
+        excluir_projeto_button.clicked.connect(lambda: self.excluir_projeto(projeto))
+        layout.addWidget(excluir_projeto_button)
+
+        # Botão para editar projeto
+        editar_projeto_button = QPushButton("Editar Projeto")
+        editar_projeto_button.clicked.connect(lambda: self.editar_projeto(self.repositorio.obter_projeto(projeto["id"])))
+        layout.addWidget(editar_projeto_button)
+
+        # Botão para gerar relatório do projeto
+        gerar_relatorio_projeto_button = QPushButton("Gerar Relatório do Projeto")
+        gerar_relatorio_projeto_button.clicked.connect(lambda: self.gerar_relatorio_projeto(self.repositorio.obter_projeto(projeto["id"])))
+        layout.addWidget(gerar_relatorio_projeto_button)
+
+        # Tabela de despesas (só as linhas visíveis são consultadas no modelo)
+        despesas_label = QLabel("Despesas:")
+        layout.addWidget(despesas_label)
+
+        despesas_modelo = ModeloDespesas(self.repositorio, projeto["id"], projeto_tab)
+        projeto_tab.modelos.append(despesas_modelo)
+        despesas_table = QTableView()
+        despesas_table.setModel(despesas_modelo)
+        layout.addWidget(despesas_table)
+
+        # Botão para adicionar nova despesa
+        adicionar_despesa_button = QPushButton("Adicionar Despesa")
+        adicionar_despesa_button.clicked.connect(lambda: self.adicionar_despesa(projeto))
+        layout.addWidget(adicionar_despesa_button)
+
+        # Várias despesas de uma vez (digitadas ou coladas de uma planilha)
+        adicionar_despesas_button = QPushButton("Adicionar Várias Despesas")
+        adicionar_despesas_button.clicked.connect(lambda: self.adicionar_despesas(projeto))
+        layout.addWidget(adicionar_despesas_button)
+
+        # Despesas lidas de NF-e (XML) e planilhas (CSV), com os arquivos anexados
+        importar_notas_button = QPushButton("Importar NF-e (XML) / CSV")
+        importar_notas_button.clicked.connect(lambda: self.importar_notas(projeto))
+        layout.addWidget(importar_notas_button)
+
+        # Seções de documentos: a lista só é montada quando a seção é expandida
+        self.criar_secao_documentos(layout, projeto_tab, projeto, "orcamentos", "Orçamentos",
+                                    "Adicionar Orçamento", self.adicionar_orcamento)
+        self.criar_secao_documentos(layout, projeto_tab, projeto, "nfe", "Notas Fiscais (NF-e)",
+                                    "Adicionar NF-e", self.adicionar_nfe)
+        self.criar_secao_documentos(layout, projeto_tab, projeto, "comprovantes", "Comprovantes de Pagamento",
+                                    "Adicionar Comprovante", self.adicionar_comprovante)
+        self.criar_secao_documentos(layout, projeto_tab, projeto, "arquivos_adicionais", "Arquivos Adicionais",
+                                    "Adicionar Arquivo Adicional", self.adicionar_arquivo_adicional)
+
+        self.atualizar_cabecalho_pagina(projeto_tab, projeto)
+        self.tab_widget.setCurrentWidget(projeto_tab)
+
+    def criar_secao_documentos(self, layout, projeto_tab, projeto, tipo, titulo, texto_botao, adicionar):
+        secao_button = QToolButton()
+        secao_button.setCheckable(True)
+        secao_button.setArrowType(Qt.ArrowType.RightArrow)
+        secao_button.setToolButtonStyle(Qt.ToolButtonStyle.ToolButtonTextBesideIcon)
+        layout.addWidget(secao_button)
+        projeto_tab.secoes[tipo] = (secao_button, titulo)
+
+        conteudo = QWidget()
+        conteudo_layout = QVBoxLayout(conteudo)
+        conteudo_layout.setContentsMargins(0, 0, 0, 0)
+        conteudo.setVisible(False)
+        layout.addWidget(conteudo)
+
+        def expandir(aberta):
+            secao_button.setArrowType(Qt.ArrowType.DownArrow if aberta else Qt.ArrowType.RightArrow)
+            if aberta and conteudo_layout.count() == 0:
+                modelo = ModeloDocumentos(self.repositorio, projeto["id"], tipo, projeto_tab)
+                projeto_tab.modelos.append(modelo)
+                lista = QListView()
+                lista.setUniformItemSizes(True)
+                lista.setModel(modelo)
+                delegate = DelegateDocumento(lista)
+                # Enfileiradas para não alterar o modelo dentro do evento de clique
+                delegate.abrir.connect(self.abrir_documento, Qt.ConnectionType.QueuedConnection)
+                delegate.excluir.connect(lambda referencia: self.excluir_arquivo(projeto, referencia, tipo),
+                                         Qt.ConnectionType.QueuedConnection)
+                lista.setItemDelegate(delegate)
+                conteudo_layout.addWidget(lista)
+            conteudo.setVisible(aberta)
+
+        secao_button.toggled.connect(expandir)
+
+        adicionar_button = QPushButton(texto_botao)
+        adicionar_button.clicked.connect(lambda: adicionar(projeto))
+        layout.addWidget(adicionar_button)
+
+    def atualizar_cabecalho_pagina(self, projeto_tab, projeto):
+        self.tab_widget.setTabText(self.tab_widget.indexOf(projeto_tab), projeto["nome"])
+        projeto_tab.nome_label.setText(f"Nome: {projeto['nome']}")
+        projeto_tab.responsavel_label.setText(f"Responsável: {projeto['responsavel']}")
+        projeto_tab.valor_label.setText(f"Valor Financiamento: R$ {projeto['valor_financiamento']:.2f}")
+        for tipo, (secao_button, titulo) in projeto_tab.secoes.items():
+            secao_button.setText(f"{titulo} ({len(projeto[tipo])})")
+
+    def fechar_pagina_projeto(self, projeto_id):
+        projeto_tab = self.paginas_projetos.pop(projeto_id, None)
+        if projeto_tab is None:
+            return
+        for modelo in projeto_tab.modelos:
+            modelo.desconectar()
+        self.tab_widget.removeTab(self.tab_widget.indexOf(projeto_tab))
+        projeto_tab.deleteLater()
+
+    # Mantém as abas abertas em dia com as alterações do repositório
+    def _ao_alterar_projeto(self, evento, projeto_id):
+        ids = list(self.paginas_projetos) if evento == "recarregado" else [projeto_id]
+        for pid in ids:
+            projeto_tab = self.paginas_projetos.get(pid)
+            if projeto_tab is None:
+                continue
+            projeto = self.repositorio.obter_projeto(pid)
+            if projeto is None:
+                self.fechar_pagina_projeto(pid)
+            else:
+                self.atualizar_cabecalho_pagina(projeto_tab, projeto)
+
+    def excluir_arquivo(self, projeto, referencia, tipo):
+        self.repositorio.remover_documento(projeto["id"], tipo, referencia)
+        # O arquivo só é apagado depois que a remoção da referência está gravada
+        try:
+            self.repositorio.salvar()
+        except Exception as e:
+            QMessageBox.critical(self, "Erro", f"Não foi possível gravar as alterações: {e}")
+            return
+        # Blobs sem referência ficam para Verificar Documentos (manutencao.recuperar_espaco),
+        # que respeita a idade mínima: outra instância pode ter uma referência
+        # ao mesmo conteúdo ainda na fila de gravação
+        if digest_documento(referencia) is None:
+            caminho = self.armazem.caminho_documento(referencia)
+            if os.path.exists(caminho):
+                os.remove(caminho)
+        QMessageBox.information(self, "Sucesso", f"Arquivo {nome_documento(referencia)} excluído com sucesso!")
+        self.atualizar_tabela()
+
+    # Os documentos que só este projeto usava viram órfãos, apagados por
+    # Verificar Documentos (ver excluir_arquivo)
+    def excluir_projeto(self, projeto):
+        # A aba do projeto é fechada pelo observador do repositório
+        self.repositorio.remover_projeto(projeto["id"])
+        try:
+            self.repositorio.salvar()
+        except Exception as e:
+            QMessageBox.critical(self, "Erro", f"Não foi possível gravar as alterações: {e}")
+            return
+        self.atualizar_tabela()
+        QMessageBox.information(self, "Sucesso", "Projeto excluído com sucesso!")
+
+    # Só os campos alterados são gravados, conferidos contra os valores vistos
+    # ao abrir a edição: se outra instância mudou algum deles enquanto os
+    # diálogos estavam abertos, a edição é recusada em vez de sobrescrevê-la
+    def editar_projeto(self, projeto):
+        lidos = {campo: projeto[campo] for campo in ("nome", "responsavel", "valor_financiamento")}
+        nome, ok1 = QInputDialog.getText(self, "Editar Nome do Projeto", "Insira o novo nome do projeto:", text=lidos["nome"])
+        if ok1:
+            responsavel, ok2 = QInputDialog.getText(self, "Editar Responsável", "Insira o novo responsável:", text=lidos["responsavel"])
+            if ok2:
+                valor, ok3 = QInputDialog.getDouble(self, "Editar Valor Financiamento", "Insira o novo valor de financiamento:", lidos["valor_financiamento"], 0.0, 0.0)
+                if ok3:
+                    novos = {"nome": nome, "responsavel": responsavel, "valor_financiamento": valor}
+                    alterados = {campo: valor for campo, valor in novos.items() if valor != lidos[campo]}
+                    if alterados:
+                        try:
+                            self.repositorio.atualizar_projeto(projeto["id"], alterados, esperado=lidos)
+                        except ConflitoConcorrencia as e:
+                            QMessageBox.warning(self, "Alterações em conflito", str(e))
+                            return
+                    QMessageBox.information(self, "Sucesso", "Projeto editado com sucesso!")
+                    self.atualizar_tabela()
+
+    def adicionar_despesa(self, projeto):
+        nome, ok1 = QInputDialog.getText(self, "Nome da Despesa", "Insira o nome da despesa:")
+        if ok1:
+            descricao, ok2 = QInputDialog.getText(self, "Descrição da Despesa", "Insira a descrição da despesa:")
+            if ok2:
+                valor, ok3 = QInputDialog.getDouble(self, "Valor da Despesa", "Insira o valor da despesa:", 0.0, 0.0)
+                if ok3:
+                    nfe, ok4 = QInputDialog.getText(self, "NF-e", "Insira a NF-e:")
+                    if ok4:
+                        despesa = {
+                            "id": novo_id(),
+                            "nome": nome,
+                            "descricao": descricao,
+                            "valor": valor,
+                            "nfe": nfe
+                        }
+                        self.repositorio.adicionar_despesa(projeto["id"], despesa)
+                        QMessageBox.information(self, "Sucesso", "Despesa adicionada com sucesso!")
+                        self.atualizar_tabela()
+
+    # As despesas do diálogo entram numa única alteração (uma gravação)
+    def adicionar_despesas(self, projeto):
+        dialogo = DialogoDespesas(self)
+        if not dialogo.exec():
+            return
+        despesas = dialogo.despesas()
+        if despesas:
+            self.repositorio.adicionar_despesas(projeto["id"], despesas)
+            QMessageBox.information(self, "Sucesso", f"{len(despesas)} despesa(s) adicionada(s) com sucesso!")
+            self.atualizar_tabela()
+
+    # Os arquivos são lidos em paralelo numa tarefa; cada lote de despesas é
+    # gravado no projeto numa única alteração ao concluir
+    def importar_notas(self, projeto):
+        arquivos, _ = QFileDialog.getOpenFileNames(self, "Importar NF-e e CSV", "",
+                                                   "NF-e e planilhas (*.xml *.csv);;Todos os Arquivos (*)")
+        if not arquivos:
+            return
+        descricao = os.path.basename(arquivos[0]) if len(arquivos) == 1 else f"{len(arquivos)} arquivos"
+        self.tarefas.executar(f"Lendo {descricao}", tarefa_ingerir, arquivos, self.repositorio.chaves_nfe(),
+                              self.repositorio.digests_documentos(),
+                              ao_concluir=lambda resultado: self.concluir_importacao_notas(projeto["id"], resultado),
+                              ao_falhar=self.tarefa_falhou)
+
+    def concluir_importacao_notas(self, projeto_id, resultado):
+        if self.repositorio.obter_projeto(projeto_id) is None:
+            QMessageBox.warning(self, "Erro", "O projeto foi excluído antes do fim da importação.")
+            return
+        adicionadas = 0
+        duplicadas = resultado["duplicadas"]
+        for despesas, documentos in resultado["lotes"]:
+            # Notas cadastradas enquanto os arquivos eram lidos
+            novas = [d for d in despesas if not (d["nfe"] and self.repositorio.despesas_por_nfe(d["nfe"]))]
+            duplicadas += len(despesas) - len(novas)
+            if novas:
+                self.repositorio.adicionar_despesas(projeto_id, novas, documentos)
+                adicionadas += len(novas)
+        mensagem = f"{adicionadas} despesa(s) importada(s), {duplicadas} já cadastrada(s) ignorada(s)."
+        if resultado["erros"]:
+            mensagem += "\n\nArquivos com erro:\n" + "\n".join(
+                f"{os.path.basename(arquivo)}: {erro}" for arquivo, erro in resultado["erros"][:20])
+            QMessageBox.warning(self, "Importação", mensagem)
+        else:
+            QMessageBox.information(self, "Sucesso", mensagem)
+        self.atualizar_tabela()
+
+    def adicionar_orcamento(self, projeto):
+        orcamentos, _ = QFileDialog.getOpenFileNames(self, "Adicionar Orçamentos", "", "Arquivos PDF (*.pdf);;Todos os Arquivos (*)")
+        self.anexar_documentos(projeto, "orcamentos", orcamentos, "Orçamento adicionado com sucesso!")
+
+    def adicionar_nfe(self, projeto):
+        nfes, _ = QFileDialog.getOpenFileNames(self, "Adicionar NF-e", "", "Arquivos PDF (*.pdf);;Todos os Arquivos (*)")
+        self.anexar_documentos(projeto, "nfe", nfes, "NF-e adicionada com sucesso!")
+
+    def adicionar_comprovante(self, projeto):
+        comprovantes, _ = QFileDialog.getOpenFileNames(self, "Selecionar Comprovantes", "", "Arquivos PDF (*.pdf);;Todos os Arquivos (*)")
+        self.anexar_documentos(projeto, "comprovantes", comprovantes, "Comprovante adicionado com sucesso!")
+
+    def adicionar_arquivo_adicional(self, projeto):
+        arquivos, _ = QFileDialog.getOpenFileNames(self, "Adicionar Arquivos Adicionais", "", "Todos os Arquivos (*)")
+        self.anexar_documentos(projeto, "arquivos_adicionais", arquivos, "Arquivo adicional adicionado com sucesso!")
+
+    # Cada arquivo selecionado vira uma tarefa: a cópia para o armazém (uma vez
+    # por conteúdo) roda no pool e a referência ao blob, com o nome original
+    # para exibição, é gravada no projeto ao concluir, na thread da interface
+    def anexar_documentos(self, projeto, tipo, arquivos, mensagem):
+        for arquivo in arquivos:
+            def concluir(referencia, arquivo=arquivo):
+                self.repositorio.adicionar_documento(projeto["id"], tipo, referencia)
+                self.statusBar().showMessage(f"{os.path.basename(arquivo)}: {mensagem}", 5000)
+            self.tarefas.executar(f"Copiando {os.path.basename(arquivo)}", _tarefa_anexar, arquivo,
+                                  ao_concluir=concluir, ao_falhar=self.tarefa_falhou)
+
+    # A varredura roda numa tarefa, sobre as referências coletadas com a fila gravada
+    def verificar_documentos(self):
+        resposta = QMessageBox.question(
+            self, "Verificar Documentos",
+            "Conferir também o conteúdo (sha256) de cada arquivo? É mais demorado.",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No | QMessageBox.StandardButton.Cancel)
+        if resposta == QMessageBox.StandardButton.Cancel:
+            return
+        try:
+            self.repositorio.salvar()
+        except Exception as e:
+            QMessageBox.critical(self, "Erro", f"Não foi possível gravar as alterações: {e}")
+            return
+        referencias = coletar_referencias(self.repositorio.projetos())
+        self.tarefas.executar("Verificando documentos", tarefa_verificar_documentos, self.armazem, referencias,
+                              resposta == QMessageBox.StandardButton.Yes,
+                              ao_concluir=self.concluir_verificacao, ao_falhar=self.tarefa_falhou)
+
+    def concluir_verificacao(self, resultado):
+        texto = descrever_verificacao(resultado)
+        if not resultado["bytes_recuperaveis"] and not resultado["abertos_orfaos"]:
+            QMessageBox.information(self, "Verificação de documentos", texto)
+            return
+        resposta = QMessageBox.question(self, "Verificação de documentos",
+                                        texto + "\n\nApagar os arquivos sem referência?")
+        if resposta != QMessageBox.StandardButton.Yes:
+            return
+        # Referências coletadas de novo: o que foi anexado nesse meio tempo fica
+        try:
+            self.repositorio.salvar()
+        except Exception as e:
+            QMessageBox.critical(self, "Erro", f"Não foi possível gravar as alterações: {e}")
+            return
+        referencias = coletar_referencias(self.repositorio.projetos())
+        self.tarefas.executar("Apagando documentos sem referência", tarefa_recuperar_espaco, self.armazem,
+                              resultado, referencias, ao_concluir=self.concluir_recuperacao,
+                              ao_falhar=self.tarefa_falhou)
+
+    def concluir_recuperacao(self, apagados):
+        QMessageBox.information(self, "Verificação de documentos",
+                                f"{apagados['arquivos']} arquivo(s) apagado(s), "
+                                f"{apagados['bytes'] / (1024 * 1024):.1f} MB liberados.")
+
+    def concluir_migracao(self, legados, referencias):
+        try:
+            migrados = aplicar_migracao(self.repositorio, legados, referencias)
+        except Exception as e:
+            QMessageBox.critical(self, "Erro", f"Não foi possível migrar os documentos antigos: {e}")
+            return
+        self.statusBar().showMessage(f"{migrados} documento(s) antigo(s) migrado(s) para o armazém", 5000)
+
+    def tarefa_falhou(self, erro):
+        QMessageBox.warning(self, "Erro", f"A operação falhou: {erro}")
+
+    # Exporta os projetos selecionados na tabela (todos os visíveis, se nenhum)
+    def exportar_projeto(self):
+        indices = self.tabela.selectionModel().selectedRows()
+        if not indices:
+            indices = [self.filtro_projetos.index(linha, 0) for linha in range(self.filtro_projetos.rowCount())]
+        if not indices:
+            QMessageBox.warning(self, "Erro", "Selecione um projeto para exportar.")
+            return
+        dialogo = DialogoExportacao(len(indices), self)
+        if not dialogo.exec():
+            return
+        if dialogo.combinado():
+            destino, _ = QFileDialog.getSaveFileName(self, "Salvar Projetos como ZIP", "", "ZIP Files (*.zip)")
+        else:
+            destino = QFileDialog.getExistingDirectory(self, "Pasta para os arquivos ZIP")
+        if not destino:
+            return
+        # Cópias dos projetos: o cache pode mudar enquanto a exportação roda
+        projetos = [self.repositorio.obter_projeto(self.filtro_projetos.id_do_indice(indice)).copia()
+                    for indice in indices]
+        self.tarefas.executar(f"Exportando {len(projetos)} projeto(s)", tarefa_exportar, projetos, destino,
+                              dialogo.combinado(), dialogo.nivel(), dialogo.incremental(),
+                              ao_concluir=lambda arquivos: QMessageBox.information(
+                                  self, "Sucesso", f"{len(projetos)} projeto(s) exportado(s) em {len(arquivos)} arquivo(s)!"),
+                              ao_falhar=self.tarefa_falhou)
+
+    def importar_projeto(self):
+        arquivos, _ = QFileDialog.getOpenFileNames(self, "Importar Projetos", "", "ZIP Files (*.zip)")
+        self.importar_arquivos(arquivos)
+
+    def importar_pasta(self):
+        pasta = QFileDialog.getExistingDirectory(self, "Pasta com arquivos ZIP de projetos")
+        if pasta:
+            self.importar_arquivos(sorted(
+                os.path.join(pasta, nome) for nome in os.listdir(pasta) if nome.lower().endswith(".zip")
+            ))
+
+    # Os ZIPs são lidos em paralelo numa tarefa; os projetos são gravados
+    # todos de uma vez ao concluir
+    def importar_arquivos(self, arquivos):
+        if not arquivos:
+            return
+        descricao = os.path.basename(arquivos[0]) if len(arquivos) == 1 else f"{len(arquivos)} arquivos"
+        self.tarefas.executar(f"Importando {descricao}", tarefa_importar, arquivos,
+                              ao_concluir=self.concluir_importacao, ao_falhar=self.tarefa_falhou)
+
+    def concluir_importacao(self, resultado):
+        projetos, erros = resultado
+        contagem = self.repositorio.importar_projetos(projetos)
+        mensagem = (f"Projetos importados com sucesso! {contagem['inseridos']} novo(s), "
+                    f"{contagem['mesclados']} atualizado(s), {contagem['inalterados']} sem alteração.")
+        if erros:
+            mensagem += "\n\nArquivos com erro:\n" + "\n".join(
+                f"{os.path.basename(arquivo)}: {erro}" for arquivo, erro in erros)
+            QMessageBox.warning(self, "Importação", mensagem)
+        else:
+            QMessageBox.information(self, "Sucesso", mensagem)
+        self.atualizar_tabela()
+
+    def abrir_documento(self, referencia):
+        caminho_documento = self.armazem.caminho_para_abrir(referencia)
+        if os.path.exists(caminho_documento):
+            QDesktopServices.openUrl(QUrl.fromLocalFile(caminho_documento))
+        else:
+            QMessageBox.warning(self, "Erro", "O arquivo não foi encontrado.")
+
+    def gerar_relatorio_projeto(self, projeto):
+        self.gerar_relatorio([projeto])
+
+    def gerar_relatorio_todos_projetos(self):
+        self.gerar_relatorio(self.repositorio.projetos())
+
+    # O relatório é gerado numa tarefa, sobre uma cópia dos projetos
+    def gerar_relatorio(self, projetos):
+        nome_arquivo, _ = QFileDialog.getSaveFileName(self, "Salvar Relatório como PDF", "", "PDF Files (*.pdf)")
+        if nome_arquivo:
+            projetos = [projeto.copia() for projeto in projetos]
+            self.tarefas.executar(f"Relatório de {len(projetos)} projeto(s)", tarefa_relatorio, projetos, nome_arquivo,
+                                  ao_concluir=self.concluir_relatorio, ao_falhar=self.tarefa_falhou)
+
+    def concluir_relatorio(self, resultado):
+        cache = resultado["cache"]
+        QMessageBox.information(
+            self, "Sucesso",
+            f"Relatório gerado com sucesso!\n{resultado['reaproveitados']} projeto(s) reaproveitado(s) do cache, "
+            f"{resultado['renderizados']} renderizado(s).\nCache: {cache['acertos']} acertos, {cache['falhas']} falhas, "
+            f"{cache['fragmentos']} fragmentos ({cache['bytes'] / 1024 / 1024:.1f} MB)."
+        )
+
+def executar_interface():
+    app = QApplication(sys.argv)
+    window = ProjetoManager()
+    window.show()
+    return app.exec()
@@ -1,593 +1,341 @@
+import argparse
 import sys
-import json
-import os
-import zipfile
-from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
-                             QPushButton, QLabel, QLineEdit, QTableWidget,
-                             QTableWidgetItem, QTabWidget, QListWidget, QListWidgetItem, QMessageBox, QFileDialog, QInputDialog, QHBoxLayout)
-from PyQt6.QtCore import Qt, QItemSelectionModel, QItemSelection, QItemSelectionRange, QEvent, QCoreApplication, QUrl
-from PyQt6.QtGui import QDesktopServices
-from datetime import datetime
-from fpdf import FPDF
-import shutil
-
-DATA_FILE = "projetos.json"
-DOCUMENTOS_DIR = "documentos"
-
-# Funções para carregar e salvar dados JSON
-def carregar_dados():
-    if not os.path.exists(DATA_FILE):
-        # Cria um arquivo vazio com a estrutura padrão
-        with open(DATA_FILE, 'w') as f:
-            json.dump({"projetos": []}, f)
-        return {"projetos": []}
-    with open(DATA_FILE, 'r') as f:
-        content = f.read()
-        if not content.strip():
-            return {"projetos": []}
-        return json.loads(content)
-
-def salvar_dados(dados):
-    with open(DATA_FILE, 'w') as f:
-        json.dump(dados, f, indent=4)
-
-# Função para compactar um projeto em um arquivo ZIP
-def compactar_projeto(projeto, nome_arquivo_zip):
-    with zipfile.ZipFile(nome_arquivo_zip, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        # Adiciona o arquivo JSON
-        zipf.writestr('projeto.json', json.dumps(projeto, indent=4))
-
-        # Adiciona os documentos associados
-        for comprovante in projeto["comprovantes"]:
-            caminho_comprovante = os.path.join(DOCUMENTOS_DIR, comprovante)
-            if os.path.exists(caminho_comprovante):
-                zipf.write(caminho_comprovante, os.path.basename(caminho_comprovante))
-
-        for nfe in projeto["nfe"]:
-            caminho_nfe = os.path.join(DOCUMENTOS_DIR, nfe)
-            if os.path.exists(caminho_nfe):
-                zipf.write(caminho_nfe, os.path.basename(caminho_nfe))
-
-        for orcamento in projeto["orcamentos"]:
-            caminho_orcamento = os.path.join(DOCUMENTOS_DIR, orcamento)
-            if os.path.exists(caminho_orcamento):
-                zipf.write(caminho_orcamento, os.path.basename(caminho_orcamento))
-
-        for arquivo_adicional in projeto["arquivos_adicionais"]:
-            caminho_arquivo_adicional = os.path.join(DOCUMENTOS_DIR, arquivo_adicional)
-            if os.path.exists(caminho_arquivo_adicional):
-                zipf.write(caminho_arquivo_adicional, os.path.basename(caminho_arquivo_adicional))
-
-# Função para descompactar um projeto de um arquivo ZIP
-def descompactar_projeto(nome_arquivo_zip):
-    with zipfile.ZipFile(nome_arquivo_zip, 'r') as zipf:
-        zipf.extractall(DOCUMENTOS_DIR)
-        with zipf.open('projeto.json') as f:
-            projeto = json.load(f)
-            return projeto
-
-# Classe de Relatório PDF
-class PDFReport:
-    def __init__(self, projetos):
-        self.projetos = projetos
-
-    def gerar_relatorio(self, nome_arquivo):
-        pdf = FPDF()
-        pdf.add_page()
-        pdf.set_font("Arial", size=12)
-        pdf.cell(200, 10, txt="Relatório de Projetos de Iniciação Científica", ln=True, align='C')
-
-        for projeto in self.projetos:
-            pdf.cell(200, 10, txt=f"Nome: {projeto['nome']}", ln=True)
-            pdf.cell(200, 10, txt=f"Responsável: {projeto['responsavel']}", ln=True)
-            pdf.cell(200, 10, txt=f"Valor Financiamento: R$ {projeto['valor_financiamento']:.2f}", ln=True)
-            pdf.cell(200, 10, txt=f"Data de Cadastro: {projeto['data_cadastro']}", ln=True)
-
-            # Adiciona despesas
-            pdf.cell(200, 10, txt="Despesas:", ln=True)
-            for despesa in projeto["despesas"]:
-                pdf.cell(200, 10, txt=f"  Nome: {despesa['nome']}, Descrição: {despesa['descricao']}, Valor: R$ {despesa['valor']:.2f}, NF-e: {despesa['nfe']}", ln=True)
-
-            # Adiciona orçamentos
-            pdf.cell(200, 10, txt="Orçamentos:", ln=True)
-            for orcamento in projeto["orcamentos"]:
-                pdf.cell(200, 10, txt=f"  {orcamento}", ln=True)
-
-            # Adiciona NF-e
-            pdf.cell(200, 10, txt="Notas Fiscais (NF-e):", ln=True)
-            for nfe in projeto["nfe"]:
-                pdf.cell(200, 10, txt=f"  {nfe}", ln=True)
-
-            # Adiciona comprovantes
-            pdf.cell(200, 10, txt="Comprovantes de Pagamento:", ln=True)
-            for comprovante in projeto["comprovantes"]:
-                pdf.cell(200, 10, txt=f"  {comprovante}", ln=True)
-
-            # Adiciona arquivos adicionais
-            pdf.cell(200, 10, txt="Arquivos Adicionais:", ln=True)
-            for arquivo_adicional in projeto["arquivos_adicionais"]:
-                pdf.cell(200, 10, txt=f"  {arquivo_adicional}", ln=True)
-
-            pdf.cell(200, 10, txt=" ", ln=True)  # Espaço entre projetos
-        pdf.output(nome_arquivo)
-
-# Classe principal de gerenciamento de projetos
-class ProjetoManager(QMainWindow):
-    def __init__(self):
-        super().__init__()
-        self.setWindowTitle("Gerenciamento de Projetos de IC")
-        self.setGeometry(100, 100, 800, 600)
-
-        # Cria o diretório para documentos se não existir
-        if not os.path.exists(DOCUMENTOS_DIR):
-            os.makedirs(DOCUMENTOS_DIR)
-
-        # Tab principal para cadastrar e visualizar projetos
-        self.tab_widget = QTabWidget()
-        self.setCentralWidget(self.tab_widget)
-
-        # Aba para cadastrar novos projetos
-        self.tab_cadastrar = QWidget()
-        self.tab_widget.addTab(self.tab_cadastrar, "Cadastrar Projeto")
-        self.layout_cadastrar = QVBoxLayout(self.tab_cadastrar)
-
-        # Campos de entrada para cadastro de projeto
-        self.nome_input = QLineEdit()
-        self.responsavel_input = QLineEdit()
-        self.valor_input = QLineEdit()
-
-        self.layout_cadastrar.addWidget(QLabel("Nome do Projeto:"))
-        self.layout_cadastrar.addWidget(self.nome_input)
-        self.layout_cadastrar.addWidget(QLabel("Responsável:"))
-        self.layout_cadastrar.addWidget(self.responsavel_input)
-        self.layout_cadastrar.addWidget(QLabel("Valor Financiamento:"))
-        self.layout_cadastrar.addWidget(self.valor_input)
-
-        cadastrar_button = QPushButton("Salvar Projeto")
-        cadastrar_button.clicked.connect(self.salvar_projeto)
-        self.layout_cadastrar.addWidget(cadastrar_button)
-
-        # Botão para exportar projeto
-        exportar_button = QPushButton("Exportar Projeto")
-        exportar_button.clicked.connect(self.exportar_projeto)
-        self.layout_cadastrar.addWidget(exportar_button)
-
-        # Botão para importar projeto
-        importar_button = QPushButton("Importar Projeto")
-        importar_button.clicked.connect(self.importar_projeto)
-        self.layout_cadastrar.addWidget(importar_button)
-
-        # Aba para visualizar projetos
-        self.tab_visualizar = QWidget()
-        self.tab_widget.addTab(self.tab_visualizar, "Projetos Cadastrados")
-        self.layout_visualizar = QVBoxLayout(self.tab_visualizar)
-        self.tabela = QTableWidget()
-        self.layout_visualizar.addWidget(self.tabela)
-
-        # Botão para gerar relatório de todos os projetos
-        gerar_relatorio_todos_button = QPushButton("Gerar Relatório de Todos os Projetos")
-        gerar_relatorio_todos_button.clicked.connect(self.gerar_relatorio_todos_projetos)
-        self.layout_visualizar.addWidget(gerar_relatorio_todos_button)
-
-        self.atualizar_tabela()
-
-    def salvar_projeto(self):
-        dados = carregar_dados()
-        try:
-            novo_projeto = {
-                "nome": self.nome_input.text(),
-                "responsavel": self.responsavel_input.text(),
-                "valor_financiamento": float(self.valor_input.text()),
-                "despesas": [],  # Inicialmente, a lista de despesas é vazia
-                "data_cadastro": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "orcamentos": [],  # Inicialização da lista de orçamentos
-                "nfe": [],         # Inicialização da lista de NF-e
-                "comprovantes": [],  # Inicialização da lista de comprovantes
-                "arquivos_adicionais": []  # Inicialização da lista de arquivos adicionais
-            }
-            dados["projetos"].append(novo_projeto)
-            salvar_dados(dados)
-            QMessageBox.information(self, "Sucesso", "Projeto cadastrado com sucesso!")
-            self.nome_input.clear()
-            self.responsavel_input.clear()
-            self.valor_input.clear()
-            self.atualizar_tabela()
-        except ValueError:
-            QMessageBox.warning(self, "Erro", "Valor de financiamento inválido.")
-
-    def atualizar_tabela(self):
-        dados = carregar_dados()
-        self.tabela.setColumnCount(3)
-        self.tabela.setHorizontalHeaderLabels(["Nome", "Responsável", "Valor Financiamento"])
-        self.tabela.setRowCount(len(dados["projetos"]))
-
-        for i, projeto in enumerate(dados["projetos"]):
-            self.tabela.setItem(i, 0, QTableWidgetItem(projeto["nome"]))
-            self.tabela.setItem(i, 1, QTableWidgetItem(projeto["responsavel"]))
-            self.tabela.setItem(i, 2, QTableWidgetItem(f"R$ {projeto['valor_financiamento']:.2f}"))
-
-        # Conexão do sinal para clicar na célula
-        self.tabela.cellDoubleClicked.connect(self.on_cell_double_clicked)
-
-    def on_cell_double_clicked(self, row):
-        dados = carregar_dados()  # Recarregar dados para garantir que temos a versão mais atual
-        if 0 <= row < len(dados["projetos"]):
-            self.abrir_pagina_projeto(dados["projetos"][row])
+
+# Ponto de entrada. Sem subcomando abre a interface gráfica; com subcomando
+# executa a operação em modo texto, sem display. Os módulos pesados (PyQt6,
+# fpdf, exportação) só são importados pelo comando que precisa deles, para
+# que consultas simples iniciem rápido. Este módulo também é importado pelos
+# processos filhos do relatório (spawn), por isso não faz nada ao ser importado.
+
+
+def _progresso(total, unidade="bytes"):
+    feito = [0]
+
+    def avancar(n):
+        feito[0] += n
+        if sys.stderr.isatty() and total:
+            sys.stderr.write(f"\r{feito[0] * 100 // total:3d}% ({feito[0]}/{total} {unidade})")
+            if feito[0] >= total:
+                sys.stderr.write("\n")
+            sys.stderr.flush()
+    return avancar
+
+
+# Aceita o id completo, um prefixo único do id ou o nome exato do projeto
+def _buscar_projeto(repositorio, chave):
+    projeto = repositorio.obter_projeto(chave)
+    if projeto is not None:
+        return projeto
+    encontrados = [p for p in repositorio.projetos() if p["id"].startswith(chave)] or \
+                  [p for p in repositorio.projetos() if p["nome"] == chave]
+    if not encontrados:
+        raise SystemExit(f"Projeto não encontrado: {chave}")
+    if len(encontrados) > 1:
+        raise SystemExit(f"Mais de um projeto corresponde a {chave!r}; use o id")
+    return encontrados[0]
+
+
+def _selecionar(repositorio, chaves):
+    if not chaves:
+        return list(repositorio.projetos())
+    return [_buscar_projeto(repositorio, chave) for chave in chaves]
+
+
+def comando_relatorio(repositorio, args):
+    from relatorio import PDFReport
+    projetos = _selecionar(repositorio, args.projeto)
+    relatorio = PDFReport(projetos)
+    resultado = relatorio.gerar_relatorio(args.saida, _progresso(len(projetos), "projetos"))
+    print(f"Relatório gerado em {args.saida}: {len(projetos)} projeto(s), "
+          f"{resultado['renderizados']} renderizado(s), {resultado['reaproveitados']} do cache")
+
+
+def comando_exportar(repositorio, args):
+    from exportacao import exportar_projetos, tamanho_exportacao
+    projetos = _selecionar(repositorio, args.projeto)
+    total = tamanho_exportacao(projetos, args.destino, args.combinado, args.incremental)
+    arquivos = exportar_projetos(projetos, args.destino, args.combinado, args.nivel, args.incremental,
+                                 _progresso(total))
+    local = arquivos[0] if args.combinado else args.destino
+    print(f"{len(projetos)} projeto(s) exportado(s) em {len(arquivos)} arquivo(s) em {local}")
+
+
+def comando_importar(repositorio, args):
+    import os
+    from exportacao import ler_projetos_zips, tamanho_importacao
+    arquivos = []
+    for caminho in args.arquivos:
+        if os.path.isdir(caminho):
+            arquivos.extend(sorted(os.path.join(caminho, nome) for nome in os.listdir(caminho)
+                                   if nome.lower().endswith(".zip")))
         else:
-            print(f"Invalid row index: {row}")
-
-    def abrir_pagina_projeto(self, projeto):
-        projeto_tab = QWidget()
-        self.tab_widget.addTab(projeto_tab, projeto["nome"])
-        layout = QVBoxLayout(projeto_tab)
-
-        layout.addWidget(QLabel(f"Nome: {projeto['nome']}"))
-        layout.addWidget(QLabel(f"Responsável: {projeto['responsavel']}"))
-        layout.addWidget(QLabel(f"Valor Financiamento: R$ {projeto['valor_financiamento']:.2f}"))
-
-        # Botão para excluir projeto
-        excluir_projeto_button = QPushButton("Excluir Projeto")
-        excluir_projeto_button.clicked.connect(lambda: self.excluir_projeto(projeto))
-        layout.addWidget(excluir_projeto_button)
-
-        # Botão para editar projeto
-        editar_projeto_button = QPushButton("Editar Projeto")
-        editar_projeto_button.clicked.connect(lambda: self.editar_projeto(projeto))
-        layout.addWidget(editar_projeto_button)
-
-        # Botão para gerar relatório do projeto
-        gerar_relatorio_projeto_button = QPushButton("Gerar Relatório do Projeto")
-        gerar_relatorio_projeto_button.clicked.connect(lambda: self.gerar_relatorio_projeto(projeto))
-        layout.addWidget(gerar_relatorio_projeto_button)
-
-        # Tabela de despesas
-        despesas_label = QLabel("Despesas:")
-        layout.addWidget(despesas_label)
-
-        despesas_table = QTableWidget()
-        despesas_table.setColumnCount(4)
-        despesas_table.setHorizontalHeaderLabels(["Nome", "Descrição", "Valor", "NF-e"])
-        layout.addWidget(despesas_table)
-
-        self.carregar_despesas(projeto, despesas_table)
-
-        # Botão para adicionar nova despesa
-        adicionar_despesa_button = QPushButton("Adicionar Despesa")
-        adicionar_despesa_button.clicked.connect(lambda: self.adicionar_despesa(projeto))
-        layout.addWidget(adicionar_despesa_button)
-
-        # Adiciona orçamentos
-        orcamentos_label = QLabel("Orçamentos:")
-        layout.addWidget(orcamentos_label)
-
-        orcamentos_layout = QVBoxLayout()
-        layout.addLayout(orcamentos_layout)
-
-        for orcamento in projeto["orcamentos"]:
-            orcamento_item = QListWidgetItem(orcamento)
-            orcamento_item.setData(Qt.ItemDataRole.UserRole, os.path.join(DOCUMENTOS_DIR, orcamento))
-            self.add_item_with_delete_button(
-                orcamentos_layout, 
-                orcamento, 
-                orcamento_item, 
-                lambda: self.excluir_arquivo(projeto, os.path.join(DOCUMENTOS_DIR, orcamento), "orcamentos"), 
-                lambda: self.abrir_documento(orcamento_item)
-            )
-
-        # Botão para adicionar orçamento
-        adicionar_orcamento_button = QPushButton("Adicionar Orçamento")
-        adicionar_orcamento_button.clicked.connect(lambda: self.adicionar_orcamento(projeto, orcamentos_layout))
-        layout.addWidget(adicionar_orcamento_button)
-
-        # Adiciona NF-e
-        nfe_label = QLabel("Notas Fiscais (NF-e):")
-        layout.addWidget(nfe_label)
-
-        nfe_layout = QVBoxLayout()
-        layout.addLayout(nfe_layout)
-
-        for nfe in projeto["nfe"]:
-            nfe_item = QListWidgetItem(nfe)
-            nfe_item.setData(Qt.ItemDataRole.UserRole, os.path.join(DOCUMENTOS_DIR, nfe))
-            self.add_item_with_delete_button(
-                nfe_layout, 
-                nfe, 
-                nfe_item, 
-                lambda: self.excluir_arquivo(projeto, os.path.join(DOCUMENTOS_DIR, nfe), "nfe"), 
-                lambda: self.abrir_documento(nfe_item)
-            )
-
-        # Botão para adicionar NF-e
-        adicionar_nfe_button = QPushButton("Adicionar NF-e")
-        adicionar_nfe_button.clicked.connect(lambda: self.adicionar_nfe(projeto, nfe_layout))
-        layout.addWidget(adicionar_nfe_button)
-
-        # Adiciona comprovantes
-        comprovantes_label = QLabel("Comprovantes de Pagamento:")
-        layout.addWidget(comprovantes_label)
-
-        comprovantes_layout = QVBoxLayout()
-        layout.addLayout(comprovantes_layout)
-
-        for comprovante in projeto["comprovantes"]:
-            comprovante_item = QListWidgetItem(comprovante)
-            comprovante_item.setData(Qt.ItemDataRole.UserRole, os.path.join(DOCUMENTOS_DIR, comprovante))
-            self.add_item_with_delete_button(
-                comprovantes_layout, 
-                comprovante, 
-                comprovante_item, 
-                lambda: self.excluir_arquivo(projeto, os.path.join(DOCUMENTOS_DIR, comprovante), "comprovantes"), 
-                lambda: self.abrir_documento(comprovante_item)
-            )
-
-        # Botão para adicionar comprovante
-        adicionar_comprovante_button = QPushButton("Adicionar Comprovante")
-        adicionar_comprovante_button.clicked.connect(lambda: self.adicionar_comprovante(projeto, comprovantes_layout))
-        layout.addWidget(adicionar_comprovante_button)
-
-        # Adiciona arquivos adicionais
-        arquivos_adicionais_label = QLabel("Arquivos Adicionais:")
-        layout.addWidget(arquivos_adicionais_label)
-
-        arquivos_adicionais_layout = QVBoxLayout()
-        layout.addLayout(arquivos_adicionais_layout)
-
-        for arquivo_adicional in projeto["arquivos_adicionais"]:
-            arquivo_adicional_item = QListWidgetItem(arquivo_adicional)
-            arquivo_adicional_item.setData(Qt.ItemDataRole.UserRole, os.path.join(DOCUMENTOS_DIR, arquivo_adicional))
-            self.add_item_with_delete_button(
-                arquivos_adicionais_layout, 
-                arquivo_adicional, 
-                arquivo_adicional_item, 
-                lambda: self.excluir_arquivo(projeto, os.path.join(DOCUMENTOS_DIR, arquivo_adicional), "arquivos_adicionais"), 
-                lambda: self.abrir_documento(arquivo_adicional_item)
-            )
-
-        # Botão para adicionar arquivo adicional
-        adicionar_arquivo_adicional_button = QPushButton("Adicionar Arquivo Adicional")
-        adicionar_arquivo_adicional_button.clicked.connect(lambda: self.adicionar_arquivo_adicional(projeto, arquivos_adicionais_layout))
-        layout.addWidget(adicionar_arquivo_adicional_button)
-
-    def add_item_with_delete_button(self, layout, item_text, item, delete_callback, open_callback):
-        item_layout = QHBoxLayout()
-        item_label = QLabel(item_text)
-        delete_button = QPushButton("Excluir")
-        delete_button.clicked.connect(delete_callback)
-        open_button = QPushButton("Abrir")
-        open_button.clicked.connect(open_callback)
-        item_layout.addWidget(item_label)
-        item_layout.addWidget(open_button)
-        item_layout.addWidget(delete_button)
-        layout.addLayout(item_layout)
-
-    def excluir_arquivo(self, projeto, arquivo, tipo):
-        if os.path.exists(arquivo):
-            os.remove(arquivo)
-        projeto[tipo].remove(os.path.basename(arquivo))
-        dados = carregar_dados()
-        for p in dados["projetos"]:
-            if p["nome"] == projeto["nome"]:
-                p[tipo] = projeto[tipo]
-        salvar_dados(dados)
-        QMessageBox.information(self, "Sucesso", f"Arquivo {os.path.basename(arquivo)} excluído com sucesso!")
-        self.atualizar_tabela()
-
-    def carregar_despesas(self, projeto, table):
-        table.setRowCount(len(projeto["despesas"]))
-        for i, despesa in enumerate(projeto["despesas"]):
-            table.setItem(i, 0, QTableWidgetItem(despesa["nome"]))
-            table.setItem(i, 1, QTableWidgetItem(despesa["descricao"]))
-            table.setItem(i, 2, QTableWidgetItem(f"R$ {despesa['valor']:.2f}"))
-            table.setItem(i, 3, QTableWidgetItem(despesa["nfe"]))
-
-    def excluir_projeto(self, projeto):
-        dados = carregar_dados()
-        dados["projetos"].remove(projeto)
-        salvar_dados(dados)
-        self.atualizar_tabela()
-        QMessageBox.information(self, "Sucesso", "Projeto excluído com sucesso!")
-        self.tab_widget.removeTab(self.tab_widget.currentIndex())
-
-    def editar_projeto(self, projeto):
-        nome, ok1 = QInputDialog.getText(self, "Editar Nome do Projeto", "Insira o novo nome do projeto:", text=projeto["nome"])
-        if ok1:
-            responsavel, ok2 = QInputDialog.getText(self, "Editar Responsável", "Insira o novo responsável:", text=projeto["responsavel"])
-            if ok2:
-                valor, ok3 = QInputDialog.getDouble(self, "Editar Valor Financiamento", "Insira o novo valor de financiamento:", projeto["valor_financiamento"], 0.0, 0.0)
-                if ok3:
-                    projeto["nome"] = nome
-                    projeto["responsavel"] = responsavel
-                    projeto["valor_financiamento"] = valor
-                    dados = carregar_dados()
-                    for p in dados["projetos"]:
-                        if p["nome"] == projeto["nome"]:
-                            p.update(projeto)
-                    salvar_dados(dados)
-                    QMessageBox.information(self, "Sucesso", "Projeto editado com sucesso!")
-                    self.atualizar_tabela()
-
-    def adicionar_despesa(self, projeto):
-        nome, ok1 = QInputDialog.getText(self, "Nome da Despesa", "Insira o nome da despesa:")
-        if ok1:
-            descricao, ok2 = QInputDialog.getText(self, "Descrição da Despesa", "Insira a descrição da despesa:")
-            if ok2:
-                valor, ok3 = QInputDialog.getDouble(self, "Valor da Despesa", "Insira o valor da despesa:", 0.0, 0.0)
-                if ok3:
-                    nfe, ok4 = QInputDialog.getText(self, "NF-e", "Insira a NF-e:")
-                    if ok4:
-                        projeto["despesas"].append({
-                            "nome": nome,
-                            "descricao": descricao,
-                            "valor": valor,
-                            "nfe": nfe
-                        })
-                        dados = carregar_dados()
-                        for p in dados["projetos"]:
-                            if p["nome"] == projeto["nome"]:
-                                p["despesas"] = projeto["despesas"]
-                        salvar_dados(dados)
-                        QMessageBox.information(self, "Sucesso", "Despesa adicionada com sucesso!")
-                        self.atualizar_tabela()
-
-    def adicionar_orcamento(self, projeto, orcamentos_layout):
-        orcamento, ok = QFileDialog.getOpenFileName(self, "Adicionar Orçamento", "", "Arquivos PDF (*.pdf);;Todos os Arquivos (*)")
-        if ok and orcamento:
-            nome_orcamento = os.path.basename(orcamento)
-            destino_orcamento = os.path.join(DOCUMENTOS_DIR, nome_orcamento)
-            if os.path.exists(destino_orcamento):
-                nome_orcamento = self.adicionar_sufixo(nome_orcamento)
-                destino_orcamento = os.path.join(DOCUMENTOS_DIR, nome_orcamento)
-            shutil.copy(orcamento, destino_orcamento)
-            projeto["orcamentos"].append(nome_orcamento)
-            dados = carregar_dados()
-            for p in dados["projetos"]:
-                if p["nome"] == projeto["nome"]:
-                    p["orcamentos"] = projeto["orcamentos"]
-            salvar_dados(dados)
-            QMessageBox.information(self, "Sucesso", "Orçamento adicionado com sucesso!")
-            orcamento_item = QListWidgetItem(nome_orcamento)
-            orcamento_item.setData(Qt.ItemDataRole.UserRole, destino_orcamento)
-            self.add_item_with_delete_button(
-                orcamentos_layout, 
-                nome_orcamento, 
-                orcamento_item, 
-                lambda: self.excluir_arquivo(projeto, destino_orcamento, "orcamentos"), 
-                lambda: self.abrir_documento(orcamento_item)
-            )
-
-    def adicionar_nfe(self, projeto, nfe_layout):
-        nfe, ok = QFileDialog.getOpenFileName(self, "Adicionar NF-e", "", "Arquivos PDF (*.pdf);;Todos os Arquivos (*)")
-        if ok and nfe:
-            nome_nfe = os.path.basename(nfe)
-            destino_nfe = os.path.join(DOCUMENTOS_DIR, nome_nfe)
-            if os.path.exists(destino_nfe):
-                nome_nfe = self.adicionar_sufixo(nome_nfe)
-                destino_nfe = os.path.join(DOCUMENTOS_DIR, nome_nfe)
-            shutil.copy(nfe, destino_nfe)
-            projeto["nfe"].append(nome_nfe)
-            dados = carregar_dados()
-            for p in dados["projetos"]:
-                if p["nome"] == projeto["nome"]:
-                    p["nfe"] = projeto["nfe"]
-            salvar_dados(dados)
-            QMessageBox.information(self, "Sucesso", "NF-e adicionada com sucesso!")
-            nfe_item = QListWidgetItem(nome_nfe)
-            nfe_item.setData(Qt.ItemDataRole.UserRole, destino_nfe)
-            self.add_item_with_delete_button(
-                nfe_layout, 
-                nome_nfe, 
-                nfe_item, 
-                lambda: self.excluir_arquivo(projeto, destino_nfe, "nfe"), 
-                lambda: self.abrir_documento(nfe_item)
-            )
-
-    def adicionar_comprovante(self, projeto, comprovantes_layout):
-        comprovante, ok = QFileDialog.getOpenFileName(self, "Selecionar Comprovante", "", "Arquivos PDF (*.pdf);;Todos os Arquivos (*)")
-        if ok and comprovante:
-            nome_comprovante = os.path.basename(comprovante)
-            destino = os.path.join(DOCUMENTOS_DIR, nome_comprovante)
-            if os.path.exists(destino):
-                nome_comprovante = self.adicionar_sufixo(nome_comprovante)
-                destino = os.path.join(DOCUMENTOS_DIR, nome_comprovante)
-            shutil.copy(comprovante, destino)
-            projeto["comprovantes"].append(nome_comprovante)
-            dados = carregar_dados()
-            for p in dados["projetos"]:
-                if p["nome"] == projeto["nome"]:
-                    p["comprovantes"] = projeto["comprovantes"]
-            salvar_dados(dados)
-            QMessageBox.information(self, "Sucesso", "Comprovante adicionado com sucesso!")
-            comprovante_item = QListWidgetItem(nome_comprovante)
-            comprovante_item.setData(Qt.ItemDataRole.UserRole, destino)
-            self.add_item_with_delete_button(
-                comprovantes_layout, 
-                nome_comprovante, 
-                comprovante_item, 
-                lambda: self.excluir_arquivo(projeto, destino, "comprovantes"), 
-                lambda: self.abrir_documento(comprovante_item)
-            )
-
-    def adicionar_arquivo_adicional(self, projeto, arquivos_adicionais_layout):
-        arquivo_adicional, ok = QFileDialog.getOpenFileName(self, "Adicionar Arquivo Adicional", "", "Todos os Arquivos (*)")
-        if ok and arquivo_adicional:
-            nome_arquivo_adicional = os.path.basename(arquivo_adicional)
-            destino_arquivo_adicional = os.path.join(DOCUMENTOS_DIR, nome_arquivo_adicional)
-            if os.path.exists(destino_arquivo_adicional):
-                nome_arquivo_adicional = self.adicionar_sufixo(nome_arquivo_adicional)
-                destino_arquivo_adicional = os.path.join(DOCUMENTOS_DIR, nome_arquivo_adicional)
-            shutil.copy(arquivo_adicional, destino_arquivo_adicional)
-            projeto["arquivos_adicionais"].append(nome_arquivo_adicional)
-            dados = carregar_dados()
-            for p in dados["projetos"]:
-                if p["nome"] == projeto["nome"]:
-                    p["arquivos_adicionais"] = projeto["arquivos_adicionais"]
-            salvar_dados(dados)
-            QMessageBox.information(self, "Sucesso", "Arquivo adicional adicionado com sucesso!")
-            arquivo_adicional_item = QListWidgetItem(nome_arquivo_adicional)
-            arquivo_adicional_item.setData(Qt.ItemDataRole.UserRole, destino_arquivo_adicional)
-            self.add_item_with_delete_button(
-                arquivos_adicionais_layout, 
-                nome_arquivo_adicional, 
-                arquivo_adicional_item, 
-                lambda: self.excluir_arquivo(projeto, destino_arquivo_adicional, "arquivos_adicionais"), 
-                lambda: self.abrir_documento(arquivo_adicional_item)
-            )
-
-    def adicionar_sufixo(self, nome_arquivo):
-        nome, ext = os.path.splitext(nome_arquivo)
-        sufixo = 1
-        novo_nome = f"{nome}_{sufixo}{ext}"
-        while os.path.exists(os.path.join(DOCUMENTOS_DIR, novo_nome)):
-            sufixo += 1
-            novo_nome = f"{nome}_{sufixo}{ext}"
-        return novo_nome
-
-    def exportar_projeto(self):
-        index = self.tabela.currentRow()
-        if index == -1:
-            QMessageBox.warning(self, "Erro", "Selecione um projeto para exportar.")
-            return
-        dados = carregar_dados()
-        projeto = dados["projetos"][index]
-        nome_arquivo_zip, _ = QFileDialog.getSaveFileName(self, "Salvar Projeto como ZIP", "", "ZIP Files (*.zip)")
-        if nome_arquivo_zip:
-            compactar_projeto(projeto, nome_arquivo_zip)
-            QMessageBox.information(self, "Sucesso", "Projeto exportado com sucesso!")
-
-    def importar_projeto(self):
-        nome_arquivo_zip, _ = QFileDialog.getOpenFileName(self, "Importar Projeto", "", "ZIP Files (*.zip)")
-        if nome_arquivo_zip:
-            projeto = descompactar_projeto(nome_arquivo_zip)
-            dados = carregar_dados()
-            dados["projetos"].append(projeto)
-            salvar_dados(dados)
-            QMessageBox.information(self, "Sucesso", "Projetos importados com sucesso!")
-            self.atualizar_tabela()
-
-    def abrir_documento(self, item):
-        caminho_documento = item.data(Qt.ItemDataRole.UserRole)
-        if os.path.exists(caminho_documento):
-            QDesktopServices.openUrl(QUrl.fromLocalFile(caminho_documento))
+            arquivos.append(caminho)
+    projetos, erros = ler_projetos_zips(arquivos, _progresso(tamanho_importacao(arquivos)))
+    contagem = repositorio.importar_projetos(projetos)
+    print(f"{contagem['inseridos']} novo(s), {contagem['mesclados']} atualizado(s), "
+          f"{contagem['inalterados']} sem alteração")
+    for arquivo, erro in erros:
+        print(f"{arquivo}: {erro}", file=sys.stderr)
+    return 1 if erros else 0
+
+
+def comando_despesa(repositorio, args):
+    from armazenamento import novo_id
+    projeto = _buscar_projeto(repositorio, args.projeto_id)
+    despesa = {
+        "id": novo_id(),
+        "nome": args.nome,
+        "descricao": args.descricao,
+        "valor": args.valor,
+        "nfe": args.nfe
+    }
+    repositorio.adicionar_despesa(projeto["id"], despesa)
+    print(despesa["id"])
+
+
+def comando_ingerir(repositorio, args):
+    import os
+    from ingestao import ingerir_arquivos, arquivos_da_pasta
+    projeto = _buscar_projeto(repositorio, args.projeto_id)
+    arquivos = []
+    for caminho in args.arquivos:
+        arquivos.extend(arquivos_da_pasta(caminho) if os.path.isdir(caminho) else [caminho])
+    total = sum(os.path.getsize(arquivo) for arquivo in arquivos if os.path.isfile(arquivo))
+    resultado = ingerir_arquivos(arquivos, repositorio.chaves_nfe(), repositorio.digests_documentos(),
+                                 _progresso(total))
+    adicionadas = 0
+    for despesas, documentos in resultado["lotes"]:
+        repositorio.adicionar_despesas(projeto["id"], despesas, documentos)
+        adicionadas += len(despesas)
+    print(f"{adicionadas} despesa(s) importada(s) em {len(resultado['lotes'])} lote(s), "
+          f"{resultado['duplicadas']} já cadastrada(s) ignorada(s)")
+    for arquivo, erro in resultado["erros"]:
+        print(f"{arquivo}: {erro}", file=sys.stderr)
+    return 1 if resultado["erros"] else 0
+
+
+def comando_estatisticas(repositorio, args):
+    from armazenamento import TIPOS_DOCUMENTO
+    projetos = repositorio.projetos()
+    despesas = [d for p in projetos for d in p["despesas"]]
+    estatisticas = {
+        "projetos": len(projetos),
+        "despesas": len(despesas),
+        "documentos": sum(len(p[tipo]) for p in projetos for tipo in TIPOS_DOCUMENTO),
+        "valor_financiamento": sum(p["valor_financiamento"] for p in projetos),
+        "valor_despesas": sum(d["valor"] for d in despesas),
+    }
+    if args.json:
+        import json
+        print(json.dumps(estatisticas, indent=2))
+    else:
+        print(f"Projetos:            {estatisticas['projetos']}")
+        print(f"Despesas:            {estatisticas['despesas']}")
+        print(f"Documentos:          {estatisticas['documentos']}")
+        print(f"Total financiamento: R$ {estatisticas['valor_financiamento']:.2f}")
+        print(f"Total despesas:      R$ {estatisticas['valor_despesas']:.2f}")
+
+
+def comando_resumo(repositorio, args):
+    financeiro = repositorio.financeiro()
+    resumo = {
+        "totais": financeiro.totais(),
+        "por_responsavel": financeiro.por_responsavel(),
+        "por_mes": financeiro.por_mes(),
+        "acima_do_orcamento": financeiro.acima_do_orcamento(),
+    }
+    if args.json:
+        import json
+        print(json.dumps(resumo, indent=2, ensure_ascii=False))
+        return
+    totais = resumo["totais"]
+    print(f"Projetos: {totais['projetos']}  Despesas: {totais['despesas']}  "
+          f"Acima do orçamento: {totais['acima_do_orcamento']}")
+    print(f"Financiamento: R$ {totais['financiamento']:.2f}  Gasto: R$ {totais['gasto']:.2f}  "
+          f"Saldo: R$ {totais['saldo']:.2f}")
+    for titulo, grupos in (("Responsável", resumo["por_responsavel"]), ("Mês", resumo["por_mes"])):
+        print()
+        print(f"{titulo:<30} {'Projetos':>8} {'Financiamento':>16} {'Gasto':>16} {'Saldo':>16}")
+        for g in grupos:
+            print(f"{g['chave'][:30]:<30} {g['projetos']:>8} {g['financiamento']:>16.2f} "
+                  f"{g['gasto']:>16.2f} {g['saldo']:>16.2f}")
+    if resumo["acima_do_orcamento"]:
+        print()
+        print("Acima do orçamento:")
+        for projeto_id in resumo["acima_do_orcamento"]:
+            print(f"  {projeto_id[:8]}  {repositorio.obter_projeto(projeto_id)['nome']}")
+
+
+def comando_buscar(repositorio, args):
+    from busca import trechos
+    for projeto, pontuacao in repositorio.buscar(args.consulta, args.limite):
+        print(f"{projeto['id'][:8]}  {pontuacao:7.2f}  {projeto['nome']} — {projeto['responsavel']}")
+        for trecho in trechos(projeto, args.consulta):
+            print(f"{'':19}{trecho}")
+
+
+# Executa o servidor local (ver servidor.py) até Ctrl+C; não usa o
+# repositório do processo, o servidor abre o seu sobre os arquivos locais
+def comando_servir(args):
+    import logging
+    from servidor import executar_servidor
+
+    def ao_iniciar(enderecos):
+        for host, porta in enderecos:
+            print(f"Servidor em http://{host}:{porta}; Ctrl+C para parar")
+        sys.stdout.flush()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    executar_servidor(args.host, args.porta, args.backend, ao_iniciar)
+
+
+# Confere o armazém de documentos contra os anexos dos projetos e, com
+# --recuperar, apaga os arquivos sem referência
+def comando_verificar_documentos(repositorio, args):
+    from documentos import obter_armazem
+    from manutencao import (coletar_referencias, varrer_documentos, verificar_documentos, recuperar_espaco,
+                            descrever_verificacao, confirmacao_remota)
+    # As alterações na fila contam como referências
+    repositorio.salvar()
+    armazem = obter_armazem()
+    inventario = varrer_documentos(armazem)
+    progresso = _progresso(inventario["bytes"]) if args.conteudo else None
+    resultado = verificar_documentos(inventario, coletar_referencias(repositorio.projetos()), args.conteudo,
+                                     progresso, existe=confirmacao_remota(armazem))
+    if args.recuperar:
+        repositorio.salvar()
+        resultado["recuperado"] = recuperar_espaco(armazem, resultado, coletar_referencias(repositorio.projetos()))
+    if args.json:
+        import json
+        print(json.dumps(resultado, indent=2, ensure_ascii=False))
+    else:
+        print(descrever_verificacao(resultado, args.detalhes))
+        if args.recuperar:
+            print(f"Apagados: {resultado['recuperado']['arquivos']} arquivo(s), "
+                  f"{resultado['recuperado']['bytes']} bytes")
+    return 1 if resultado["ausentes"] or resultado["divergentes"] or resultado["corrompidos"] else 0
+
+
+def _nivel(valor):
+    if valor == "auto":
+        return valor
+    nivel = int(valor)
+    if not 0 <= nivel <= 9:
+        raise argparse.ArgumentTypeError("use auto ou um nível de 0 a 9")
+    return nivel
+
+
+def criar_parser():
+    parser = argparse.ArgumentParser(description="Gerenciador de projetos. Sem comando, abre a interface gráfica.")
+    parser.add_argument("--perfil", action="store_true",
+                        help="grava um perfil do comando (cProfile e tracemalloc) na pasta de perfis")
+    parser.add_argument("--servidor", metavar="URL",
+                        help="usa os dados do servidor local em URL (ex.: http://127.0.0.1:8765) em vez dos arquivos")
+    comandos = parser.add_subparsers(dest="comando")
+
+    relatorio = comandos.add_parser("report", help="gera o relatório PDF")
+    relatorio.add_argument("saida", help="arquivo PDF de saída")
+    relatorio.add_argument("-p", "--projeto", action="append", help="id, prefixo do id ou nome (padrão: todos)")
+    relatorio.set_defaults(funcao=comando_relatorio)
+
+    exportar = comandos.add_parser("export", help="exporta projetos para ZIP")
+    exportar.add_argument("destino", help="pasta (um ZIP por projeto) ou arquivo ZIP (com --combinado)")
+    exportar.add_argument("-p", "--projeto", action="append", help="id, prefixo do id ou nome (padrão: todos)")
+    exportar.add_argument("--combinado", action="store_true", help="um único ZIP com todos os projetos")
+    exportar.add_argument("--nivel", type=_nivel, default="auto", help="auto ou nível de compressão de 0 a 9")
+    exportar.add_argument("--incremental", action="store_true",
+                          help="somente documentos novos ou alterados desde a última exportação")
+    exportar.set_defaults(funcao=comando_exportar)
+
+    importar = comandos.add_parser("import", help="importa projetos de arquivos ZIP")
+    importar.add_argument("arquivos", nargs="+", help="arquivos ZIP ou pastas com arquivos ZIP")
+    importar.set_defaults(funcao=comando_importar)
+
+    despesa = comandos.add_parser("add-expense", help="adiciona uma despesa a um projeto")
+    despesa.add_argument("projeto_id", help="id, prefixo do id ou nome do projeto")
+    despesa.add_argument("--nome", required=True)
+    despesa.add_argument("--descricao", default="")
+    despesa.add_argument("--valor", type=float, required=True)
+    despesa.add_argument("--nfe", default="")
+    despesa.set_defaults(funcao=comando_despesa)
+
+    ingerir = comandos.add_parser("ingest", help="importa despesas de NF-e (XML) e CSV para um projeto")
+    ingerir.add_argument("projeto_id", help="id, prefixo do id ou nome do projeto")
+    ingerir.add_argument("arquivos", nargs="+", help="arquivos .xml/.csv ou pastas com eles")
+    ingerir.set_defaults(funcao=comando_ingerir)
+
+    estatisticas = comandos.add_parser("stats", help="totais de projetos, despesas e documentos")
+    estatisticas.add_argument("--json", action="store_true", help="saída em JSON")
+    estatisticas.set_defaults(funcao=comando_estatisticas)
+
+    resumo = comandos.add_parser("summary", help="financiamento x gasto por projeto, responsável e mês")
+    resumo.add_argument("--json", action="store_true", help="saída em JSON")
+    resumo.set_defaults(funcao=comando_resumo)
+
+    buscar = comandos.add_parser("search", help="busca projetos, despesas, NF-e e documentos")
+    buscar.add_argument("consulta")
+    buscar.add_argument("-n", "--limite", type=int, default=20, help="quantidade de resultados")
+    buscar.set_defaults(funcao=comando_buscar)
+
+    verificar = comandos.add_parser("verify-docs", help="confere os documentos contra os anexos dos projetos")
+    verificar.add_argument("--conteudo", action="store_true", help="recalcula o sha256 de cada arquivo")
+    verificar.add_argument("--recuperar", action="store_true",
+                           help="apaga os arquivos sem referência (os alterados na última hora são mantidos)")
+    verificar.add_argument("--detalhes", type=int, default=10, help="itens listados de cada problema")
+    verificar.add_argument("--json", action="store_true", help="saída em JSON")
+    verificar.set_defaults(funcao=comando_verificar_documentos)
+
+    servir = comandos.add_parser("serve", help="servidor local que mantém os projetos em memória para vários clientes")
+    servir.add_argument("--host", default=None, help="endereço (padrão: 127.0.0.1, só esta máquina)")
+    servir.add_argument("--porta", type=int, default=None, help="porta (padrão: 8765)")
+    servir.add_argument("--backend", choices=("json", "diario", "sqlite"),
+                        help="armazenamento dos dados no servidor (padrão: PROJETOS_BACKEND)")
+    servir.set_defaults(funcao=comando_servir)
+    return parser
+
+
+def main(argv=None):
+    args = criar_parser().parse_args(argv)
+    if args.servidor:
+        # Lido por configuracao ao ser importado, o que só acontece abaixo
+        import os
+        os.environ["PROJETOS_BACKEND"] = "remoto"
+        os.environ["PROJETOS_SERVIDOR"] = args.servidor
+    if args.comando is None:
+        from interface import executar_interface
+        return executar_interface()
+    if args.comando == "serve":
+        from configuracao import SERVIDOR_HOST, SERVIDOR_PORTA
+        args.host = args.host or SERVIDOR_HOST
+        args.porta = args.porta or SERVIDOR_PORTA
+        return comando_servir(args)
+    from armazenamento import ConflitoConcorrencia
+    from repositorio import obter_repositorio
+    repositorio = obter_repositorio()
+    try:
+        if args.perfil:
+            from instrumentacao import CapturaPerfil
+            with CapturaPerfil(args.comando) as captura:
+                codigo = args.funcao(repositorio, args) or 0
+            print(f"Perfil gravado em {captura.caminho}", file=sys.stderr)
         else:
-            QMessageBox.warning(self, "Erro", "O arquivo não foi encontrado.")
-
-    def gerar_relatorio_projeto(self, projeto):
-        pdf = PDFReport([projeto])
-        nome_arquivo, _ = QFileDialog.getSaveFileName(self, "Salvar Relatório como PDF", "", "PDF Files (*.pdf)")
-        if nome_arquivo:
-            pdf.gerar_relatorio(nome_arquivo)
-            QMessageBox.information(self, "Sucesso", "Relatório gerado com sucesso!")
-
-    def gerar_relatorio_todos_projetos(self):
-        dados = carregar_dados()
-        pdf = PDFReport(dados["projetos"])
-        nome_arquivo, _ = QFileDialog.getSaveFileName(self, "Salvar Relatório como PDF", "", "PDF Files (*.pdf)")
-        if nome_arquivo:
-            pdf.gerar_relatorio(nome_arquivo)
-            QMessageBox.information(self, "Sucesso", "Relatório gerado com sucesso!")
+            codigo = args.funcao(repositorio, args) or 0
+        # Outra instância pode ter alterado os mesmos projetos enquanto o comando rodava
+        repositorio.salvar()
+        conflitos = repositorio.tomar_conflitos()
+        if conflitos:
+            raise ConflitoConcorrencia(conflitos)
+        return codigo
+    except ConflitoConcorrencia as erro:
+        print(erro, file=sys.stderr)
+        return 1
+    except ConnectionError as erro:
+        # Modo cliente com o servidor fora do ar
+        print(f"Servidor indisponível: {erro}", file=sys.stderr)
+        return 1
+    finally:
+        repositorio.fechar()
+
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    window = ProjetoManager()
-    window.show()
-    sys.exit(app.exec())
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,292 @@
+import os
+import shutil
+import stat
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from armazenamento import TIPOS_DOCUMENTO
+from configuracao import THREADS_MANUTENCAO, IDADE_MINIMA_ORFAO
+from documentos import ArmazemDocumentos, hash_arquivo, digest_documento, nome_documento
+from instrumentacao import instrumentado
+
+# Verificação e limpeza do armazém de documentos. A varredura lista a pasta
+# em paralelo (os.scandir numa thread por subpasta documentos/blobs/ab/) e
+# cruza o que encontrou com as listas de anexos de todos os projetos:
+#   - ausentes: referências cujo arquivo não está no armazém;
+#   - órfãos: blobs que nenhum projeto referencia (projetos excluídos,
+#     importações interrompidas), mais as cópias expostas para abrir
+#     (documentos/abertos/) desses blobs, temporários abandonados e arquivos
+#     soltos antigos sem referência;
+#   - divergentes: blobs com tamanho diferente do registrado na referência;
+#   - corrompidos (com conferir_conteudo): blobs cujo sha256 não é o nome.
+# A limpeza (recuperar_espaco) só apaga órfãos e lixo; nada referenciado é
+# tocado. As referências devem ser coletadas depois de repositorio.salvar(),
+# para que as alterações ainda na fila contem.
+
+# Nome das pastas de distribuição dos blobs (dois dígitos hexadecimais)
+_HEXADECIMAL = frozenset("0123456789abcdef")
+
+
+def _threads(threads):
+    return threads or THREADS_MANUTENCAO or 2 * (os.cpu_count() or 1)
+
+
+# Momento da última alteração de um arquivo: o maior entre mtime e ctime
+# (ao entrar no armazém o blob é renomeado, o que atualiza só o ctime)
+def _alterado(info):
+    return max(info.st_mtime, info.st_ctime)
+
+
+# Referências de todos os projetos: ({digest: [anexo]}, {nome solto: [anexo]}),
+# com anexo = {"projeto", "tipo", "nome", "tamanho"}. Pode ir para outra thread.
+def coletar_referencias(projetos):
+    por_digest = {}
+    legados = {}
+    for projeto in projetos:
+        for tipo in TIPOS_DOCUMENTO:
+            for referencia in projeto[tipo]:
+                anexo = {"projeto": projeto["id"], "tipo": tipo, "nome": nome_documento(referencia)}
+                digest = digest_documento(referencia)
+                if digest is None:
+                    legados.setdefault(referencia, []).append(anexo)
+                else:
+                    anexo["tamanho"] = referencia["tamanho"]
+                    por_digest.setdefault(digest, []).append(anexo)
+    return por_digest, legados
+
+
+def _listar_distribuicao(pasta):
+    # Uma subpasta documentos/blobs/ab/: devolve [(digest, caminho, tamanho, alterado)]
+    blobs = []
+    with os.scandir(pasta) as subpastas:
+        for subpasta in subpastas:
+            if not subpasta.is_dir(follow_symlinks=False):
+                continue
+            with os.scandir(subpasta.path) as arquivos:
+                for arquivo in arquivos:
+                    if arquivo.is_file(follow_symlinks=False):
+                        info = arquivo.stat(follow_symlinks=False)
+                        blobs.append((arquivo.name, arquivo.path, info.st_size, _alterado(info)))
+    return blobs
+
+
+def _listar_arquivos(pasta):
+    # [(nome, caminho, tamanho, alterado)] dos arquivos de uma pasta, sem subpastas
+    if not os.path.isdir(pasta):
+        return []
+    arquivos = []
+    with os.scandir(pasta) as entradas:
+        for entrada in entradas:
+            if entrada.is_file(follow_symlinks=False):
+                info = entrada.stat(follow_symlinks=False)
+                arquivos.append((entrada.name, entrada.path, info.st_size, _alterado(info)))
+    return arquivos
+
+
+def _listar_pastas(pasta):
+    if not os.path.isdir(pasta):
+        return {}
+    with os.scandir(pasta) as entradas:
+        return {entrada.name: entrada.path for entrada in entradas if entrada.is_dir(follow_symlinks=False)}
+
+
+# Lista o armazém: {"blobs": {digest: (caminho, tamanho, alterado)},
+# "temporarios": [(caminho, tamanho, alterado)], "abertos": {digest: pasta},
+# "soltos": {nome: (caminho, tamanho, alterado)}, "bytes"}
+@instrumentado("documentos.varrer", lambda r: {"arquivos": len(r["blobs"]), "bytes": r["bytes"]})
+def varrer_documentos(armazem, threads=None):
+    blobs = {}
+    distribuicao = [caminho for nome, caminho in _listar_pastas(armazem.dir_blobs).items()
+                    if len(nome) == 2 and set(nome) <= _HEXADECIMAL]
+    with ThreadPoolExecutor(_threads(threads)) as pool:
+        temporarios = pool.submit(_listar_arquivos, armazem.dir_temporario)
+        soltos = pool.submit(_listar_arquivos, armazem.raiz)
+        abertos = pool.submit(_listar_pastas, armazem.dir_abertos)
+        for lista in pool.map(_listar_distribuicao, distribuicao):
+            for digest, caminho, tamanho, alterado in lista:
+                blobs[digest] = (caminho, tamanho, alterado)
+    return {
+        "blobs": blobs,
+        "temporarios": [(caminho, tamanho, alterado) for _, caminho, tamanho, alterado in temporarios.result()],
+        "abertos": abertos.result(),
+        "soltos": {nome: (caminho, tamanho, alterado) for nome, caminho, tamanho, alterado in soltos.result()},
+        "bytes": sum(tamanho for _, tamanho, _ in blobs.values()),
+    }
+
+
+# No modo cliente o armazém local é só o cache do servidor: um blob que não
+# está nele pode estar no servidor (HEAD). None para o armazém local.
+def confirmacao_remota(armazem):
+    from cliente import ArmazemRemoto
+    return armazem.existe if isinstance(armazem, ArmazemRemoto) else None
+
+
+# Cruza o inventário (varrer_documentos) com as referências
+# (coletar_referencias). Com conferir_conteudo o sha256 de cada blob é
+# recalculado (em paralelo; progresso recebe os bytes lidos). Arquivos
+# alterados há menos de idade_minima segundos podem ser de uma cópia em
+# andamento: são relatados como órfãos recentes, que a limpeza não apaga.
+# existe(digest), se passado, confirma os blobs referenciados que não estão
+# no inventário antes de relatá-los como ausentes (ver confirmacao_remota).
+@instrumentado("documentos.verificar", lambda r: {"orfaos": len(r["orfaos"]), "ausentes": len(r["ausentes"]),
+                                                  "corrompidos": len(r["corrompidos"])})
+def verificar_documentos(inventario, referencias, conferir_conteudo=False, progresso=None, threads=None,
+                         idade_minima=IDADE_MINIMA_ORFAO, existe=None):
+    por_digest, legados = referencias
+    blobs = inventario["blobs"]
+    limite = time.time() - idade_minima
+    resultado = {
+        "arquivos": len(blobs),
+        "bytes": inventario["bytes"],
+        "ausentes": [],
+        "divergentes": [],
+        "corrompidos": [],
+        "orfaos": [],
+        "temporarios": [caminho for caminho, _, alterado in inventario["temporarios"] if alterado < limite],
+        "abertos_orfaos": [pasta for digest, pasta in inventario["abertos"].items() if digest not in por_digest],
+        "soltos_orfaos": [],
+    }
+    faltando = [digest for digest in por_digest if digest not in blobs]
+    if faltando and existe is not None:
+        # Blobs fora do inventário que o armazém ainda tem (no servidor, no
+        # modo cliente) não estão ausentes
+        with ThreadPoolExecutor(_threads(threads)) as pool:
+            faltando = [digest for digest, achado in zip(faltando, pool.map(existe, faltando)) if not achado]
+    for digest in faltando:
+        resultado["ausentes"].extend(dict(anexo, sha256=digest) for anexo in por_digest[digest])
+    for digest, anexos in por_digest.items():
+        blob = blobs.get(digest)
+        if blob is None:
+            continue
+        divergentes = [anexo for anexo in anexos if anexo["tamanho"] != blob[1]]
+        if divergentes:
+            resultado["divergentes"].append({"sha256": digest, "tamanho": blob[1], "anexos": divergentes})
+    for nome, anexos in legados.items():
+        if nome not in inventario["soltos"]:
+            resultado["ausentes"].extend(anexos)
+    recuperaveis = 0
+    for digest, (caminho, tamanho, alterado) in blobs.items():
+        if digest not in por_digest:
+            recente = alterado >= limite
+            resultado["orfaos"].append({"sha256": digest, "caminho": caminho, "tamanho": tamanho,
+                                        "recente": recente})
+            if not recente:
+                recuperaveis += tamanho
+    for nome, (caminho, tamanho, alterado) in inventario["soltos"].items():
+        if nome not in legados and alterado < limite:
+            resultado["soltos_orfaos"].append(caminho)
+            recuperaveis += tamanho
+    recuperaveis += sum(tamanho for _, tamanho, alterado in inventario["temporarios"] if alterado < limite)
+    resultado["bytes_recuperaveis"] = recuperaveis
+
+    if conferir_conteudo:
+        def conferir(item):
+            digest, (caminho, _, _) = item
+            try:
+                calculado = hash_arquivo(caminho, progresso)
+            except FileNotFoundError:
+                # Apagado durante a verificação
+                return None
+            return None if calculado == digest else {"sha256": digest, "caminho": caminho, "calculado": calculado}
+
+        with ThreadPoolExecutor(_threads(threads)) as pool:
+            resultado["corrompidos"] = [c for c in pool.map(conferir, blobs.items()) if c is not None]
+    return resultado
+
+
+def _apagar(caminho):
+    try:
+        # No Windows arquivos somente leitura não podem ser apagados
+        os.chmod(caminho, stat.S_IWUSR | stat.S_IRUSR)
+        os.remove(caminho)
+    except FileNotFoundError:
+        pass
+
+
+# Apaga os órfãos encontrados por verificar_documentos(): blobs sem
+# referência (com as cópias expostas para abrir),
+# temporários e arquivos soltos antigos. `referencias` deve ser coletado de
+# novo, depois de repositorio.salvar(): o que ganhou referência depois da
+# verificação é mantido, assim como o que foi alterado nesse meio tempo.
+# Devolve {"arquivos", "bytes"} apagados.
+@instrumentado("documentos.recuperar", lambda r: {"arquivos": r["arquivos"], "bytes": r["bytes"]})
+def recuperar_espaco(armazem, resultado, referencias, progresso=None, idade_minima=IDADE_MINIMA_ORFAO):
+    por_digest, legados = referencias
+    limite = time.time() - idade_minima
+    apagados = {"arquivos": 0, "bytes": 0}
+
+    def antigo(caminho):
+        try:
+            info = os.stat(caminho)
+        except FileNotFoundError:
+            return None
+        return info.st_size if _alterado(info) < limite else None
+
+    for orfao in resultado["orfaos"]:
+        tamanho = antigo(orfao["caminho"])
+        if orfao["sha256"] in por_digest or tamanho is None:
+            continue
+        # Só a cópia local: no modo cliente o armazém é um cache, e o blob no
+        # servidor é de todos os clientes
+        ArmazemDocumentos.remover(armazem, orfao["sha256"])
+        apagados["arquivos"] += 1
+        apagados["bytes"] += tamanho
+        if progresso is not None:
+            progresso(1)
+    for caminho in resultado["temporarios"] + resultado["soltos_orfaos"]:
+        tamanho = antigo(caminho)
+        if tamanho is None or os.path.basename(caminho) in legados:
+            continue
+        _apagar(caminho)
+        apagados["arquivos"] += 1
+        apagados["bytes"] += tamanho
+        if progresso is not None:
+            progresso(1)
+    for pasta in resultado["abertos_orfaos"]:
+        if os.path.basename(pasta) not in por_digest:
+            shutil.rmtree(pasta, ignore_errors=True)
+    return apagados
+
+
+def _formatar_bytes(n):
+    for unidade in ("bytes", "KB", "MB", "GB"):
+        if n < 1024 or unidade == "GB":
+            return f"{n:.0f} {unidade}" if unidade == "bytes" else f"{n:.1f} {unidade}"
+        n /= 1024
+
+
+# Resumo em texto do resultado de verificar_documentos()
+def descrever_verificacao(resultado, detalhes=10):
+    linhas = [f"{resultado['arquivos']} arquivo(s) no armazém, {_formatar_bytes(resultado['bytes'])}"]
+    recentes = sum(1 for orfao in resultado["orfaos"] if orfao["recente"])
+    linhas.append(f"Sem referência: {len(resultado['orfaos'])} arquivo(s)"
+                  + (f" ({recentes} recente(s), mantido(s))" if recentes else "")
+                  + f", {len(resultado['soltos_orfaos'])} arquivo(s) solto(s), "
+                    f"{len(resultado['temporarios'])} temporário(s); "
+                    f"{_formatar_bytes(resultado['bytes_recuperaveis'])} recuperável(is)")
+    linhas.append(f"Referências sem arquivo: {len(resultado['ausentes'])}")
+    for ausente in resultado["ausentes"][:detalhes]:
+        linhas.append(f"  projeto {ausente['projeto'][:8]} ({ausente['tipo']}): {ausente['nome']}")
+    linhas.append(f"Tamanho diferente do registrado: {len(resultado['divergentes'])}")
+    for divergente in resultado["divergentes"][:detalhes]:
+        anexo = divergente["anexos"][0]
+        linhas.append(f"  {anexo['nome']}: {divergente['tamanho']} bytes, registrado {anexo['tamanho']}")
+    if resultado["corrompidos"]:
+        linhas.append(f"Conteúdo corrompido: {len(resultado['corrompidos'])}")
+        for corrompido in resultado["corrompidos"][:detalhes]:
+            linhas.append(f"  {corrompido['caminho']}")
+    return "\n".join(linhas)
+
+
+# Funções executadas pelas tarefas em segundo plano (fora da thread da interface)
+def tarefa_verificar_documentos(tarefa, armazem, referencias, conferir_conteudo):
+    inventario = varrer_documentos(armazem)
+    if conferir_conteudo:
+        tarefa.definir_total(inventario["bytes"])
+    return verificar_documentos(inventario, referencias, conferir_conteudo, tarefa.avancar,
+                                existe=confirmacao_remota(armazem))
+
+
+def tarefa_recuperar_espaco(tarefa, armazem, resultado, referencias):
+    tarefa.definir_total(len(resultado["orfaos"]) + len(resultado["temporarios"]) + len(resultado["soltos_orfaos"]))
+    return recuperar_espaco(armazem, resultado, referencias, tarefa.avancar)
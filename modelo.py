@@ -0,0 +1,365 @@
+import math
+import sys
+from array import array
+
+from armazenamento import TIPOS_DOCUMENTO, CAMPOS_PROJETO
+
+# Representação compacta dos projetos mantidos em memória pelo repositório.
+# Em vez de um dicionário por projeto, despesa e documento (cada um com as
+# mesmas chaves repetidas), os projetos usam classes com __slots__, as
+# despesas de um projeto ficam em colunas (os valores num array de float) e
+# os textos que se repetem (responsáveis, nomes e descrições de despesas,
+# NF-e, nomes e digests de documentos) são internados.
+#
+# Os objetos continuam acessíveis como dicionários (projeto["nome"],
+# despesa["valor"], "id" in projeto, projeto.update(...)), então o código
+# que lê e altera projetos não muda. A conversão para o esquema JSON é sem
+# perdas: para_json(Projeto.de_json(dados)) == dados, incluindo chaves que o
+# esquema não conhece.
+
+
+# Marca um campo ausente no JSON de origem (diferente de null)
+class _Ausente:
+    __slots__ = ()
+
+    def __repr__(self):
+        return "AUSENTE"
+
+    def __reduce__(self):
+        return "AUSENTE"
+
+
+AUSENTE = _Ausente()
+
+
+def _internar(valor):
+    return sys.intern(valor) if type(valor) is str else valor
+
+
+# Cópia em dicionários, listas e valores simples, pronta para json.dumps
+def para_json(objeto):
+    if isinstance(objeto, (Projeto, Despesas, Despesa, ReferenciaDocumento)):
+        return objeto.para_json()
+    if isinstance(objeto, dict):
+        return {chave: para_json(valor) for chave, valor in objeto.items()}
+    if isinstance(objeto, (list, tuple)):
+        return [para_json(valor) for valor in objeto]
+    return objeto
+
+
+# Operações de dicionário comuns às classes abaixo, sobre campos() e _extras
+class _ComoDicionario:
+    __slots__ = ()
+
+    def get(self, campo, padrao=None):
+        try:
+            return self[campo]
+        except KeyError:
+            return padrao
+
+    def __contains__(self, campo):
+        try:
+            self[campo]
+        except KeyError:
+            return False
+        return True
+
+    def keys(self):
+        return self.para_json().keys()
+
+    def items(self):
+        return [(campo, self[campo]) for campo in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __eq__(self, outro):
+        if isinstance(outro, (dict, _ComoDicionario)):
+            return self.para_json() == para_json(outro)
+        return NotImplemented
+
+    __hash__ = None
+
+
+class ReferenciaDocumento(_ComoDicionario):
+    __slots__ = ("nome", "sha256", "tamanho")
+    CAMPOS = ("nome", "sha256", "tamanho")
+
+    def __init__(self, nome, sha256, tamanho):
+        self.nome = _internar(nome)
+        self.sha256 = _internar(sha256)
+        self.tamanho = tamanho
+
+    # Só as referências com exatamente os campos conhecidos viram objetos; as
+    # demais (nomes de arquivos antigos, dicionários com outras chaves)
+    # ficam como estão
+    @classmethod
+    def de_json(cls, referencia):
+        if type(referencia) is dict and referencia.keys() == set(cls.CAMPOS):
+            return cls(referencia["nome"], referencia["sha256"], referencia["tamanho"])
+        return _internar(referencia)
+
+    def __getitem__(self, campo):
+        if campo not in self.CAMPOS:
+            raise KeyError(campo)
+        return getattr(self, campo)
+
+    def __hash__(self):
+        return hash((self.nome, self.sha256, self.tamanho))
+
+    def __eq__(self, outro):
+        if isinstance(outro, ReferenciaDocumento):
+            return (self.nome, self.sha256, self.tamanho) == (outro.nome, outro.sha256, outro.tamanho)
+        return super().__eq__(outro)
+
+    def __repr__(self):
+        return f"ReferenciaDocumento({self.nome!r}, {self.sha256!r}, {self.tamanho!r})"
+
+    def para_json(self):
+        return {"nome": self.nome, "sha256": self.sha256, "tamanho": self.tamanho}
+
+
+# Lista de referências de um tipo de documento; o que é acrescentado (por
+# aplicar_operacao, por exemplo) é convertido para a forma compacta
+class ListaDocumentos(list):
+    __slots__ = ()
+
+    def __init__(self, referencias=()):
+        super().__init__(ReferenciaDocumento.de_json(referencia) for referencia in referencias)
+
+    def append(self, referencia):
+        super().append(ReferenciaDocumento.de_json(referencia))
+
+    def extend(self, referencias):
+        super().extend(ReferenciaDocumento.de_json(referencia) for referencia in referencias)
+
+    def para_json(self):
+        return [para_json(referencia) for referencia in self]
+
+
+# Uma despesa dentro das colunas de Despesas (não guarda os dados)
+class Despesa(_ComoDicionario):
+    __slots__ = ("_despesas", "_indice")
+
+    def __init__(self, despesas, indice):
+        self._despesas = despesas
+        self._indice = indice
+
+    def __getitem__(self, campo):
+        return self._despesas._obter(self._indice, campo)
+
+    def __setitem__(self, campo, valor):
+        self._despesas._definir(self._indice, campo, valor)
+
+    def __repr__(self):
+        return f"Despesa({self.para_json()!r})"
+
+    def para_json(self):
+        return self._despesas._para_json(self._indice)
+
+
+# Despesas de um projeto em colunas: uma lista por campo de texto e um array
+# de float para os valores. Valores que não são float (ex.: um inteiro vindo
+# do JSON) e chaves fora do esquema ficam em _extras, por índice, para que
+# a volta ao JSON seja exata.
+class Despesas:
+    __slots__ = ("_ids", "_nomes", "_descricoes", "_valores", "_nfes", "_extras")
+    COLUNAS = {"id": "_ids", "nome": "_nomes", "descricao": "_descricoes", "nfe": "_nfes"}
+    CAMPOS = ("id", "nome", "descricao", "valor", "nfe")
+
+    def __init__(self, despesas=()):
+        self._ids = []
+        self._nomes = []
+        self._descricoes = []
+        self._valores = array("d")
+        self._nfes = []
+        self._extras = None
+        for despesa in despesas:
+            self.append(despesa)
+
+    @classmethod
+    def de_json(cls, despesas):
+        return despesas.copia() if isinstance(despesas, Despesas) else cls(despesas)
+
+    def __len__(self):
+        return len(self._valores)
+
+    def __getitem__(self, indice):
+        if isinstance(indice, slice):
+            return [Despesa(self, i) for i in range(len(self))[indice]]
+        if indice < 0:
+            indice += len(self)
+        if not 0 <= indice < len(self):
+            raise IndexError(indice)
+        return Despesa(self, indice)
+
+    def __iter__(self):
+        return (Despesa(self, i) for i in range(len(self)))
+
+    def __eq__(self, outro):
+        if isinstance(outro, (Despesas, list)):
+            return self.para_json() == para_json(outro)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Despesas({self.para_json()!r})"
+
+    # Array de float com os valores de todas as despesas (somente leitura)
+    @property
+    def valores(self):
+        return self._valores
+
+    def append(self, despesa):
+        despesa = para_json(despesa)
+        indice = len(self)
+        for campo, coluna in self.COLUNAS.items():
+            getattr(self, coluna).append(_internar(despesa.pop(campo, AUSENTE)))
+        valor = despesa.pop("valor", AUSENTE)
+        if type(valor) is float:
+            self._valores.append(valor)
+        else:
+            self._valores.append(float(valor) if isinstance(valor, (int, float)) else math.nan)
+            despesa["valor"] = valor
+        if despesa:
+            if self._extras is None:
+                self._extras = {}
+            self._extras[indice] = despesa
+
+    def _obter(self, indice, campo):
+        extras = self._extras.get(indice) if self._extras else None
+        if extras is not None and campo in extras:
+            return extras[campo]
+        coluna = self.COLUNAS.get(campo)
+        if coluna is not None:
+            valor = getattr(self, coluna)[indice]
+            if valor is not AUSENTE:
+                return valor
+        elif campo == "valor":
+            return self._valores[indice]
+        raise KeyError(campo)
+
+    def _definir(self, indice, campo, valor):
+        extras = self._extras.get(indice) if self._extras else None
+        if extras is not None:
+            extras.pop(campo, None)
+        coluna = self.COLUNAS.get(campo)
+        if coluna is not None:
+            getattr(self, coluna)[indice] = _internar(valor)
+        elif campo == "valor" and type(valor) is float:
+            self._valores[indice] = valor
+        else:
+            if campo == "valor":
+                self._valores[indice] = float(valor) if isinstance(valor, (int, float)) else math.nan
+            if self._extras is None:
+                self._extras = {}
+            self._extras.setdefault(indice, {})[campo] = valor
+
+    def _para_json(self, indice):
+        despesa = {}
+        for campo in self.CAMPOS:
+            if campo == "valor":
+                despesa["valor"] = self._valores[indice]
+                continue
+            valor = getattr(self, self.COLUNAS[campo])[indice]
+            if valor is not AUSENTE:
+                despesa[campo] = valor
+        if self._extras and indice in self._extras:
+            despesa.update(para_json(self._extras[indice]))
+        return despesa
+
+    def para_json(self):
+        return [self._para_json(i) for i in range(len(self))]
+
+    def copia(self):
+        nova = Despesas()
+        nova._ids = list(self._ids)
+        nova._nomes = list(self._nomes)
+        nova._descricoes = list(self._descricoes)
+        nova._valores = array("d", self._valores)
+        nova._nfes = list(self._nfes)
+        if self._extras:
+            nova._extras = {indice: para_json(extras) for indice, extras in self._extras.items()}
+        return nova
+
+
+class Projeto(_ComoDicionario):
+    __slots__ = ("id",) + CAMPOS_PROJETO + ("despesas",) + TIPOS_DOCUMENTO + ("_extras",)
+    CAMPOS = ("id",) + CAMPOS_PROJETO + ("despesas",) + TIPOS_DOCUMENTO
+
+    def __init__(self):
+        for campo in self.CAMPOS:
+            setattr(self, campo, AUSENTE)
+        self._extras = None
+
+    @classmethod
+    def de_json(cls, dados):
+        if isinstance(dados, Projeto):
+            return dados.copia()
+        projeto = cls()
+        for campo, valor in dados.items():
+            projeto[campo] = valor
+        return projeto
+
+    def __getitem__(self, campo):
+        if campo in self.CAMPOS:
+            valor = getattr(self, campo)
+            if valor is not AUSENTE:
+                return valor
+        elif self._extras is not None and campo in self._extras:
+            return self._extras[campo]
+        raise KeyError(campo)
+
+    def __setitem__(self, campo, valor):
+        if campo == "despesas":
+            valor = Despesas.de_json(valor)
+        elif campo in TIPOS_DOCUMENTO:
+            valor = ListaDocumentos(valor)
+        elif campo == "responsavel":
+            valor = _internar(valor)
+        elif campo not in self.CAMPOS:
+            if self._extras is None:
+                self._extras = {}
+            self._extras[campo] = para_json(valor)
+            return
+        setattr(self, campo, valor)
+
+    def __repr__(self):
+        return f"Projeto({self.para_json()!r})"
+
+    def update(self, campos=(), **outros):
+        for campo, valor in dict(campos, **outros).items():
+            self[campo] = valor
+
+    def para_json(self):
+        dados = {}
+        for campo in self.CAMPOS:
+            valor = getattr(self, campo)
+            if valor is not AUSENTE:
+                dados[campo] = para_json(valor)
+        if self._extras:
+            dados.update(para_json(self._extras))
+        return dados
+
+    # Cópia independente para tarefas em segundo plano: as colunas e listas
+    # são copiadas, os textos e referências (imutáveis) são compartilhados
+    def copia(self):
+        projeto = Projeto()
+        for campo in self.CAMPOS:
+            valor = getattr(self, campo)
+            if isinstance(valor, Despesas):
+                valor = valor.copia()
+            elif isinstance(valor, ListaDocumentos):
+                valor = ListaDocumentos(valor)
+            setattr(projeto, campo, valor)
+        if self._extras:
+            projeto._extras = para_json(self._extras)
+        return projeto
+
+    # Volta ao conteúdo de uma cópia feita com copia(), no mesmo objeto (que
+    # views e índices podem estar usando)
+    def restaurar(self, copia):
+        for campo in self.CAMPOS:
+            setattr(self, campo, getattr(copia, campo))
+        self._extras = copia._extras
@@ -0,0 +1,260 @@
+from PyQt6.QtCore import (Qt, QAbstractTableModel, QAbstractListModel, QModelIndex, QSortFilterProxyModel,
+                          QEvent, QRect, QSize, pyqtSignal)
+from PyQt6.QtWidgets import QApplication, QStyle, QStyledItemDelegate, QStyleOptionButton, QStyleOptionViewItem
+
+from documentos import nome_documento
+from instrumentacao import medir
+
+# Papéis de dados próprios dos modelos
+PAPEL_ID = Qt.ItemDataRole.UserRole
+PAPEL_ORDENACAO = Qt.ItemDataRole.UserRole.value + 1
+PAPEL_DOCUMENTO = Qt.ItemDataRole.UserRole.value + 2
+
+
+# Modelo da tabela de projetos sobre o repositório. A view só pede os dados das
+# linhas visíveis, e as alterações do repositório viram sinais pontuais
+# (inserção, remoção ou dataChanged de uma linha) em vez de recriar a tabela.
+class ModeloProjetos(QAbstractTableModel):
+    COLUNAS = ("Nome", "Responsável", "Valor Financiamento")
+
+    def __init__(self, repositorio, parent=None):
+        super().__init__(parent)
+        self.repositorio = repositorio
+        self._projetos = []
+        self._linhas = {}
+        self._carregar()
+        repositorio.observar(self._ao_alterar)
+
+    def _carregar(self):
+        self._projetos = list(self.repositorio.projetos())
+        self._linhas = {p["id"]: i for i, p in enumerate(self._projetos)}
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._projetos)
+
+    def id_da_linha(self, linha):
+        return self._projetos[linha]["id"]
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUNAS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.COLUNAS[section]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        projeto = self._projetos[index.row()]
+        coluna = index.column()
+        if role == Qt.ItemDataRole.DisplayRole:
+            if coluna == 0:
+                return projeto["nome"]
+            if coluna == 1:
+                return projeto["responsavel"]
+            return f"R$ {projeto['valor_financiamento']:.2f}"
+        if role == PAPEL_ORDENACAO:
+            if coluna == 0:
+                return projeto["nome"].lower()
+            if coluna == 1:
+                return projeto["responsavel"].lower()
+            return projeto["valor_financiamento"]
+        if role == PAPEL_ID:
+            return projeto["id"]
+        return None
+
+    def _ao_alterar(self, evento, projeto_id):
+        if evento == "recarregado":
+            with medir("interface.tabela_recarregada") as medicao:
+                self.beginResetModel()
+                self._carregar()
+                self.endResetModel()
+                medicao.definir(linhas=len(self._projetos))
+        elif evento == "inserido":
+            linha = len(self._projetos)
+            self.beginInsertRows(QModelIndex(), linha, linha)
+            self._projetos.append(self.repositorio.obter_projeto(projeto_id))
+            self._linhas[projeto_id] = linha
+            self.endInsertRows()
+        elif evento == "removido":
+            linha = self._linhas.pop(projeto_id, None)
+            if linha is None:
+                return
+            self.beginRemoveRows(QModelIndex(), linha, linha)
+            del self._projetos[linha]
+            for i in range(linha, len(self._projetos)):
+                self._linhas[self._projetos[i]["id"]] = i
+            self.endRemoveRows()
+        elif evento == "alterado":
+            linha = self._linhas.get(projeto_id)
+            if linha is not None:
+                # Relido do disco (gravado por outra instância), o projeto é outro objeto
+                self._projetos[linha] = self.repositorio.obter_projeto(projeto_id)
+                self.dataChanged.emit(self.index(linha, 0), self.index(linha, len(self.COLUNAS) - 1))
+
+
+# Filtro pelos projetos encontrados na busca e ordenação pelos valores brutos
+class FiltroProjetos(QSortFilterProxyModel):
+    def __init__(self, modelo, parent=None):
+        super().__init__(parent)
+        self.setSourceModel(modelo)
+        self.setSortRole(PAPEL_ORDENACAO)
+        self.setDynamicSortFilter(True)
+        self._ids = None
+
+    # Conjunto de ids a exibir, ou None para exibir todos
+    def definir_ids(self, ids):
+        self._ids = ids
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, linha, pai):
+        if self._ids is None:
+            return True
+        return self.sourceModel().id_da_linha(linha) in self._ids
+
+    def id_do_indice(self, indice):
+        return self.mapToSource(indice).data(PAPEL_ID)
+
+
+# Despesas de um projeto. Guarda a lista do próprio projeto no cache do
+# repositório; despesas acrescentadas viram inserções de linhas no final.
+class ModeloDespesas(QAbstractTableModel):
+    COLUNAS = ("Nome", "Descrição", "Valor", "NF-e")
+
+    def __init__(self, repositorio, projeto_id, parent=None):
+        super().__init__(parent)
+        self.repositorio = repositorio
+        self.projeto_id = projeto_id
+        self._despesas = self._buscar()
+        self._total = len(self._despesas)
+        repositorio.observar(self._ao_alterar)
+
+    def desconectar(self):
+        self.repositorio.deixar_de_observar(self._ao_alterar)
+
+    def _buscar(self):
+        projeto = self.repositorio.obter_projeto(self.projeto_id)
+        return projeto["despesas"] if projeto is not None else []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._total
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUNAS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.COLUNAS[section]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role != Qt.ItemDataRole.DisplayRole:
+            return None
+        despesa = self._despesas[index.row()]
+        coluna = index.column()
+        if coluna == 0:
+            return despesa["nome"]
+        if coluna == 1:
+            return despesa["descricao"]
+        if coluna == 2:
+            return f"R$ {despesa['valor']:.2f}"
+        return despesa["nfe"]
+
+    def _ao_alterar(self, evento, projeto_id):
+        if evento != "recarregado" and projeto_id != self.projeto_id:
+            return
+        despesas = self._buscar()
+        if despesas is self._despesas and len(despesas) > self._total:
+            self.beginInsertRows(QModelIndex(), self._total, len(despesas) - 1)
+            self._total = len(despesas)
+            self.endInsertRows()
+        elif despesas is not self._despesas or len(despesas) != self._total:
+            self.beginResetModel()
+            self._despesas = despesas
+            self._total = len(despesas)
+            self.endResetModel()
+
+
+# Documentos de um tipo (orcamentos, nfe, ...) de um projeto
+class ModeloDocumentos(QAbstractListModel):
+    def __init__(self, repositorio, projeto_id, tipo, parent=None):
+        super().__init__(parent)
+        self.repositorio = repositorio
+        self.projeto_id = projeto_id
+        self.tipo = tipo
+        self._arquivos = self._buscar()
+        repositorio.observar(self._ao_alterar)
+
+    def desconectar(self):
+        self.repositorio.deixar_de_observar(self._ao_alterar)
+
+    def _buscar(self):
+        projeto = self.repositorio.obter_projeto(self.projeto_id)
+        return list(projeto[self.tipo]) if projeto is not None else []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._arquivos)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        referencia = self._arquivos[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return nome_documento(referencia)
+        if role == PAPEL_DOCUMENTO:
+            return referencia
+        return None
+
+    def _ao_alterar(self, evento, projeto_id):
+        if evento != "recarregado" and projeto_id != self.projeto_id:
+            return
+        arquivos = self._buscar()
+        if arquivos != self._arquivos:
+            self.beginResetModel()
+            self._arquivos = arquivos
+            self.endResetModel()
+
+
+# Desenha os botões "Abrir" e "Excluir" em cada linha da lista de documentos,
+# sem criar widgets por item, e emite a referência do documento clicado
+class DelegateDocumento(QStyledItemDelegate):
+    abrir = pyqtSignal(object)
+    excluir = pyqtSignal(object)
+
+    BOTOES = (("Abrir", "abrir"), ("Excluir", "excluir"))
+    LARGURA_BOTAO = 70
+
+    def _retangulos(self, rect):
+        retangulos = []
+        direita = rect.right()
+        for _ in self.BOTOES:
+            retangulos.insert(0, QRect(direita - self.LARGURA_BOTAO + 1, rect.top() + 1,
+                                       self.LARGURA_BOTAO - 2, rect.height() - 2))
+            direita -= self.LARGURA_BOTAO
+        return retangulos
+
+    def paint(self, painter, option, index):
+        opcao_texto = QStyleOptionViewItem(option)
+        opcao_texto.rect = option.rect.adjusted(0, 0, -self.LARGURA_BOTAO * len(self.BOTOES), 0)
+        super().paint(painter, opcao_texto, index)
+        estilo = QApplication.style()
+        for (texto, _), retangulo in zip(self.BOTOES, self._retangulos(option.rect)):
+            botao = QStyleOptionButton()
+            botao.rect = retangulo
+            botao.text = texto
+            botao.state = QStyle.StateFlag.State_Enabled
+            estilo.drawControl(QStyle.ControlElement.CE_PushButton, botao, painter)
+
+    def sizeHint(self, option, index):
+        tamanho = super().sizeHint(option, index)
+        return QSize(tamanho.width() + self.LARGURA_BOTAO * len(self.BOTOES), max(tamanho.height(), 28))
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() == QEvent.Type.MouseButtonRelease:
+            posicao = event.position().toPoint()
+            for (_, sinal), retangulo in zip(self.BOTOES, self._retangulos(option.rect)):
+                if retangulo.contains(posicao):
+                    getattr(self, sinal).emit(index.data(PAPEL_DOCUMENTO))
+                    return True
+        return super().editorEvent(event, model, option, index)
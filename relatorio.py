@@ -0,0 +1,521 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from fpdf import FPDF
+
+from configuracao import PROCESSOS_RELATORIO, TAMANHO_LOTE_RELATORIO, CACHE_RELATORIO_DIR, LIMITE_CACHE_RELATORIO
+from armazenamento import TIPOS_DOCUMENTO
+from documentos import nome_documento
+from instrumentacao import instrumentado
+
+TITULO = "Relatório de Projetos de Iniciação Científica"
+
+# Muda quando o desenho dos projetos muda, invalidando os fragmentos em cache
+VERSAO_LAYOUT = "2"
+
+# Fontes registradas sempre nesta ordem em todos os processos, para que
+# /F1 e /F2 nos fragmentos gerados em paralelo apontem para as mesmas fontes
+FONTES = (("Arial", "", "Helvetica"), ("Arial", "B", "Helvetica-Bold"))
+
+# Página A4 (mm) e escala para pontos
+LARGURA_PAGINA = 210
+ALTURA_PAGINA = 297
+ESCALA = 72 / 25.4
+MARGEM = 10
+MARGEM_INFERIOR = 15
+LARGURA_UTIL = LARGURA_PAGINA - 2 * MARGEM
+
+# Tabela de despesas (larguras em mm, somando a largura útil da página)
+COLUNAS_DESPESAS = ("Nome", "Descrição", "Valor", "NF-e")
+LARGURAS_DESPESAS = (50, 75, 30, 35)
+ALTURA_LINHA = 6
+
+SECOES_DOCUMENTOS = (
+    ("Orçamentos:", "orcamentos"),
+    ("Notas Fiscais (NF-e):", "nfe"),
+    ("Comprovantes de Pagamento:", "comprovantes"),
+    ("Arquivos Adicionais:", "arquivos_adicionais"),
+)
+
+# Tipos de faixa, usados na paginação
+FAIXA_NORMAL = 0
+FAIXA_INICIO_PROJETO = 1  # não começa um projeto no pé da página
+FAIXA_CABECALHO = 2       # cabeçalho da tabela, repetido após uma quebra de página
+FAIXA_LINHA = 3           # linha da tabela
+ESPACO_INICIO_PROJETO = 40
+
+
+# As fontes padrão do PDF só têm os caracteres do latin-1
+def _texto(valor):
+    return str(valor).encode("latin-1", "replace").decode("latin-1")
+
+
+def _cortar(pdf, valor, largura):
+    texto = _texto(valor)
+    disponivel = largura - 2
+    if pdf.get_string_width(texto) <= disponivel:
+        return texto
+    # Estimativa pela proporção e ajuste fino no final
+    texto = texto[:max(1, int(len(texto) * disponivel / pdf.get_string_width(texto)))]
+    while texto and pdf.get_string_width(texto + "...") > disponivel:
+        texto = texto[:-1]
+    return texto + "..."
+
+
+# Desenha cada faixa (uma linha indivisível: título, linha de tabela, ...)
+# sempre no topo de uma mesma página do FPDF e guarda só os operadores. A
+# paginação fica com o Paginador, que posiciona as faixas nas páginas reais;
+# assim o fragmento de um projeto não depende de onde ele cai no relatório.
+class _Gravador:
+    def __init__(self):
+        pdf = FPDF(unit="mm", format="A4")
+        pdf.set_margins(MARGEM, MARGEM)
+        pdf.set_auto_page_break(False)
+        pdf.add_page()
+        for familia, estilo, _ in FONTES:
+            pdf.set_font(familia, estilo, 10)
+        self.pdf = pdf
+        self.faixas = []
+
+    def faixa(self, tipo=FAIXA_NORMAL, estilo="", tamanho=10):
+        pdf = self.pdf
+        pdf.pages[pdf.page] = ""
+        pdf.set_xy(MARGEM, MARGEM)
+        # Cada faixa define o próprio estado: fonte e espessura das linhas
+        pdf.font_family = ""
+        pdf.set_font("Arial", estilo, tamanho)
+        pdf.set_line_width(0.2)
+        return _Faixa(self, tipo)
+
+
+class _Faixa:
+    def __init__(self, gravador, tipo):
+        self.gravador = gravador
+        self.tipo = tipo
+
+    def __enter__(self):
+        return self.gravador.pdf
+
+    def __exit__(self, tipo_excecao, *_):
+        if tipo_excecao is None:
+            pdf = self.gravador.pdf
+            self.gravador.faixas.append([self.tipo, pdf.get_y() - MARGEM, pdf.pages[pdf.page]])
+
+
+def _espaco(gravador, altura):
+    gravador.faixas.append([FAIXA_NORMAL, altura, ""])
+
+
+def _tabela_despesas(gravador, despesas):
+    with gravador.faixa(estilo="B") as pdf:
+        pdf.cell(0, 7, "Despesas:", ln=1)
+    if not despesas:
+        with gravador.faixa(tamanho=9) as pdf:
+            pdf.cell(0, ALTURA_LINHA, "  Nenhuma despesa", ln=1)
+        return
+    with gravador.faixa(FAIXA_CABECALHO, "B", 9) as pdf:
+        pdf.set_fill_color(220, 220, 220)
+        for titulo, largura in zip(COLUNAS_DESPESAS, LARGURAS_DESPESAS):
+            pdf.cell(largura, ALTURA_LINHA, _texto(titulo), border=1, fill=1)
+        pdf.ln()
+    total = 0.0
+    nome, descricao, valor, nfe = LARGURAS_DESPESAS
+    for despesa in despesas:
+        with gravador.faixa(FAIXA_LINHA, tamanho=9) as pdf:
+            pdf.cell(nome, ALTURA_LINHA, _cortar(pdf, despesa["nome"], nome), border=1)
+            pdf.cell(descricao, ALTURA_LINHA, _cortar(pdf, despesa["descricao"], descricao), border=1)
+            pdf.cell(valor, ALTURA_LINHA, f"R$ {despesa['valor']:.2f}", border=1, align="R")
+            pdf.cell(nfe, ALTURA_LINHA, _cortar(pdf, despesa["nfe"], nfe), border=1, ln=1)
+        total += despesa["valor"]
+    with gravador.faixa(FAIXA_LINHA, "B", 9) as pdf:
+        pdf.cell(nome + descricao, ALTURA_LINHA, "Total", border=1)
+        pdf.cell(valor, ALTURA_LINHA, f"R$ {total:.2f}", border=1, align="R")
+        pdf.cell(nfe, ALTURA_LINHA, "", border=1, ln=1)
+
+
+# Fragmento de um projeto: a lista de faixas [tipo, altura em mm, operadores]
+def renderizar_projeto(projeto, gravador=None):
+    gravador = gravador or _Gravador()
+    gravador.faixas = []
+    with gravador.faixa(FAIXA_INICIO_PROJETO, "B", 12) as pdf:
+        pdf.cell(0, 8, _cortar(pdf, f"Nome: {projeto['nome']}", LARGURA_UTIL), ln=1)
+    with gravador.faixa() as pdf:
+        pdf.cell(0, 6, _cortar(pdf, f"Responsável: {projeto['responsavel']}", LARGURA_UTIL), ln=1)
+        pdf.cell(0, 6, f"Valor Financiamento: R$ {projeto['valor_financiamento']:.2f}", ln=1)
+        pdf.cell(0, 6, _texto(f"Data de Cadastro: {projeto['data_cadastro']}"), ln=1)
+
+    _tabela_despesas(gravador, projeto["despesas"])
+
+    for titulo, tipo in SECOES_DOCUMENTOS:
+        with gravador.faixa(estilo="B") as pdf:
+            pdf.cell(0, 7, _texto(titulo), ln=1)
+        for referencia in projeto[tipo]:
+            with gravador.faixa(tamanho=9) as pdf:
+                pdf.cell(0, 5, _cortar(pdf, f"  {nome_documento(referencia)}", LARGURA_UTIL), ln=1)
+
+    _espaco(gravador, 6)  # Espaço entre projetos
+    return gravador.faixas
+
+
+def renderizar_titulo(titulo):
+    gravador = _Gravador()
+    with gravador.faixa(estilo="B", tamanho=14) as pdf:
+        pdf.cell(0, 10, _texto(titulo), ln=1, align="C")
+    _espaco(gravador, 4)
+    return gravador.faixas
+
+
+# Roda nos processos do pool: um fragmento por projeto
+def renderizar_lote(projetos):
+    gravador = _Gravador()
+    return [renderizar_projeto(projeto, gravador) for projeto in projetos]
+
+
+# Chave do fragmento de um projeto: hash do conteúdo que aparece no
+# relatório (ids e digests dos documentos não mudam o desenho)
+def chave_projeto(projeto):
+    normalizado = {
+        "nome": projeto["nome"],
+        "responsavel": projeto["responsavel"],
+        "valor_financiamento": projeto["valor_financiamento"],
+        "data_cadastro": projeto["data_cadastro"],
+        "despesas": [[d["nome"], d["descricao"], d["valor"], d["nfe"]] for d in projeto["despesas"]],
+    }
+    for tipo in TIPOS_DOCUMENTO:
+        normalizado[tipo] = [nome_documento(referencia) for referencia in projeto[tipo]]
+    texto = json.dumps(normalizado, sort_keys=True, ensure_ascii=False) + VERSAO_LAYOUT
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+# Fragmentos renderizados guardados em disco, um arquivo por chave. Quando o
+# total passa do limite, os usados há mais tempo são apagados (LRU pelo mtime,
+# que é atualizado a cada acerto). Pode ser usado por vários relatórios ao
+# mesmo tempo, em tarefas diferentes.
+class CacheFragmentos:
+    def __init__(self, pasta=CACHE_RELATORIO_DIR, limite=LIMITE_CACHE_RELATORIO):
+        self.pasta = pasta
+        self.limite = limite
+        self.acertos = 0
+        self.falhas = 0
+        self.removidos = 0
+        self._entradas = None
+        self._total = 0
+        self._trava = threading.RLock()
+
+    def _carregar_indice(self):
+        if self._entradas is not None:
+            return
+        os.makedirs(self.pasta, exist_ok=True)
+        entradas = []
+        with os.scandir(self.pasta) as it:
+            for entrada in it:
+                if entrada.name.endswith(".frag"):
+                    st = entrada.stat()
+                    entradas.append((st.st_mtime_ns, entrada.name[:-5], st.st_size))
+        entradas.sort()
+        self._entradas = OrderedDict((chave, tamanho) for _, chave, tamanho in entradas)
+        self._total = sum(self._entradas.values())
+
+    def _caminho(self, chave):
+        return os.path.join(self.pasta, chave + ".frag")
+
+    def contem(self, chave):
+        with self._trava:
+            return self._contem(chave)
+
+    def _contem(self, chave):
+        self._carregar_indice()
+        return chave in self._entradas
+
+    def obter(self, chave):
+        with self._trava:
+            return self._obter(chave)
+
+    def _obter(self, chave):
+        self._carregar_indice()
+        if chave in self._entradas:
+            try:
+                with open(self._caminho(chave), "rb") as f:
+                    fragmento = json.loads(zlib.decompress(f.read()))
+                os.utime(self._caminho(chave))
+            except (OSError, ValueError, zlib.error):
+                # Apagado por outra instância ou corrompido: renderiza de novo
+                self._esquecer(chave)
+            else:
+                self._entradas.move_to_end(chave)
+                self.acertos += 1
+                return fragmento
+        self.falhas += 1
+        return None
+
+    def guardar(self, chave, fragmento):
+        with self._trava:
+            return self._guardar(chave, fragmento)
+
+    def _guardar(self, chave, fragmento):
+        self._carregar_indice()
+        dados = zlib.compress(json.dumps(fragmento).encode("latin-1"))
+        temporario = self._caminho(chave) + ".tmp"
+        with open(temporario, "wb") as f:
+            f.write(dados)
+        os.replace(temporario, self._caminho(chave))
+        self._total -= self._entradas.pop(chave, 0)
+        self._entradas[chave] = len(dados)
+        self._total += len(dados)
+        while self._total > self.limite and len(self._entradas) > 1:
+            antiga = next(iter(self._entradas))
+            self._esquecer(antiga)
+            try:
+                os.remove(self._caminho(antiga))
+            except FileNotFoundError:
+                pass
+            self.removidos += 1
+
+    def _esquecer(self, chave):
+        self._total -= self._entradas.pop(chave, 0)
+
+    def estatisticas(self):
+        with self._trava:
+            return self._estatisticas()
+
+    def _estatisticas(self):
+        self._carregar_indice()
+        return {
+            "acertos": self.acertos,
+            "falhas": self.falhas,
+            "removidos": self.removidos,
+            "fragmentos": len(self._entradas),
+            "bytes": self._total,
+        }
+
+
+_cache = None
+
+
+def obter_cache_relatorio():
+    global _cache
+    if _cache is None:
+        _cache = CacheFragmentos()
+    return _cache
+
+
+# Posiciona as faixas nas páginas e entrega cada página pronta ao escritor
+class Paginador:
+    def __init__(self, escritor):
+        self.escritor = escritor
+        self.conteudo = []
+        self.y = MARGEM
+        self.cabecalho = None
+
+    def _nova_pagina(self):
+        self.escritor.adicionar_pagina(zlib.compress("".join(self.conteudo).encode("latin-1")))
+        self.conteudo = []
+        self.y = MARGEM
+
+    def _colocar(self, faixa):
+        _, altura, operadores = faixa
+        if operadores:
+            # A faixa foi desenhada no topo da página: desloca até a posição atual
+            deslocamento = (MARGEM - self.y) * ESCALA
+            self.conteudo.append(f"q 1 0 0 1 0 {deslocamento:.2f} cm\n{operadores}Q\n")
+        self.y += altura
+
+    def adicionar(self, fragmento):
+        limite = ALTURA_PAGINA - MARGEM_INFERIOR
+        for faixa in fragmento:
+            tipo, altura, _ = faixa
+            if tipo == FAIXA_INICIO_PROJETO:
+                necessario = max(altura, ESPACO_INICIO_PROJETO)
+            elif tipo == FAIXA_CABECALHO:
+                # O cabeçalho não fica sozinho no pé da página
+                necessario = altura * 2
+            else:
+                necessario = altura
+            if self.y + necessario > limite and self.y > MARGEM:
+                self._nova_pagina()
+                if tipo == FAIXA_LINHA and self.cabecalho is not None:
+                    self._colocar(self.cabecalho)
+            if tipo == FAIXA_CABECALHO:
+                self.cabecalho = faixa
+            elif tipo != FAIXA_LINHA:
+                self.cabecalho = None
+            self._colocar(faixa)
+
+    def fechar(self):
+        if self.conteudo or not self.escritor.paginas:
+            self._nova_pagina()
+
+
+# Grava um PDF página a página: cada página vai para o disco assim que
+# chega, e só os deslocamentos dos objetos ficam na memória. As páginas vão
+# para um temporário na mesma pasta, que só substitui o destino em fechar():
+# um relatório cancelado ou com erro não apaga o que já estava lá.
+class EscritorPDF:
+    # Objetos 1 e 2 (árvore de páginas e recursos) são gravados no final
+    RAIZ = 1
+    RECURSOS = 2
+
+    def __init__(self, nome_arquivo):
+        self.nome_arquivo = nome_arquivo
+        self.temporario = nome_arquivo + ".tmp"
+        self.arquivo = open(self.temporario, "wb")
+        self.deslocamentos = {}
+        self.proximo = 3
+        self.paginas = []
+        self.arquivo.write(b"%PDF-1.3\n%\xe2\xe3\xcf\xd3\n")
+
+    def _objeto(self, conteudo, numero=None, fluxo=None):
+        if numero is None:
+            numero = self.proximo
+            self.proximo += 1
+        self.deslocamentos[numero] = self.arquivo.tell()
+        self.arquivo.write(f"{numero} 0 obj\n".encode())
+        if fluxo is None:
+            self.arquivo.write(conteudo.encode("latin-1") + b"\n")
+        else:
+            self.arquivo.write(conteudo.encode("latin-1") + b"\nstream\n" + fluxo + b"\nendstream\n")
+        self.arquivo.write(b"endobj\n")
+        return numero
+
+    def _fluxo(self, dados, comprimido):
+        filtro = "/Filter /FlateDecode " if comprimido else ""
+        return self._objeto(f"<<{filtro}/Length {len(dados)}>>", fluxo=dados)
+
+    def adicionar_pagina(self, conteudo_comprimido):
+        numero_pagina = len(self.paginas) + 1
+        conteudo = self._fluxo(conteudo_comprimido, True)
+        # Rodapé com a numeração global da página
+        rodape = _texto(f"Página {numero_pagina}")
+        rodape = self._fluxo(
+            f"BT /F1 8.00 Tf {LARGURA_PAGINA * ESCALA / 2 - 15:.2f} 20.00 Td ({rodape}) Tj ET".encode("latin-1"), False)
+        self.paginas.append(self._objeto(
+            f"<</Type /Page /Parent {self.RAIZ} 0 R /Resources {self.RECURSOS} 0 R "
+            f"/Contents [{conteudo} 0 R {rodape} 0 R]>>"
+        ))
+
+    def fechar(self):
+        fontes = []
+        for indice, (_, _, nome) in enumerate(FONTES, 1):
+            numero = self._objeto(f"<</Type /Font /BaseFont /{nome} /Subtype /Type1 /Encoding /WinAnsiEncoding>>")
+            fontes.append(f"/F{indice} {numero} 0 R")
+        self._objeto(f"<</ProcSet [/PDF /Text] /Font <<{' '.join(fontes)}>>>>", self.RECURSOS)
+        filhos = " ".join(f"{numero} 0 R" for numero in self.paginas)
+        self._objeto(f"<</Type /Pages /Kids [{filhos}] /Count {len(self.paginas)} "
+                     f"/MediaBox [0 0 {LARGURA_PAGINA * ESCALA:.2f} {ALTURA_PAGINA * ESCALA:.2f}]>>", self.RAIZ)
+        info = self._objeto(f"<</Producer (ProjectManage) /CreationDate (D:{time.strftime('%Y%m%d%H%M%S')})>>")
+        catalogo = self._objeto(f"<</Type /Catalog /Pages {self.RAIZ} 0 R>>")
+        inicio_xref = self.arquivo.tell()
+        self.arquivo.write(f"xref\n0 {self.proximo}\n0000000000 65535 f \n".encode())
+        for numero in range(1, self.proximo):
+            self.arquivo.write(f"{self.deslocamentos[numero]:010d} 00000 n \n".encode())
+        self.arquivo.write(f"trailer\n<</Size {self.proximo} /Root {catalogo} 0 R /Info {info} 0 R>>\n"
+                           f"startxref\n{inicio_xref}\n%%EOF\n".encode())
+        self.arquivo.close()
+        os.replace(self.temporario, self.nome_arquivo)
+
+    def descartar(self):
+        self.arquivo.close()
+        os.remove(self.temporario)
+
+
+# Classe de Relatório PDF. Cada projeto vira um fragmento (faixas já
+# desenhadas), guardado no cache pelo hash do conteúdo: só os projetos
+# alterados desde a última geração são renderizados, em lotes e em paralelo
+# por processos. As páginas são gravadas em ordem assim que ficam prontas,
+# com poucos lotes em andamento de cada vez.
+class PDFReport:
+    def __init__(self, projetos, cache=None):
+        self.projetos = projetos
+        self.cache = cache or obter_cache_relatorio()
+
+    # progresso, se informado, recebe o número de projetos de cada lote
+    # concluído. Devolve quantos fragmentos vieram do cache e quantos foram
+    # renderizados.
+    @instrumentado("relatorio.pdf", lambda r: r)
+    def gerar_relatorio(self, nome_arquivo, progresso=None, processos=PROCESSOS_RELATORIO):
+        chaves = [chave_projeto(projeto) for projeto in self.projetos]
+        faltando = sum(1 for chave in set(chaves) if not self.cache.contem(chave))
+        lotes = [list(range(i, min(i + TAMANHO_LOTE_RELATORIO, len(self.projetos))))
+                 for i in range(0, len(self.projetos), TAMANHO_LOTE_RELATORIO)]
+        self._resultado = {"reaproveitados": 0, "renderizados": 0}
+        escritor = EscritorPDF(nome_arquivo)
+        paginador = Paginador(escritor)
+        try:
+            paginador.adicionar(renderizar_titulo(TITULO))
+            if faltando <= TAMANHO_LOTE_RELATORIO:
+                # Poucos projetos a renderizar: não compensa iniciar processos
+                self._gerar(paginador, lotes, chaves, None, progresso, 1)
+            else:
+                # spawn: o processo da interface tem threads do Qt, e fork com threads não é seguro
+                processos = processos or os.cpu_count() or 1
+                with ProcessPoolExecutor(processos, mp_context=multiprocessing.get_context("spawn")) as pool:
+                    self._gerar(paginador, lotes, chaves, pool, progresso, processos * 2)
+            paginador.fechar()
+        except BaseException:
+            escritor.descartar()
+            raise
+        escritor.fechar()
+        self._resultado["bytes"] = os.path.getsize(nome_arquivo)
+        return self._resultado
+
+    def _agendar(self, lote, chaves, pool):
+        # Fragmentos em cache são lidos já (antes que um lote anterior os
+        # tire do cache); os demais vão para o pool
+        fragmentos = {}
+        faltando = {}
+        for i in lote:
+            if chaves[i] not in fragmentos:
+                fragmento = self.cache.obter(chaves[i])
+                if fragmento is None:
+                    faltando.setdefault(chaves[i], self.projetos[i])
+                else:
+                    fragmentos[chaves[i]] = fragmento
+        projetos = list(faltando.values())
+        if pool is None:
+            futuro = Future()
+            futuro.set_result(renderizar_lote(projetos))
+        else:
+            futuro = pool.submit(renderizar_lote, projetos)
+        return lote, fragmentos, list(faltando), futuro
+
+    def _gerar(self, paginador, lotes, chaves, pool, progresso, janela):
+        pendentes = deque()
+        restantes = iter(lotes)
+        try:
+            while True:
+                while len(pendentes) < janela:
+                    lote = next(restantes, None)
+                    if lote is None:
+                        break
+                    pendentes.append(self._agendar(lote, chaves, pool))
+                if not pendentes:
+                    break
+                lote, fragmentos, faltando, futuro = pendentes.popleft()
+                for chave, fragmento in zip(faltando, futuro.result()):
+                    self.cache.guardar(chave, fragmento)
+                    fragmentos[chave] = fragmento
+                self._resultado["reaproveitados"] += len(lote) - len(faltando)
+                self._resultado["renderizados"] += len(faltando)
+                for i in lote:
+                    paginador.adicionar(fragmentos[chaves[i]])
+                if progresso is not None:
+                    progresso(len(lote))
+        except BaseException:
+            for *_, futuro in pendentes:
+                futuro.cancel()
+            raise
+
+
+# Executada por uma tarefa em segundo plano (fora da thread da interface)
+def tarefa_relatorio(tarefa, projetos, nome_arquivo):
+    tarefa.definir_total(len(projetos))
+    relatorio = PDFReport(projetos)
+    resultado = relatorio.gerar_relatorio(nome_arquivo, tarefa.avancar)
+    return dict(resultado, cache=relatorio.cache.estatisticas())
@@ -0,0 +1,586 @@
+import threading
+import time
+
+from armazenamento import (obter_armazenamento, aplicar_operacao, ids_do_registro, novo_id, garantir_ids_projeto,
+                           verificar_registro, TIPOS_DOCUMENTO, CAMPOS_PROJETO, ConflitoConcorrencia)
+from configuracao import ATRASO_GRAVACAO, ATRASO_MAXIMO_GRAVACAO
+from documentos import digest_documento
+from instrumentacao import medir
+from busca import IndiceBusca
+from modelo import Projeto, para_json
+
+# Versão de um projeto cujo conteúdo no disco esta instância não conhece: é
+# relido na próxima consulta
+VERSAO_DESCONHECIDA = -1
+
+
+class Repositorio:
+    # Dono dos dados carregados em memória. As leituras são servidas da memória
+    # e os dados só são recarregados quando a assinatura do armazenamento
+    # (mtime/tamanho dos arquivos ou data_version do SQLite) muda, isto é,
+    # quando outra instância gravou. Os objetos devolvidos são os do cache:
+    # para alterar, use os métodos de alteração abaixo.
+    #
+    # Os projetos ficam em memória na forma compacta de modelo.Projeto (que
+    # também se lê como dicionário), indexados por id, e índices auxiliares (por responsável,
+    # por número de NF-e das despesas e a contagem de referências a cada blob
+    # do armazém de documentos) são atualizados a cada alteração. O índice de
+    # busca textual e as colunas financeiras são montados no primeiro uso e,
+    # a partir daí, também são atualizados projeto a projeto.
+    #
+    # Observadores registrados com observar(funcao) recebem (evento, projeto_id)
+    # a cada alteração: "inserido", "alterado", "removido" ou "recarregado"
+    # (neste último projeto_id é None e todos os objetos foram trocados).
+    #
+    # As alterações entram no cache na hora e são gravadas depois, em lote:
+    # ficam numa fila de registros que vai para o armazenamento numa única
+    # gravação (aplicar_lote) quando passam `atraso` segundos sem novas
+    # alterações (no máximo `atraso_maximo` depois da primeira), em salvar()
+    # ou em fechar(). Com atraso 0 cada alteração é gravada antes de voltar.
+    # Uma falha na gravação em segundo plano mantém a fila e fica em
+    # erro_gravacao; a gravação é tentada de novo a cada ESPERA_NOVA_TENTATIVA
+    # segundos (e em salvar(), que propaga o erro). Cada falha é avisada uma
+    # vez: por tomar_erro_gravacao() e às funções registradas com
+    # observar_falhas(funcao), chamadas sem argumentos na thread da gravação.
+    #
+    # Várias instâncias (processos) podem usar os mesmos dados. O repositório
+    # guarda a versão dos dados e a de cada projeto que leu; quando outra
+    # instância grava, só os projetos com outra versão no disco são relidos
+    # (eventos "inserido", "alterado" e "removido", ou um só "recarregado" se
+    # quase tudo mudou). As alterações levam o que esta instância via (o
+    # valor anterior dos campos, a versão dos projetos substituídos), e o
+    # armazenamento recusa só as que sobrescreveriam uma alteração alheia
+    # (ver armazenamento.ConflitoConcorrencia): salvar() e a gravação imediata
+    # lançam ConflitoConcorrencia; na gravação em segundo plano os conflitos
+    # ficam em `conflitos` (ver tomar_conflitos()). Os projetos recusados são
+    # relidos do disco.
+    def __init__(self, armazenamento=None, atraso=ATRASO_GRAVACAO, atraso_maximo=ATRASO_MAXIMO_GRAVACAO):
+        self.armazenamento = armazenamento or obter_armazenamento()
+        self.atraso = atraso
+        self.atraso_maximo = max(atraso, atraso_maximo)
+        self._pendentes = []
+        self._primeira_pendente = None
+        self._temporizador = None
+        self.erro_gravacao = None
+        self._erro_novo = None
+        self._ao_falhar = []
+        self._trava = threading.RLock()
+        self._dados = None
+        self._assinatura = None
+        self._versao = 0
+        self._versoes = {}
+        self.conflitos = []
+        self._projetos = {}
+        self._lista = None
+        self._por_responsavel = {}
+        self._por_nfe = {}
+        self._por_digest = {}
+        self._busca = None
+        self._financeiro = None
+        self.acertos = 0
+        self.falhas = 0
+        self._observadores = []
+
+    def observar(self, funcao):
+        self._observadores.append(funcao)
+
+    def observar_falhas(self, funcao):
+        self._ao_falhar.append(funcao)
+
+    def deixar_de_observar(self, funcao):
+        if funcao in self._observadores:
+            self._observadores.remove(funcao)
+
+    def _notificar(self, evento, projeto_id=None):
+        for funcao in list(self._observadores):
+            funcao(evento, projeto_id)
+
+    def _recarregar(self):
+        dados = self.armazenamento.carregar()
+        self._versao = dados.pop("versao", 0)
+        self._versoes = dados.pop("versoes", {})
+        self._projetos = {p["id"]: Projeto.de_json(p) for p in dados.pop("projetos")}
+        self._dados = dados
+        self._lista = None
+        self._reindexar()
+
+    def _reindexar(self):
+        self._por_responsavel = {}
+        self._por_nfe = {}
+        self._por_digest = {}
+        self._busca = None
+        self._financeiro = None
+        for projeto in self._projetos.values():
+            self._indexar(projeto)
+
+    def _garantir_atual(self):
+        with self._trava:
+            assinatura = self.armazenamento.assinatura()
+            if self._dados is not None and assinatura == self._assinatura:
+                self.acertos += 1
+                return
+            if self._pendentes:
+                # O que ainda está na fila entra no disco antes da releitura
+                self.conflitos.extend(self._gravar_pendentes())
+                assinatura = self.armazenamento.assinatura()
+            self.falhas += 1
+            if self._dados is None:
+                with medir("armazenamento.carregar", backend=type(self.armazenamento).__name__) as medicao:
+                    self._recarregar()
+                    medicao.definir(projetos=len(self._projetos))
+                eventos = [("recarregado", None)]
+            else:
+                eventos = self._atualizar_do_disco()
+            self._assinatura = assinatura
+            for evento, projeto_id in eventos:
+                self._notificar(evento, projeto_id)
+
+    # Outra instância gravou: substitui no cache só os projetos com outra
+    # versão no disco e devolve os eventos a notificar
+    def _atualizar_do_disco(self):
+        with medir("armazenamento.sincronizar", backend=type(self.armazenamento).__name__) as medicao:
+            alteracoes = self.armazenamento.alteracoes(self._versoes)
+            eventos = []
+            for projeto_id in alteracoes["removidos"]:
+                anterior = self._projetos.pop(projeto_id, None)
+                if anterior is not None:
+                    self._desindexar(anterior)
+                    eventos.append(("removido", projeto_id))
+            for dados in alteracoes["projetos"]:
+                anterior = self._projetos.get(dados["id"])
+                if anterior is not None:
+                    self._desindexar(anterior)
+                projeto = self._projetos[dados["id"]] = Projeto.de_json(dados)
+                self._indexar(projeto)
+                eventos.append(("inserido" if anterior is None else "alterado", dados["id"]))
+            self._versao = alteracoes["versao"]
+            self._versoes = alteracoes["versoes"]
+            if eventos:
+                self._lista = None
+            medicao.definir(projetos=len(eventos))
+        # Quase tudo mudou: um reinício dos modelos sai mais barato que um sinal por projeto
+        if len(eventos) > max(self.LIMITE_EVENTOS_SINCRONIZACAO, len(self._projetos) // 2):
+            return [("recarregado", None)]
+        return eventos
+
+    LIMITE_EVENTOS_SINCRONIZACAO = 100
+
+    # Confere agora se outra instância gravou (ex.: avisado pelo
+    # QFileSystemWatcher da interface); as alterações chegam aos observadores
+    def sincronizar(self):
+        self._garantir_atual()
+
+    # Conflitos da gravação em segundo plano ainda não mostrados ao usuário
+    def tomar_conflitos(self):
+        with self._trava:
+            conflitos, self.conflitos = self.conflitos, []
+            return conflitos
+
+    # Falha da gravação em segundo plano ainda não mostrada ao usuário (None
+    # se não houve, ou se uma nova tentativa já gravou a fila)
+    def tomar_erro_gravacao(self):
+        with self._trava:
+            erro, self._erro_novo = self._erro_novo, None
+            return erro
+
+    # Os índices auxiliares usam dicionários como conjuntos ordenados
+    def _indexar(self, projeto):
+        self._por_responsavel.setdefault(projeto["responsavel"], {})[projeto["id"]] = None
+        for despesa in projeto["despesas"]:
+            if despesa["nfe"]:
+                self._por_nfe.setdefault(despesa["nfe"], {})[despesa["id"]] = (projeto["id"], despesa)
+        for tipo in TIPOS_DOCUMENTO:
+            for referencia in projeto[tipo]:
+                digest = digest_documento(referencia)
+                if digest is not None:
+                    self._por_digest[digest] = self._por_digest.get(digest, 0) + 1
+        if self._busca is not None:
+            self._busca.adicionar(projeto)
+        if self._financeiro is not None:
+            self._financeiro.adicionar(projeto)
+
+    def _desindexar(self, projeto):
+        ids = self._por_responsavel.get(projeto["responsavel"], {})
+        ids.pop(projeto["id"], None)
+        if not ids:
+            self._por_responsavel.pop(projeto["responsavel"], None)
+        for despesa in projeto["despesas"]:
+            despesas = self._por_nfe.get(despesa["nfe"], {})
+            despesas.pop(despesa["id"], None)
+            if not despesas:
+                self._por_nfe.pop(despesa["nfe"], None)
+        for tipo in TIPOS_DOCUMENTO:
+            for referencia in projeto[tipo]:
+                digest = digest_documento(referencia)
+                if digest is None:
+                    continue
+                self._por_digest[digest] -= 1
+                if not self._por_digest[digest]:
+                    del self._por_digest[digest]
+        if self._busca is not None:
+            self._busca.remover(projeto["id"])
+        if self._financeiro is not None:
+            self._financeiro.remover(projeto["id"])
+
+    def invalidar(self):
+        with self._trava:
+            self._dados = None
+
+    def estatisticas(self):
+        return {"acertos": self.acertos, "falhas": self.falhas, "pendentes": len(self._pendentes)}
+
+    # Leituras
+    def carregar(self):
+        return dict(self._dados_atuais(), projetos=self.projetos())
+
+    def _dados_atuais(self):
+        self._garantir_atual()
+        return self._dados
+
+    def projetos(self):
+        with self._trava:
+            self._garantir_atual()
+            if self._lista is None:
+                self._lista = list(self._projetos.values())
+            return self._lista
+
+    def obter_projeto(self, projeto_id):
+        with self._trava:
+            self._garantir_atual()
+            return self._projetos.get(projeto_id)
+
+    def projetos_por_responsavel(self, responsavel):
+        with self._trava:
+            self._garantir_atual()
+            return [self._projetos[i] for i in self._por_responsavel.get(responsavel, {})]
+
+    # Devolve pares (projeto, despesa) com o número de NF-e informado
+    def despesas_por_nfe(self, nfe):
+        with self._trava:
+            self._garantir_atual()
+            return [
+                (self._projetos[projeto_id], despesa)
+                for projeto_id, despesa in self._por_nfe.get(nfe, {}).values()
+            ]
+
+    # Chaves de NF-e de todas as despesas (cópia, pode ir para outra thread)
+    def chaves_nfe(self):
+        with self._trava:
+            self._garantir_atual()
+            return set(self._por_nfe)
+
+    # Digests de todos os blobs referenciados (cópia, pode ir para outra thread)
+    def digests_documentos(self):
+        with self._trava:
+            self._garantir_atual()
+            return set(self._por_digest)
+
+    # Quantas referências (em todos os projetos) apontam para o blob
+    def referencias_documento(self, digest):
+        with self._trava:
+            self._garantir_atual()
+            return self._por_digest.get(digest, 0)
+
+    # Busca textual (sem acentos) em nome e responsável dos projetos, nome,
+    # descrição e NF-e das despesas e nomes dos documentos. Devolve pares
+    # (projeto, pontuação) do mais ao menos relevante.
+    def buscar(self, consulta, limite=None):
+        with self._trava:
+            self._garantir_atual()
+            if self._busca is None:
+                self._busca = IndiceBusca(self._projetos.values())
+            return [(self._projetos[projeto_id], pontuacao)
+                    for projeto_id, pontuacao in self._busca.buscar(consulta, limite)]
+
+    # Colunas (NumPy) com os valores de projetos e despesas para os totais,
+    # saldos e agrupamentos (ver financeiro.ColunasFinanceiras). Como os
+    # objetos do cache, devem ser consultadas na thread que altera o repositório.
+    def financeiro(self):
+        with self._trava:
+            self._garantir_atual()
+            if self._financeiro is None:
+                # numpy só é carregado por quem usa os totais
+                from financeiro import ColunasFinanceiras
+                self._financeiro = ColunasFinanceiras(self._projetos.values())
+            return self._financeiro
+
+    # Gravação da fila de alterações. Devolve os conflitos (alterações
+    # recusadas pelo armazenamento por sobrescreverem as de outra instância).
+    def _gravar_pendentes(self):
+        if not self._pendentes:
+            return []
+        with medir("armazenamento.gravar", backend=type(self.armazenamento).__name__,
+                   registros=len(self._pendentes)):
+            resultado = self.armazenamento.aplicar_lote(self._pendentes)
+        ids = {projeto_id for registro in self._pendentes for projeto_id in ids_do_registro(registro) if projeto_id}
+        self._pendentes = []
+        self._primeira_pendente = None
+        self.erro_gravacao = None
+        self._erro_novo = None
+        if resultado["versao_anterior"] == self._versao and not resultado["conflitos"]:
+            # Ninguém gravou desde a última leitura: o disco é o cache
+            for projeto_id in ids:
+                if projeto_id in self._projetos:
+                    self._versoes[projeto_id] = resultado["versao"]
+                else:
+                    self._versoes.pop(projeto_id, None)
+            self._versao = resultado["versao"]
+            self._assinatura = self.armazenamento.assinatura()
+        else:
+            # Outra instância gravou antes deste lote: os projetos do lote são
+            # relidos do disco (com a parte dela) na próxima consulta
+            for projeto_id in ids:
+                self._versoes[projeto_id] = VERSAO_DESCONHECIDA
+            self._assinatura = None
+        return resultado["conflitos"]
+
+    # Espera (segundos) até tentar de novo uma gravação em segundo plano que falhou
+    ESPERA_NOVA_TENTATIVA = 5.0
+
+    def _agendar_gravacao(self, espera=None):
+        if espera is None:
+            agora = time.monotonic()
+            if self._primeira_pendente is None:
+                self._primeira_pendente = agora
+            espera = min(self.atraso, max(0.0, self._primeira_pendente + self.atraso_maximo - agora))
+        if self._temporizador is not None:
+            self._temporizador.cancel()
+        self._temporizador = threading.Timer(espera, self._gravar_em_segundo_plano)
+        self._temporizador.daemon = True
+        self._temporizador.start()
+
+    def _gravar_em_segundo_plano(self):
+        with self._trava:
+            try:
+                self.conflitos.extend(self._gravar_pendentes())
+                return
+            except Exception as erro:
+                nova_falha = self.erro_gravacao is None
+                self.erro_gravacao = erro
+                if nova_falha:
+                    self._erro_novo = erro
+                # A fila continua esperando: nova tentativa mesmo sem novas alterações
+                self._agendar_gravacao(self.ESPERA_NOVA_TENTATIVA)
+        if nova_falha:
+            for funcao in list(self._ao_falhar):
+                funcao()
+
+    def pendentes(self):
+        return len(self._pendentes)
+
+    # Grava agora as alterações que estão na fila
+    def salvar(self):
+        with self._trava:
+            if self._temporizador is not None:
+                self._temporizador.cancel()
+                self._temporizador = None
+            conflitos = self._gravar_pendentes()
+        if conflitos:
+            raise ConflitoConcorrencia(conflitos)
+
+    # Alterações: aplicadas no cache e nos índices e enfileiradas para gravação.
+    # O registro só entra na fila depois de aplicado: se aplicar ou indexar
+    # falhar (ex.: valor que não é número), o cache e os índices voltam ao que
+    # eram e nada vai para o disco.
+    def _alterar(self, registro):
+        with self._trava:
+            self._garantir_atual()
+            # A fila fica com o registro (já no esquema JSON) e o cache com uma cópia
+            copia = para_json(registro)
+            anteriores = {projeto_id: self._projetos.get(projeto_id) for projeto_id in ids_do_registro(copia)}
+            copias = {projeto_id: anterior.copia() for projeto_id, anterior in anteriores.items()
+                      if anterior is not None}
+            try:
+                eventos = self._aplicar(copia, anteriores)
+            except Exception:
+                self._desfazer(anteriores, copias)
+                raise
+            self._pendentes.append(registro)
+            if self.atraso <= 0:
+                try:
+                    conflitos = self._gravar_pendentes()
+                except Exception:
+                    self._pendentes.pop()
+                    self._desfazer(anteriores, copias)
+                    raise
+                if conflitos:
+                    # O cache fica com o que foi gravado (inclusive a parte aceita)
+                    self._garantir_atual()
+                    raise ConflitoConcorrencia(conflitos)
+            else:
+                self._agendar_gravacao()
+            for evento, projeto_id in eventos:
+                self._notificar(evento, projeto_id)
+
+    # Aplica o registro no cache e nos índices e devolve os eventos a notificar
+    def _aplicar(self, registro, anteriores):
+        for anterior in anteriores.values():
+            if anterior is not None:
+                self._desindexar(anterior)
+        aplicar_operacao(self._projetos, registro)
+        eventos = []
+        for projeto_id, anterior in anteriores.items():
+            atual = self._projetos.get(projeto_id)
+            if atual is not None and not isinstance(atual, Projeto):
+                # Projetos inseridos por aplicar_operacao chegam como dicionários
+                atual = self._projetos[projeto_id] = Projeto.de_json(atual)
+            if atual is not None:
+                self._indexar(atual)
+            if anterior is None or atual is None:
+                self._lista = None
+            if anterior is None and atual is not None:
+                eventos.append(("inserido", projeto_id))
+            elif anterior is not None and atual is None:
+                eventos.append(("removido", projeto_id))
+            elif atual is not None:
+                eventos.append(("alterado", projeto_id))
+        return eventos
+
+    # Desfaz no cache um registro que não pôde ser aplicado ou gravado: os
+    # projetos voltam ao conteúdo das cópias, nos mesmos objetos, e os índices
+    # (que podem ter ficado pela metade) são remontados
+    def _desfazer(self, anteriores, copias):
+        for projeto_id, anterior in anteriores.items():
+            if anterior is None:
+                self._projetos.pop(projeto_id, None)
+            else:
+                anterior.restaurar(copias[projeto_id])
+                self._projetos[projeto_id] = anterior
+        self._lista = None
+        self._reindexar()
+
+    # Os ids são fixados antes de enfileirar para que disco e cache usem os mesmos.
+    # O armazenamento recebe os dados no esquema JSON, mesmo quando quem chama
+    # passa objetos do cache (ex.: referências de documentos de um Projeto).
+    def inserir_projeto(self, projeto):
+        garantir_ids_projeto(projeto)
+        projeto = para_json(projeto)
+        self._alterar({"op": "inserir_projeto", "projeto": projeto})
+
+    # O registro leva o valor que quem altera via em cada campo: o
+    # armazenamento recusa os campos que outra instância alterou nesse meio
+    # tempo. `esperado` ({campo: valor}) são os valores que o usuário viu
+    # (ex.: ao abrir um diálogo de edição); sem ele, valem os do cache, que
+    # acabou de ser conferido com o disco. Com `esperado`, o que outra
+    # instância já gravou é recusado na hora (ConflitoConcorrencia), sem
+    # passar pela fila.
+    def atualizar_projeto(self, projeto_id, campos, esperado=None):
+        campos = para_json(campos)
+        with self._trava:
+            self._garantir_atual()
+            registro = {"op": "atualizar_projeto", "id": projeto_id, "campos": campos}
+            if esperado is not None:
+                registro["esperado"] = {campo: para_json(valor) for campo, valor in esperado.items()
+                                        if campo in campos}
+                _, conflitos = verificar_registro(registro, lambda i: (self._projetos.get(i), None))
+                if conflitos:
+                    raise ConflitoConcorrencia(conflitos)
+            else:
+                atual = self._projetos.get(projeto_id)
+                if atual is not None:
+                    registro["esperado"] = {campo: para_json(atual[campo]) for campo in campos if campo in atual}
+            self._alterar(registro)
+
+    # Projetos que já existem levam a versão lida: são recusados se outra
+    # instância os alterou depois
+    def gravar_projetos(self, projetos):
+        for projeto in projetos:
+            garantir_ids_projeto(projeto)
+        projetos = para_json(projetos)
+        with self._trava:
+            self._garantir_atual()
+            versoes = {p["id"]: self._versoes.get(p["id"]) for p in projetos if p["id"] in self._projetos}
+            registro = {"op": "gravar_projetos", "projetos": projetos}
+            if versoes:
+                registro["versoes"] = versoes
+            self._alterar(registro)
+
+    # Importa projetos lidos de arquivos ZIP numa única gravação. Um projeto já
+    # existente (mesmo id ou, sem id, mesmo nome e data de cadastro) é mesclado
+    # em vez de duplicado, então importar o mesmo arquivo de novo não muda nada.
+    # Devolve as contagens de inseridos, mesclados e inalterados.
+    def importar_projetos(self, projetos):
+        with self._trava:
+            self._garantir_atual()
+            por_chave = {(p["nome"], p["data_cadastro"]): p["id"] for p in self._projetos.values()}
+            gravar = {}
+            contagem = {"inseridos": 0, "mesclados": 0, "inalterados": 0}
+            for importado in projetos:
+                if "id" not in importado:
+                    importado["id"] = por_chave.get((importado["nome"], importado["data_cadastro"]), novo_id())
+                atual = gravar.get(importado["id"]) or self._projetos.get(importado["id"])
+                mesclado = mesclar_projeto(atual, importado)
+                if mesclado is None:
+                    contagem["inalterados"] += 1
+                    continue
+                contagem["inseridos" if atual is None else "mesclados"] += 1
+                gravar[mesclado["id"]] = mesclado
+            if gravar:
+                self.gravar_projetos(list(gravar.values()))
+            return contagem
+
+    def remover_projeto(self, projeto_id):
+        self._alterar({"op": "remover_projeto", "id": projeto_id})
+
+    def adicionar_despesa(self, projeto_id, despesa):
+        despesa.setdefault("id", novo_id())
+        despesa = para_json(despesa)
+        self._alterar({"op": "adicionar_despesa", "id": projeto_id, "despesa": despesa})
+
+    def adicionar_documento(self, projeto_id, tipo, arquivo):
+        arquivo = para_json(arquivo)
+        self._alterar({"op": "adicionar_documento", "id": projeto_id, "tipo": tipo, "arquivo": arquivo})
+
+    # Várias despesas (ex.: coladas de uma planilha ou lidas de NF-e) num
+    # único registro, com os documentos de origem ({tipo: [referências]})
+    def adicionar_despesas(self, projeto_id, despesas, documentos=None):
+        for despesa in despesas:
+            despesa.setdefault("id", novo_id())
+        registro = {"op": "adicionar_despesas", "id": projeto_id, "despesas": para_json(despesas)}
+        if documentos:
+            registro["documentos"] = para_json(documentos)
+        self._alterar(registro)
+
+    def remover_documento(self, projeto_id, tipo, arquivo):
+        arquivo = para_json(arquivo)
+        self._alterar({"op": "remover_documento", "id": projeto_id, "tipo": tipo, "arquivo": arquivo})
+
+    # Nada do que já foi aceito se perde ao fechar: a fila é gravada antes e,
+    # se a gravação falhar, o armazenamento continua aberto e o erro propaga
+    def fechar(self):
+        self.salvar()
+        self.armazenamento.fechar()
+
+
+# Junta um projeto importado ao existente: os campos do projeto vêm do
+# importado, e despesas e documentos ausentes são acrescentados. Devolve None
+# se nada mudaria.
+def mesclar_projeto(atual, importado):
+    if atual is None:
+        return importado
+    mesclado = para_json(atual)
+    for campo in CAMPOS_PROJETO:
+        mesclado[campo] = importado.get(campo, atual[campo])
+    # Despesas sem id (exportadas antes dos ids) são comparadas pelo conteúdo
+    existentes = {d["id"] for d in mesclado["despesas"]}
+    conteudos = {(d["nome"], d["descricao"], d["valor"], d["nfe"]) for d in mesclado["despesas"]}
+    for despesa in importado.get("despesas", []):
+        if despesa.get("id") in existentes or (
+                "id" not in despesa and (despesa["nome"], despesa["descricao"], despesa["valor"], despesa["nfe"]) in conteudos):
+            continue
+        mesclado["despesas"].append(despesa)
+    for tipo in TIPOS_DOCUMENTO:
+        for referencia in importado.get(tipo, []):
+            if referencia not in mesclado[tipo]:
+                mesclado[tipo].append(referencia)
+    return mesclado if mesclado != atual else None
+
+
+_repositorio = None
+
+
+def obter_repositorio():
+    global _repositorio
+    if _repositorio is None:
+        _repositorio = Repositorio()
+    return _repositorio
@@ -0,0 +1,99 @@
+import numpy as np
+from PyQt6.QtCore import QTimer
+from PyQt6.QtWidgets import QWidget, QVBoxLayout, QGridLayout, QLabel, QTableWidget, QTableWidgetItem, QHeaderView
+
+# Projetos acima do orçamento listados na aba (os de maior excesso)
+LIMITE_ACIMA_DO_ORCAMENTO = 100
+
+
+def _moeda(valor):
+    return f"R$ {valor:,.2f}".replace(",", "_").replace(".", ",").replace("_", ".")
+
+
+def _item(texto):
+    return QTableWidgetItem(str(texto))
+
+
+# Aba com financiamento x gasto: totais, agrupamentos por responsável e por
+# mês e os projetos cujo gasto passou do financiamento. Os números vêm das
+# colunas do repositório e só são recalculados com a aba visível.
+class PainelResumo(QWidget):
+    def __init__(self, repositorio, parent=None):
+        super().__init__(parent)
+        self.repositorio = repositorio
+        layout = QVBoxLayout(self)
+
+        totais = QGridLayout()
+        self.rotulos = {}
+        campos = (("projetos", "Projetos"), ("despesas", "Despesas"), ("financiamento", "Financiamento"),
+                  ("gasto", "Gasto"), ("saldo", "Saldo"), ("acima_do_orcamento", "Acima do orçamento"))
+        for i, (chave, texto) in enumerate(campos):
+            self.rotulos[chave] = QLabel()
+            totais.addWidget(QLabel(f"{texto}:"), i // 3, (i % 3) * 2)
+            totais.addWidget(self.rotulos[chave], i // 3, (i % 3) * 2 + 1)
+        layout.addLayout(totais)
+
+        colunas = ("Projetos", "Financiamento", "Gasto", "Saldo")
+        layout.addWidget(QLabel("Por responsável"))
+        self.tabela_responsaveis = self._tabela(("Responsável",) + colunas)
+        layout.addWidget(self.tabela_responsaveis)
+        layout.addWidget(QLabel("Por mês de cadastro do projeto"))
+        self.tabela_meses = self._tabela(("Mês",) + colunas)
+        layout.addWidget(self.tabela_meses)
+        layout.addWidget(QLabel("Projetos acima do orçamento"))
+        self.tabela_acima = self._tabela(("Projeto", "Financiamento", "Gasto", "Excesso"))
+        layout.addWidget(self.tabela_acima)
+
+        # Várias alterações seguidas (ex.: importação) geram um só recálculo
+        self.temporizador = QTimer(self)
+        self.temporizador.setSingleShot(True)
+        self.temporizador.setInterval(200)
+        self.temporizador.timeout.connect(self.atualizar)
+        repositorio.observar(self._ao_alterar)
+
+    @staticmethod
+    def _tabela(cabecalhos):
+        tabela = QTableWidget(0, len(cabecalhos))
+        tabela.setHorizontalHeaderLabels(cabecalhos)
+        tabela.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        tabela.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        return tabela
+
+    def _ao_alterar(self, evento, projeto_id):
+        if self.isVisible():
+            self.temporizador.start()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.atualizar()
+
+    @staticmethod
+    def _preencher(tabela, linhas):
+        tabela.setRowCount(len(linhas))
+        for i, linha in enumerate(linhas):
+            for j, valor in enumerate(linha):
+                tabela.setItem(i, j, _item(valor))
+
+    def atualizar(self):
+        financeiro = self.repositorio.financeiro()
+        totais = financeiro.totais()
+        for chave, rotulo in self.rotulos.items():
+            valor = totais[chave]
+            rotulo.setText(_moeda(valor) if isinstance(valor, float) else str(valor))
+
+        for tabela, grupos in ((self.tabela_responsaveis, financeiro.por_responsavel()),
+                               (self.tabela_meses, financeiro.por_mes())):
+            self._preencher(tabela, [
+                (g["chave"], g["projetos"], _moeda(g["financiamento"]), _moeda(g["gasto"]), _moeda(g["saldo"]))
+                for g in grupos
+            ])
+
+        colunas = financeiro.por_projeto()
+        acima = np.flatnonzero(colunas["acima_do_orcamento"])
+        acima = acima[np.argsort(colunas["saldo"][acima])][:LIMITE_ACIMA_DO_ORCAMENTO]
+        linhas = []
+        for i in acima:
+            projeto = self.repositorio.obter_projeto(colunas["ids"][i])
+            linhas.append((projeto["nome"], _moeda(colunas["financiamento"][i]), _moeda(colunas["gasto"][i]),
+                           _moeda(-colunas["saldo"][i])))
+        self._preencher(self.tabela_acima, linhas)
@@ -0,0 +1,705 @@
+import asyncio
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import re
+import signal
+import tempfile
+import urllib.parse
+from http import HTTPStatus
+
+from armazenamento import (criar_armazenamento, verificar_registro, garantir_ids_projeto, novo_id,
+                           descrever_conflitos, CAMPOS_PROJETO, TIPOS_DOCUMENTO)
+from configuracao import BACKEND, SERVIDOR_HOST, SERVIDOR_PORTA
+from documentos import ArmazemDocumentos, TAMANHO_BLOCO
+from instrumentacao import medir
+from modelo import para_json
+from repositorio import Repositorio
+
+# Servidor local: um único processo é o dono dos projetos (um Repositorio
+# sobre o backend local, com os índices e a gravação em lote de sempre) e
+# vários clientes (a interface e os comandos com PROJETOS_BACKEND=remoto, ver
+# cliente.py) leem e alteram por HTTP/JSON, sem que cada um carregue e
+# confira os arquivos. HTTP/1.1 com conexões mantidas abertas, sobre
+# asyncio.start_server; as requisições são atendidas uma por vez na thread
+# do laço, então cada lote de alterações é conferido e aplicado inteiro.
+#
+# Cada lote aplicado incrementa a versão do servidor, e cada projeto guarda a
+# versão em que mudou pela última vez (os removidos também, para avisar os
+# clientes). Os clientes pedem só o que mudou desde a versão que conhecem e
+# esperam a próxima mudança com GET /eventos (long polling). A versão é da
+# instância do servidor: depois de reiniciado os clientes releem tudo.
+#
+# Rotas:
+#   GET    /estado                          instância, versão, contagens e falha de gravação
+#   GET    /projetos?inicio=&limite=&completo=0|1   listagem paginada
+#   POST   /projetos                        insere um projeto
+#   GET    /projetos/<id>                   um projeto e sua versão
+#   PATCH  /projetos/<id>                   {"campos", "esperado"?}
+#   DELETE /projetos/<id>
+#   POST   /projetos/<id>/despesas          {"despesas", "documentos"?}
+#   POST   /lote                            {"registros", "instancia"?} (ver armazenamento.aplicar_operacao)
+#   POST   /alteracoes                      {"instancia", "desde", "ids"}: projetos alterados e removidos
+#   GET    /eventos?instancia=&versao=&espera=   responde quando a versão mudar
+#   GET    /busca?q=&limite=                busca textual
+#   GET    /resumo                          totais e agrupamentos financeiros
+#   GET    /documentos/<sha256>             conteúdo do blob (HEAD: só se existe)
+#   PUT    /documentos/<sha256>             envia um blob (Content-Length obrigatório)
+#   DELETE /documentos/<sha256>             apaga o blob se nenhum projeto o referencia
+
+log = logging.getLogger("projetos.servidor")
+
+# Tamanho máximo de uma linha de cabeçalho e de um corpo JSON
+LIMITE_CABECALHO = 64 * 1024
+LIMITE_CORPO_JSON = 256 * 1024 * 1024
+
+# Projetos por página da listagem
+PAGINA_PADRAO = 500
+PAGINA_MAXIMA = 5000
+
+# Espera máxima (segundos) de GET /eventos
+ESPERA_MAXIMA_EVENTOS = 60
+
+# Intervalo (segundos) em que o servidor confere se os arquivos foram
+# alterados por fora (outra instância local ou um comando sem o servidor)
+INTERVALO_SINCRONIZACAO = 1.0
+
+# Acima disso a existência dos projetos alterados é conferida num conjunto
+# montado de uma vez em vez de projeto a projeto
+LIMITE_CONSULTA_INDIVIDUAL = 1000
+
+OPERACOES = ("inserir_projeto", "gravar_projetos", "atualizar_projeto", "remover_projeto", "adicionar_despesa",
+             "adicionar_despesas", "adicionar_documento", "remover_documento")
+
+PADRAO_DIGEST = "([0-9a-f]{64})"
+
+
+class ErroHTTP(Exception):
+    def __init__(self, status, mensagem, dados=None):
+        super().__init__(mensagem)
+        self.status = status
+        self.dados = dados or {}
+
+
+# Conteúdo de um blob enviado em blocos na resposta
+class _Blob:
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.tamanho = os.path.getsize(caminho)
+
+
+class Requisicao:
+    def __init__(self, metodo, alvo, versao, cabecalhos, leitor):
+        url = urllib.parse.urlsplit(alvo)
+        self.metodo = metodo
+        self.caminho = urllib.parse.unquote(url.path)
+        self.consulta = {chave: valores[-1] for chave, valores in urllib.parse.parse_qs(url.query).items()}
+        self.versao = versao
+        self.cabecalhos = cabecalhos
+        self.leitor = leitor
+        if "chunked" in cabecalhos.get("transfer-encoding", ""):
+            raise ErroHTTP(411, "envie o corpo com Content-Length")
+        try:
+            self.restante = int(cabecalhos.get("content-length", 0))
+        except ValueError:
+            raise ErroHTTP(400, "Content-Length inválido") from None
+
+    def manter_conexao(self):
+        conexao = self.cabecalhos.get("connection", "").lower()
+        if self.versao == "HTTP/1.0":
+            return conexao == "keep-alive"
+        return conexao != "close"
+
+    # Parte do corpo; o que não for lido pelo tratador fecha a conexão
+    async def ler(self, n):
+        bloco = await self.leitor.read(min(n, self.restante))
+        if not bloco:
+            raise ConnectionError("conexão encerrada no meio do corpo da requisição")
+        self.restante -= len(bloco)
+        return bloco
+
+    async def json(self):
+        if self.restante > LIMITE_CORPO_JSON:
+            raise ErroHTTP(413, "corpo grande demais")
+        corpo = await self.leitor.readexactly(self.restante)
+        self.restante = 0
+        try:
+            return json.loads(corpo) if corpo else {}
+        except ValueError:
+            raise ErroHTTP(400, "JSON inválido") from None
+
+    # Corpo JSON que deve ser um objeto ({...})
+    async def objeto(self):
+        dados = await self.json()
+        if not isinstance(dados, dict):
+            raise ErroHTTP(400, "o corpo deve ser um objeto JSON")
+        return dados
+
+    def inteiro(self, nome, padrao, minimo=None, maximo=None):
+        try:
+            valor = int(self.consulta.get(nome, padrao))
+        except ValueError:
+            raise ErroHTTP(400, f"{nome} deve ser um número inteiro") from None
+        if minimo is not None:
+            valor = max(minimo, valor)
+        if maximo is not None:
+            valor = min(maximo, valor)
+        return valor
+
+
+# Conferência dos registros recebidos contra o esquema dos projetos. O que
+# não confere é recusado com 400 antes de chegar ao repositório (e de qualquer
+# registro do lote ser aplicado). Projetos e despesas inteiros podem trazer
+# campos além do esquema (o modelo os guarda como extras); atualizar_projeto
+# só altera os campos de CAMPOS_PROJETO.
+NUMERO = (int, float)
+ESQUEMA_PROJETO = {"nome": str, "responsavel": str, "valor_financiamento": NUMERO, "data_cadastro": str}
+ESQUEMA_DESPESA = {"nome": str, "descricao": str, "valor": NUMERO, "nfe": str}
+DESCRICAO_TIPOS = {dict: "um objeto", list: "uma lista", str: "um texto", NUMERO: "um número",
+                   int: "um número inteiro"}
+
+
+def _conferir_tipo(valor, tipo, onde):
+    if not isinstance(valor, tipo) or isinstance(valor, bool):
+        raise ErroHTTP(400, f"{onde} deve ser {DESCRICAO_TIPOS[tipo]}")
+
+
+def _conferir_campos(dados, esquema, onde, obrigatorios=True):
+    _conferir_tipo(dados, dict, onde)
+    for campo, tipo in esquema.items():
+        if campo in dados:
+            _conferir_tipo(dados[campo], tipo, f"{onde}.{campo}")
+        elif obrigatorios:
+            raise ErroHTTP(400, f"{onde} sem o campo {campo}")
+
+
+def _conferir_referencia(referencia, onde):
+    if isinstance(referencia, str):
+        return
+    _conferir_tipo(referencia, dict, onde)
+    _conferir_campos(referencia, {"nome": str, "sha256": str, "tamanho": int}, onde)
+    if not re.fullmatch(PADRAO_DIGEST, referencia["sha256"]):
+        raise ErroHTTP(400, f"{onde}.sha256 inválido")
+
+
+def _conferir_documentos(documentos, onde):
+    _conferir_tipo(documentos, dict, onde)
+    for tipo, referencias in documentos.items():
+        if tipo not in TIPOS_DOCUMENTO:
+            raise ErroHTTP(400, f"{onde}: tipo de documento desconhecido: {tipo}")
+        _conferir_tipo(referencias, list, f"{onde}.{tipo}")
+        for i, referencia in enumerate(referencias):
+            _conferir_referencia(referencia, f"{onde}.{tipo}[{i}]")
+
+
+def _conferir_despesa(despesa, onde):
+    _conferir_campos(despesa, ESQUEMA_DESPESA, onde)
+    if "id" in despesa:
+        _conferir_tipo(despesa["id"], str, f"{onde}.id")
+
+
+def _conferir_despesas(despesas, onde):
+    _conferir_tipo(despesas, list, onde)
+    for i, despesa in enumerate(despesas):
+        _conferir_despesa(despesa, f"{onde}[{i}]")
+
+
+def _conferir_projeto(projeto, onde):
+    _conferir_campos(projeto, ESQUEMA_PROJETO, onde)
+    if "id" in projeto:
+        _conferir_tipo(projeto["id"], str, f"{onde}.id")
+    if "despesas" not in projeto:
+        raise ErroHTTP(400, f"{onde} sem o campo despesas")
+    _conferir_despesas(projeto["despesas"], f"{onde}.despesas")
+    _conferir_documentos({tipo: projeto[tipo] for tipo in TIPOS_DOCUMENTO if tipo in projeto}, onde)
+
+
+def _conferir_registro(registro):
+    _conferir_tipo(registro, dict, "registro")
+    op = registro.get("op")
+    if op not in OPERACOES:
+        raise ErroHTTP(400, f"operação desconhecida: {op}")
+    if op not in ("inserir_projeto", "gravar_projetos"):
+        if "id" not in registro:
+            raise ErroHTTP(400, f"{op} sem id do projeto")
+        _conferir_tipo(registro["id"], str, f"{op}.id")
+    if op == "inserir_projeto":
+        _conferir_projeto(registro.get("projeto"), "projeto")
+    elif op == "gravar_projetos":
+        _conferir_tipo(registro.get("projetos"), list, "projetos")
+        for i, projeto in enumerate(registro["projetos"]):
+            _conferir_projeto(projeto, f"projetos[{i}]")
+        _conferir_tipo(registro.get("versoes", {}), dict, "versoes")
+    elif op == "atualizar_projeto":
+        campos = registro.get("campos")
+        _conferir_campos(campos, ESQUEMA_PROJETO, "campos", obrigatorios=False)
+        desconhecidos = set(campos) - set(CAMPOS_PROJETO)
+        if desconhecidos:
+            raise ErroHTTP(400, f"campos desconhecidos: {', '.join(sorted(desconhecidos))}")
+        _conferir_tipo(registro.get("esperado", {}), dict, "esperado")
+    elif op == "adicionar_despesa":
+        _conferir_despesa(registro.get("despesa"), "despesa")
+    elif op == "adicionar_despesas":
+        _conferir_despesas(registro.get("despesas"), "despesas")
+        _conferir_documentos(registro.get("documentos", {}), "documentos")
+    elif op in ("adicionar_documento", "remover_documento"):
+        if registro.get("tipo") not in TIPOS_DOCUMENTO:
+            raise ErroHTTP(400, f"tipo de documento desconhecido: {registro.get('tipo')}")
+        _conferir_referencia(registro.get("arquivo"), "arquivo")
+
+
+# O projeto atual no esquema JSON, para a conferência dos registros
+# (armazenamento.verificar_registro só precisa de .get(campo))
+class _EstadoJSON:
+    def __init__(self, projeto):
+        self.projeto = projeto
+
+    def get(self, campo, padrao=None):
+        return para_json(self.projeto.get(campo, padrao))
+
+
+def _resumo_projeto(projeto):
+    return {"id": projeto["id"], "nome": projeto["nome"], "responsavel": projeto["responsavel"],
+            "valor_financiamento": projeto["valor_financiamento"]}
+
+
+class ServidorAPI:
+    ROTAS = (
+        ("GET", "/estado", "estado_servidor"),
+        ("GET", "/projetos", "listar"),
+        ("POST", "/projetos", "inserir"),
+        ("GET", "/projetos/([^/]+)", "obter"),
+        ("PATCH", "/projetos/([^/]+)", "atualizar"),
+        ("DELETE", "/projetos/([^/]+)", "remover"),
+        ("POST", "/projetos/([^/]+)/despesas", "adicionar_despesas"),
+        ("POST", "/lote", "lote"),
+        ("POST", "/alteracoes", "alteracoes"),
+        ("GET", "/eventos", "eventos"),
+        ("GET", "/busca", "busca"),
+        ("GET", "/resumo", "resumo"),
+        ("GET", f"/documentos/{PADRAO_DIGEST}", "baixar_documento"),
+        ("PUT", f"/documentos/{PADRAO_DIGEST}", "enviar_documento"),
+        ("DELETE", f"/documentos/{PADRAO_DIGEST}", "apagar_documento"),
+    )
+
+    def __init__(self, repositorio, armazem):
+        self.repositorio = repositorio
+        self.armazem = armazem
+        self.instancia = novo_id()
+        self.versao = 0
+        self.versoes = dict.fromkeys((p["id"] for p in repositorio.projetos()), 0)
+        # Projetos removidos: {id: versão da remoção}
+        self.removidos = {}
+        # Projetos alterados desde o último lote confirmado
+        self._alterados = set()
+        self._mudanca = asyncio.Event()
+        self._rotas = [(metodo, re.compile(padrao), nome) for metodo, padrao, nome in self.ROTAS]
+        self._conexoes = set()
+        self._sincronizacao = None
+        repositorio.observar(self._ao_alterar)
+
+    def _ao_alterar(self, evento, projeto_id):
+        if evento == "recarregado":
+            self._alterados.update(p["id"] for p in self.repositorio.projetos())
+            self._alterados.update(self.versoes)
+        else:
+            self._alterados.add(projeto_id)
+
+    # Fecha o lote: os projetos alterados (pelas requisições ou relidos do
+    # disco) ganham a nova versão e quem espera em /eventos é acordado
+    def _confirmar(self):
+        if not self._alterados:
+            return
+        self.versao += 1
+        if len(self._alterados) > LIMITE_CONSULTA_INDIVIDUAL:
+            existe = {p["id"] for p in self.repositorio.projetos()}.__contains__
+        else:
+            def existe(projeto_id):
+                return self.repositorio.obter_projeto(projeto_id) is not None
+        for projeto_id in self._alterados:
+            if existe(projeto_id):
+                self.versoes[projeto_id] = self.versao
+                self.removidos.pop(projeto_id, None)
+            else:
+                self.versoes.pop(projeto_id, None)
+                self.removidos[projeto_id] = self.versao
+        self._alterados.clear()
+        self._mudanca.set()
+        self._mudanca = asyncio.Event()
+
+    def _estado(self, projeto_id):
+        projeto = self.repositorio.obter_projeto(projeto_id)
+        return (None if projeto is None else _EstadoJSON(projeto)), self.versoes.get(projeto_id)
+
+    # Confere (contra as versões do início do lote) e aplica os registros
+    # pelos métodos do repositório. Mesmo formato de Armazenamento.aplicar_lote.
+    def aplicar_lote(self, registros, instancia=None):
+        _conferir_tipo(registros, list, "registros")
+        for registro in registros:
+            _conferir_registro(registro)
+        versao_anterior = self.versao if instancia in (None, self.instancia) else -1
+        conflitos = []
+        try:
+            for registro in registros:
+                registro, encontrados = verificar_registro(registro, self._estado)
+                conflitos.extend(encontrados)
+                if registro is not None:
+                    self._executar(registro)
+        finally:
+            self._confirmar()
+        return {"instancia": self.instancia, "versao_anterior": versao_anterior, "versao": self.versao,
+                "conflitos": conflitos}
+
+    def _executar(self, registro):
+        op = registro["op"]
+        repositorio = self.repositorio
+        if op == "inserir_projeto":
+            repositorio.inserir_projeto(registro["projeto"])
+        elif op == "gravar_projetos":
+            repositorio.gravar_projetos(registro["projetos"])
+        elif op == "atualizar_projeto":
+            repositorio.atualizar_projeto(registro["id"], registro["campos"])
+        elif op == "remover_projeto":
+            repositorio.remover_projeto(registro["id"])
+        elif op == "adicionar_despesa":
+            repositorio.adicionar_despesa(registro["id"], registro["despesa"])
+        elif op == "adicionar_despesas":
+            repositorio.adicionar_despesas(registro["id"], registro["despesas"], registro.get("documentos"))
+        elif op == "adicionar_documento":
+            repositorio.adicionar_documento(registro["id"], registro["tipo"], registro["arquivo"])
+        elif op == "remover_documento":
+            repositorio.remover_documento(registro["id"], registro["tipo"], registro["arquivo"])
+
+    # As rotas de um projeto só são aplicadas sem conflito (409 com os conflitos)
+    def _aplicar_um(self, registro):
+        resultado = self.aplicar_lote([registro])
+        if resultado["conflitos"]:
+            raise ErroHTTP(409, descrever_conflitos(resultado["conflitos"]),
+                           {"conflitos": resultado["conflitos"]})
+        return resultado
+
+    # Rotas
+
+    async def _estado_servidor(self, requisicao):
+        return 200, {"instancia": self.instancia, "versao": self.versao, "projetos": len(self.versoes),
+                     "backend": type(self.repositorio.armazenamento).__name__,
+                     "pendentes": self.repositorio.pendentes(),
+                     "erro_gravacao": None if self.repositorio.erro_gravacao is None
+                     else str(self.repositorio.erro_gravacao)}
+
+    async def _listar(self, requisicao):
+        inicio = requisicao.inteiro("inicio", 0, minimo=0)
+        limite = requisicao.inteiro("limite", PAGINA_PADRAO, minimo=1, maximo=PAGINA_MAXIMA)
+        completo = requisicao.consulta.get("completo", "1") != "0"
+        projetos = self.repositorio.projetos()
+        pagina = projetos[inicio:inicio + limite]
+        return 200, {
+            "instancia": self.instancia,
+            "versao": self.versao,
+            "total": len(projetos),
+            "inicio": inicio,
+            "projetos": [para_json(p) if completo else _resumo_projeto(p) for p in pagina],
+            "versoes": {p["id"]: self.versoes.get(p["id"], self.versao) for p in pagina},
+        }
+
+    async def _inserir(self, requisicao):
+        projeto = await requisicao.objeto()
+        _conferir_projeto(projeto, "projeto")
+        garantir_ids_projeto(projeto)
+        resultado = self._aplicar_um({"op": "inserir_projeto", "projeto": projeto})
+        return 201, {"id": projeto["id"], "versao": resultado["versao"]}
+
+    async def _obter(self, requisicao, projeto_id):
+        projeto = self.repositorio.obter_projeto(projeto_id)
+        if projeto is None:
+            raise ErroHTTP(404, f"projeto não encontrado: {projeto_id}")
+        return 200, {"projeto": para_json(projeto), "versao": self.versoes.get(projeto_id, self.versao)}
+
+    async def _atualizar(self, requisicao, projeto_id):
+        dados = await requisicao.objeto()
+        registro = {"op": "atualizar_projeto", "id": projeto_id, "campos": dados.get("campos", {})}
+        if "esperado" in dados:
+            registro["esperado"] = dados["esperado"]
+        return 200, self._aplicar_um(registro)
+
+    async def _remover(self, requisicao, projeto_id):
+        if self.repositorio.obter_projeto(projeto_id) is None:
+            raise ErroHTTP(404, f"projeto não encontrado: {projeto_id}")
+        return 200, self._aplicar_um({"op": "remover_projeto", "id": projeto_id})
+
+    async def _adicionar_despesas(self, requisicao, projeto_id):
+        dados = await requisicao.objeto()
+        registro = {"op": "adicionar_despesas", "id": projeto_id, "despesas": dados.get("despesas", [])}
+        if dados.get("documentos"):
+            registro["documentos"] = dados["documentos"]
+        _conferir_registro(registro)
+        for despesa in registro["despesas"]:
+            despesa.setdefault("id", novo_id())
+        return 200, self._aplicar_um(registro)
+
+    async def _lote(self, requisicao):
+        dados = await requisicao.objeto()
+        return 200, self.aplicar_lote(dados.get("registros", []), dados.get("instancia"))
+
+    # Projetos alterados depois da versão `desde` mais os pedidos em `ids`
+    # (que o cliente não sabe em que estado ficaram). De outra instância do
+    # servidor as versões não se comparam: "completo" pede a releitura.
+    async def _alteracoes(self, requisicao):
+        dados = await requisicao.objeto()
+        if dados.get("instancia") != self.instancia:
+            return 200, {"completo": True, "instancia": self.instancia, "versao": self.versao}
+        desde = dados.get("desde", 0)
+        _conferir_tipo(desde, int, "desde")
+        _conferir_tipo(dados.get("ids", []), list, "ids")
+        for projeto_id in dados.get("ids", ()):
+            _conferir_tipo(projeto_id, str, "ids[]")
+        pedidos = set(dados.get("ids", ()))
+        projetos = []
+        versoes = {}
+        for projeto_id, versao in self.versoes.items():
+            if versao > desde or projeto_id in pedidos:
+                projetos.append(para_json(self.repositorio.obter_projeto(projeto_id)))
+                versoes[projeto_id] = versao
+        removidos = {projeto_id for projeto_id, versao in self.removidos.items() if versao > desde}
+        removidos.update(projeto_id for projeto_id in pedidos if projeto_id not in self.versoes)
+        return 200, {"completo": False, "instancia": self.instancia, "versao": self.versao, "versoes": versoes,
+                     "projetos": projetos, "removidos": sorted(removidos)}
+
+    async def _eventos(self, requisicao):
+        versao = requisicao.inteiro("versao", -1)
+        try:
+            espera = min(float(requisicao.consulta.get("espera", 0)), ESPERA_MAXIMA_EVENTOS)
+        except ValueError:
+            raise ErroHTTP(400, "espera deve ser um número") from None
+        if requisicao.consulta.get("instancia") == self.instancia and versao == self.versao and espera > 0:
+            mudanca = self._mudanca
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(mudanca.wait(), espera)
+        return 200, {"instancia": self.instancia, "versao": self.versao}
+
+    async def _busca(self, requisicao):
+        from busca import trechos
+        consulta = requisicao.consulta.get("q", "")
+        limite = requisicao.inteiro("limite", 20, minimo=1)
+        return 200, {"resultados": [
+            dict(_resumo_projeto(projeto), pontuacao=pontuacao, trechos=trechos(projeto, consulta))
+            for projeto, pontuacao in self.repositorio.buscar(consulta, limite)
+        ]}
+
+    async def _resumo(self, requisicao):
+        financeiro = self.repositorio.financeiro()
+        return 200, {
+            "totais": financeiro.totais(),
+            "por_responsavel": financeiro.por_responsavel(),
+            "por_mes": financeiro.por_mes(),
+            "acima_do_orcamento": financeiro.acima_do_orcamento(),
+        }
+
+    async def _baixar_documento(self, requisicao, digest):
+        if not self.armazem.existe(digest):
+            raise ErroHTTP(404, f"documento não encontrado: {digest}")
+        return 200, _Blob(self.armazem.caminho(digest))
+
+    # O corpo vai para um temporário do armazém, com o digest conferido
+    # enquanto chega; só um conteúdo que confere entra no armazém
+    async def _enviar_documento(self, requisicao, digest):
+        if "content-length" not in requisicao.cabecalhos:
+            raise ErroHTTP(411, "envie o corpo com Content-Length")
+        if self.armazem.existe(digest):
+            return 200, {"sha256": digest, "tamanho": os.path.getsize(self.armazem.caminho(digest))}
+        fd, temporario = tempfile.mkstemp(dir=self.armazem.dir_temporario)
+        try:
+            h = hashlib.sha256()
+            with os.fdopen(fd, "wb") as destino:
+                while requisicao.restante:
+                    bloco = await requisicao.ler(TAMANHO_BLOCO)
+                    h.update(bloco)
+                    destino.write(bloco)
+            if h.hexdigest() != digest:
+                raise ErroHTTP(400, f"conteúdo com sha256 {h.hexdigest()}, esperado {digest}")
+            _, tamanho = await asyncio.get_running_loop().run_in_executor(None, self.armazem.ingerir,
+                                                                          temporario, True)
+        finally:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+        return 201, {"sha256": digest, "tamanho": tamanho}
+
+    async def _apagar_documento(self, requisicao, digest):
+        referencias = self.repositorio.referencias_documento(digest)
+        if referencias:
+            raise ErroHTTP(409, f"documento ainda referenciado por {referencias} anexo(s)",
+                           {"referencias": referencias})
+        self.armazem.remover(digest)
+        return 204, None
+
+    # HTTP
+
+    async def _despachar(self, requisicao):
+        permitidos = []
+        for metodo, padrao, nome in self._rotas:
+            encontrado = padrao.fullmatch(requisicao.caminho)
+            if encontrado is None:
+                continue
+            if requisicao.metodo != metodo and not (requisicao.metodo == "HEAD" and metodo == "GET"):
+                permitidos.append(metodo)
+                continue
+            tratador = getattr(self, f"_{nome}")
+            with medir("servidor.requisicao", rota=nome) as medicao:
+                try:
+                    status, dados = await tratador(requisicao, *encontrado.groups())
+                except ErroHTTP as erro:
+                    status, dados = erro.status, dict(erro.dados, erro=str(erro))
+                except ConnectionError:
+                    raise
+                except Exception as erro:
+                    log.exception("Erro em %s %s", requisicao.metodo, requisicao.caminho)
+                    status, dados = 500, {"erro": f"{type(erro).__name__}: {erro}"}
+                medicao.definir(status=status)
+            return status, dados
+        if permitidos:
+            return 405, {"erro": f"use {', '.join(permitidos)} em {requisicao.caminho}"}
+        return 404, {"erro": f"rota desconhecida: {requisicao.caminho}"}
+
+    async def _ler_requisicao(self, leitor):
+        try:
+            linha = await leitor.readline()
+            if not linha:
+                return None
+            partes = linha.decode("latin-1").split()
+            if len(partes) != 3 or not partes[2].startswith("HTTP/"):
+                raise ErroHTTP(400, "linha de requisição inválida")
+            cabecalhos = {}
+            while True:
+                linha = await leitor.readline()
+                if linha in (b"\r\n", b"\n", b""):
+                    break
+                nome, _, valor = linha.decode("latin-1").partition(":")
+                cabecalhos[nome.strip().lower()] = valor.strip()
+        except ValueError:
+            # Linha maior que LIMITE_CABECALHO
+            raise ErroHTTP(431, "cabeçalho grande demais") from None
+        return Requisicao(*partes, cabecalhos, leitor)
+
+    async def _responder(self, escritor, status, dados, manter, cabeca=False):
+        corpo = b""
+        tipo = None
+        if isinstance(dados, _Blob):
+            tamanho = dados.tamanho
+            tipo = "application/octet-stream"
+        elif dados is not None:
+            corpo = json.dumps(dados, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            tamanho = len(corpo)
+            tipo = "application/json; charset=utf-8"
+        else:
+            tamanho = 0
+        linhas = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}", f"Content-Length: {tamanho}"]
+        if tipo:
+            linhas.append(f"Content-Type: {tipo}")
+        if not manter:
+            linhas.append("Connection: close")
+        escritor.write(("\r\n".join(linhas) + "\r\n\r\n").encode("latin-1"))
+        if cabeca:
+            pass
+        elif isinstance(dados, _Blob):
+            laco = asyncio.get_running_loop()
+            with open(dados.caminho, "rb") as f:
+                while bloco := await laco.run_in_executor(None, f.read, TAMANHO_BLOCO):
+                    escritor.write(bloco)
+                    await escritor.drain()
+        else:
+            escritor.write(corpo)
+        await escritor.drain()
+
+    async def _atender(self, leitor, escritor):
+        self._conexoes.add(asyncio.current_task())
+        try:
+            while True:
+                try:
+                    requisicao = await self._ler_requisicao(leitor)
+                except ErroHTTP as erro:
+                    await self._responder(escritor, erro.status, {"erro": str(erro)}, False)
+                    break
+                if requisicao is None:
+                    break
+                manter = requisicao.manter_conexao()
+                self._confirmar()
+                status, dados = await self._despachar(requisicao)
+                # Corpo não lido (ex.: recusado antes): a conexão não pode continuar
+                if requisicao.restante:
+                    manter = False
+                await self._responder(escritor, status, dados, manter, requisicao.metodo == "HEAD")
+                if not manter:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            # Servidor encerrando (ver encerrar())
+            pass
+        finally:
+            self._conexoes.discard(asyncio.current_task())
+            escritor.close()
+            with contextlib.suppress(Exception):
+                await escritor.wait_closed()
+
+    # Alterações gravadas por fora do servidor chegam como eventos do repositório
+    async def _sincronizar_periodicamente(self):
+        while True:
+            await asyncio.sleep(INTERVALO_SINCRONIZACAO)
+            try:
+                self.repositorio.sincronizar()
+                conflitos = self.repositorio.tomar_conflitos()
+                if conflitos:
+                    log.warning(descrever_conflitos(conflitos))
+                erro = self.repositorio.tomar_erro_gravacao()
+                if erro is not None:
+                    log.error("Alterações não gravadas (nova tentativa em seguida): %s", erro)
+            except Exception:
+                log.exception("Erro ao sincronizar com os arquivos")
+            self._confirmar()
+
+    async def servir(self, host=SERVIDOR_HOST, porta=SERVIDOR_PORTA):
+        servidor = await asyncio.start_server(self._atender, host, porta, limit=LIMITE_CABECALHO)
+        self._sincronizacao = asyncio.create_task(self._sincronizar_periodicamente())
+        return servidor
+
+    # Encerra as conexões abertas (inclusive as que esperam em /eventos)
+    async def encerrar(self):
+        if self._sincronizacao is not None:
+            self._sincronizacao.cancel()
+        tarefas = list(self._conexoes)
+        for tarefa in tarefas:
+            tarefa.cancel()
+        await asyncio.gather(*tarefas, return_exceptions=True)
+
+
+# Executa o servidor até SIGINT/SIGTERM, gravando a fila do repositório ao
+# sair. ao_iniciar recebe os endereços em que ele está ouvindo.
+def executar_servidor(host=SERVIDOR_HOST, porta=SERVIDOR_PORTA, backend=None, ao_iniciar=None):
+    backend = backend or (BACKEND if BACKEND != "remoto" else "json")
+    if backend == "remoto":
+        raise ValueError("O servidor usa os arquivos locais: escolha o backend json, diario ou sqlite")
+    repositorio = Repositorio(criar_armazenamento(backend))
+    api = ServidorAPI(repositorio, ArmazemDocumentos())
+
+    async def principal():
+        servidor = await api.servir(host, porta)
+        parar = asyncio.Event()
+        laco = asyncio.get_running_loop()
+        for sinal in (signal.SIGINT, signal.SIGTERM):
+            with contextlib.suppress(NotImplementedError):  # Windows: Ctrl+C gera KeyboardInterrupt
+                laco.add_signal_handler(sinal, parar.set)
+        if ao_iniciar is not None:
+            ao_iniciar([s.getsockname()[:2] for s in servidor.sockets])
+        await parar.wait()
+        servidor.close()
+        await api.encerrar()
+        await servidor.wait_closed()
+
+    try:
+        asyncio.run(principal())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        repositorio.fechar()
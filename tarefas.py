@@ -0,0 +1,150 @@
+import os
+import threading
+import time
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+from PyQt6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QProgressBar, QPushButton
+
+# Intervalo mínimo entre dois sinais de progresso da mesma tarefa, para não
+# inundar a fila de eventos da interface com um sinal por bloco copiado
+INTERVALO_PROGRESSO = 0.05
+
+
+class TarefaCancelada(Exception):
+    pass
+
+
+# Os sinais ficam num QObject criado na thread da interface: emitidos na
+# thread de trabalho, chegam aos slots enfileirados na thread da interface
+class SinaisTarefa(QObject):
+    progresso = pyqtSignal(object, object)  # bytes processados, total (podem passar de 2^31)
+    concluida = pyqtSignal(object)
+    falhou = pyqtSignal(str)
+    cancelada = pyqtSignal()
+    finalizada = pyqtSignal()
+
+
+# Uma operação demorada (cópia, exportação, importação) executada no pool.
+# A função recebe a própria tarefa como primeiro argumento, informa o total
+# com definir_total() e chama avancar(n) a cada bloco; avancar() lança
+# TarefaCancelada depois de cancelar(), o que interrompe a operação.
+class Tarefa(QRunnable):
+    def __init__(self, descricao, funcao, *args):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.descricao = descricao
+        self.funcao = funcao
+        self.args = args
+        self.sinais = SinaisTarefa()
+        self.feito = 0
+        self.total = 0
+        self._cancelar = threading.Event()
+        self._trava = threading.Lock()
+        self._ultimo_sinal = 0.0
+
+    def cancelar(self):
+        self._cancelar.set()
+
+    def foi_cancelada(self):
+        return self._cancelar.is_set()
+
+    def definir_total(self, total):
+        self.total = total
+        self.sinais.progresso.emit(self.feito, self.total)
+
+    # Pode ser chamado de várias threads ao mesmo tempo (ex.: compressão paralela)
+    def avancar(self, n):
+        if self._cancelar.is_set():
+            raise TarefaCancelada()
+        with self._trava:
+            self.feito += n
+            agora = time.monotonic()
+            if agora - self._ultimo_sinal < INTERVALO_PROGRESSO and not (self.total and self.feito >= self.total):
+                return
+            self._ultimo_sinal = agora
+            feito = self.feito
+        self.sinais.progresso.emit(feito, self.total)
+
+    def run(self):
+        try:
+            if self._cancelar.is_set():
+                raise TarefaCancelada()
+            resultado = self.funcao(self, *self.args)
+        except TarefaCancelada:
+            self.sinais.cancelada.emit()
+        except Exception as erro:
+            self.sinais.falhou.emit(str(erro))
+        else:
+            self.sinais.concluida.emit(resultado)
+        finally:
+            self.sinais.finalizada.emit()
+
+
+# Fila de tarefas sobre um QThreadPool próprio. Várias tarefas podem ser
+# enfileiradas de uma vez; as que excedem o número de threads aguardam.
+# Os resultados chegam na thread da interface, onde o repositório é alterado.
+class GerenciadorTarefas(QObject):
+    tarefa_adicionada = pyqtSignal(object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(min(4, os.cpu_count() or 1))
+        self.tarefas = []
+
+    def executar(self, descricao, funcao, *args, ao_concluir=None, ao_falhar=None):
+        tarefa = Tarefa(descricao, funcao, *args)
+        if ao_concluir is not None:
+            tarefa.sinais.concluida.connect(ao_concluir)
+        if ao_falhar is not None:
+            tarefa.sinais.falhou.connect(ao_falhar)
+        # Mantém a referência até o fim: o pool não é dono da tarefa
+        self.tarefas.append(tarefa)
+        tarefa.sinais.finalizada.connect(lambda: self.tarefas.remove(tarefa))
+        self.tarefa_adicionada.emit(tarefa)
+        self.pool.start(tarefa)
+        return tarefa
+
+    def cancelar_todas(self):
+        for tarefa in list(self.tarefas):
+            tarefa.cancelar()
+
+    def aguardar(self, milissegundos=-1):
+        return self.pool.waitForDone(milissegundos)
+
+
+# Lista as tarefas em andamento, com barra de progresso e botão de cancelar
+class PainelTarefas(QWidget):
+    def __init__(self, gerenciador, parent=None):
+        super().__init__(parent)
+        self.layout_tarefas = QVBoxLayout(self)
+        self.layout_tarefas.setContentsMargins(0, 0, 0, 0)
+        self.setVisible(False)
+        gerenciador.tarefa_adicionada.connect(self.adicionar)
+
+    def adicionar(self, tarefa):
+        linha = QWidget()
+        layout = QHBoxLayout(linha)
+        layout.setContentsMargins(0, 0, 0, 0)
+        rotulo = QLabel(tarefa.descricao)
+        # A barra trabalha em milésimos: QProgressBar só aceita int de 32 bits
+        barra = QProgressBar()
+        barra.setRange(0, 1000)
+        cancelar_button = QPushButton("Cancelar")
+        cancelar_button.clicked.connect(tarefa.cancelar)
+        layout.addWidget(rotulo)
+        layout.addWidget(barra, 1)
+        layout.addWidget(cancelar_button)
+        self.layout_tarefas.addWidget(linha)
+        self.setVisible(True)
+
+        def progresso(feito, total):
+            barra.setValue(int(feito * 1000 / total) if total else 0)
+
+        def finalizada():
+            self.layout_tarefas.removeWidget(linha)
+            linha.deleteLater()
+            self.setVisible(self.layout_tarefas.count() > 0)
+
+        tarefa.sinais.progresso.connect(progresso)
+        tarefa.sinais.finalizada.connect(finalizada)
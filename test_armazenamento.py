@@ -0,0 +1,145 @@
+import json
+
+import pytest
+
+from armazenamento import ArmazenamentoDiario, ConflitoConcorrencia, garantir_ids_projeto, novo_id
+from repositorio import Repositorio
+
+# Diário (ArmazenamentoDiario) e concorrência otimista entre instâncias. Uma
+# "queda" é simulada fechando o arquivo do diário sem passar por fechar(),
+# que compactaria o que está pendente.
+
+
+def novo_projeto(nome="Projeto"):
+    return {"nome": nome, "responsavel": "Ana", "valor_financiamento": 1000.0, "data_cadastro": "2024-01-01",
+            "despesas": [], "orcamentos": [], "nfe": [], "comprovantes": [], "arquivos_adicionais": []}
+
+
+def despesa(nome, valor=10.0):
+    return {"id": novo_id(), "nome": nome, "descricao": "", "valor": valor, "nfe": ""}
+
+
+def cair(armazenamento):
+    armazenamento._arquivo.close()
+
+
+def linhas_do_diario(armazenamento):
+    with open(armazenamento.caminho_diario, "rb") as f:
+        return f.read().splitlines(keepends=True)
+
+
+@pytest.fixture
+def caminho(tmp_path):
+    return str(tmp_path / "projetos.json")
+
+
+@pytest.fixture
+def projeto_id(caminho):
+    armazenamento = ArmazenamentoDiario(caminho)
+    projeto = novo_projeto()
+    garantir_ids_projeto(projeto)
+    armazenamento.inserir_projeto(projeto)
+    armazenamento.fechar()
+    return projeto["id"]
+
+
+def nomes_despesas(caminho, projeto_id):
+    armazenamento = ArmazenamentoDiario(caminho)
+    try:
+        return [d["nome"] for d in armazenamento.obter_projeto(projeto_id)["despesas"]]
+    finally:
+        armazenamento.fechar()
+
+
+def test_linha_final_interrompida_e_descartada(caminho, projeto_id):
+    armazenamento = ArmazenamentoDiario(caminho)
+    armazenamento.adicionar_despesa(projeto_id, despesa("a"))
+    armazenamento.adicionar_despesa(projeto_id, despesa("b"))
+    cair(armazenamento)
+    with open(armazenamento.caminho_diario, "ab") as f:
+        f.write(b'{"op": "adicionar_despesa", "id": "')
+
+    armazenamento = ArmazenamentoDiario(caminho)
+    assert [d["nome"] for d in armazenamento.obter_projeto(projeto_id)["despesas"]] == ["a", "b"]
+    # O final corrompido foi cortado: o próximo registro começa numa linha própria
+    armazenamento.adicionar_despesa(projeto_id, despesa("c"))
+    linhas = linhas_do_diario(armazenamento)
+    assert len(linhas) == 3
+    assert all(linha.endswith(b"\n") and json.loads(linha) for linha in linhas)
+    cair(armazenamento)
+
+    assert nomes_despesas(caminho, projeto_id) == ["a", "b", "c"]
+
+
+def test_queda_no_meio_da_compactacao_nao_reaplica_registros(caminho, projeto_id):
+    armazenamento = ArmazenamentoDiario(caminho)
+    armazenamento.adicionar_despesa(projeto_id, despesa("a"))
+    armazenamento.adicionar_despesa(projeto_id, despesa("b"))
+    # O snapshot novo foi gravado, mas o diário não chegou a ser esvaziado
+    armazenamento._gravar_snapshot()
+    cair(armazenamento)
+    assert len(linhas_do_diario(armazenamento)) == 2
+
+    armazenamento = ArmazenamentoDiario(caminho)
+    assert [d["nome"] for d in armazenamento.obter_projeto(projeto_id)["despesas"]] == ["a", "b"]
+    # Registros depois da queda continuam a sequência e são aplicados
+    versao = armazenamento.carregar()["versao"]
+    armazenamento.adicionar_despesa(projeto_id, despesa("c"))
+    assert json.loads(linhas_do_diario(armazenamento)[-1])["seq"] == versao + 1
+    cair(armazenamento)
+
+    assert nomes_despesas(caminho, projeto_id) == ["a", "b", "c"]
+
+
+# Duas instâncias sobre os mesmos arquivos, cada uma com seu armazenamento,
+# como dois processos. As alterações ficam na fila até salvar().
+@pytest.fixture
+def instancias(caminho, projeto_id):
+    repositorios = [Repositorio(ArmazenamentoDiario(caminho), atraso=60) for _ in range(2)]
+    for repositorio in repositorios:
+        repositorio.carregar()
+    yield repositorios
+    for repositorio in repositorios:
+        repositorio.fechar()
+
+
+def test_alteracoes_em_campos_diferentes_sao_mescladas(caminho, projeto_id, instancias):
+    a, b = instancias
+    a.atualizar_projeto(projeto_id, {"nome": "Novo nome"})
+    b.atualizar_projeto(projeto_id, {"responsavel": "Bruno"})
+    b.adicionar_despesa(projeto_id, despesa("b"))
+    a.salvar()
+    b.salvar()
+
+    relido = ArmazenamentoDiario(caminho)
+    try:
+        for projeto in (a.obter_projeto(projeto_id), b.obter_projeto(projeto_id), relido.obter_projeto(projeto_id)):
+            assert (projeto["nome"], projeto["responsavel"]) == ("Novo nome", "Bruno")
+            assert [d["nome"] for d in projeto["despesas"]] == ["b"]
+    finally:
+        relido.fechar()
+
+
+def test_alteracao_no_mesmo_campo_gera_conflito(projeto_id, instancias):
+    a, b = instancias
+    a.atualizar_projeto(projeto_id, {"nome": "Nome de A"})
+    b.atualizar_projeto(projeto_id, {"nome": "Nome de B"})
+    a.salvar()
+    with pytest.raises(ConflitoConcorrencia) as erro:
+        b.salvar()
+
+    assert erro.value.conflitos == [{"id": projeto_id, "op": "atualizar_projeto", "motivo": "alterado",
+                                     "campos": ["nome"]}]
+    assert b.obter_projeto(projeto_id)["nome"] == "Nome de A"
+
+
+def test_alteracao_em_projeto_removido_gera_conflito(projeto_id, instancias):
+    a, b = instancias
+    a.remover_projeto(projeto_id)
+    b.adicionar_despesa(projeto_id, despesa("b"))
+    a.salvar()
+    with pytest.raises(ConflitoConcorrencia) as erro:
+        b.salvar()
+
+    assert erro.value.conflitos == [{"id": projeto_id, "op": "adicionar_despesa", "motivo": "removido"}]
+    assert b.obter_projeto(projeto_id) is None